@@ -1,17 +1,40 @@
-import sqlite3
 import os
 import csv
-import io
-from flask import Flask, render_template, request, redirect, url_for, flash, g, jsonify, make_response
+from flask import (Flask, render_template, request, redirect, url_for, flash, g, jsonify, Response)
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
-import joblib
+from markupsafe import Markup, escape
 from datetime import datetime, timedelta
-import requests
-from config import DB_DIR, MODEL_DIR, AUTH_DB, FEEDBACK_DB, TRUTH_DB, MODEL_FILE, VECTORIZER_FILE
-from predict_bert import predict_news
-from transformers import DistilBertTokenizerFast, DistilBertForSequenceClassification
-import torch
+import hmac
+import json
+import logging
+import queue
+import tempfile
+import time
+from itertools import islice
+from config import (DB_DIR, MODEL_DIR, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS, BATCH_QUEUE_SIZE,
+                    BATCH_API_CHUNK_SIZE, BATCH_API_MAX_HEADLINES,
+                    PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL, PREDICTION_CACHE_DB, PREDICTION_CACHE_DB_TTL,
+                    MODEL_PRELOAD, HISTORY_PAGE_SIZE, WRITE_BEHIND_ENABLED, NEWS_PAGE_SIZE,
+                    NEWS_POLL_IN_APP, EVENTS_STREAM_MAX_SECONDS, ADMIN_TOKEN, METRICS_TOKEN)
+import metrics
+import model_bundles
+import model_registry
+import long_document
+import storage
+import exports
+from storage import get_db, init_db
+from batching import BatchingEngine
+from cascade import Cascade
+from prediction_cache import PredictionCache
+from predict_bert import predict_versioned
+from write_behind import PredictionWriter
+from news_ingest import NewsIngestor, latest_articles
+from broadcast import BroadcastHub, TooManyClients
+from logs import configure_logging
+
+configure_logging()
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-super-secret-key-change-this-in-production'
@@ -21,19 +44,11 @@ login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
 
-# News API Configuration
-NEWS_API_KEY = 'your-news-api-key'  # Replace with your actual API key
-NEWS_API_URL = 'https://newsapi.org/v2/top-headlines'
-
-# Load ML Model and Vectorizer
-try:
-    model = joblib.load(MODEL_FILE)
-    vectorizer = joblib.load(VECTORIZER_FILE)
-    print("✅ Model and vectorizer loaded successfully!")
-except FileNotFoundError:
-    print("❌ Model files not found. Please train and save the model first.")
-    model = None
-    vectorizer = None
+# Load DistilBERT through the shared model registry (see MODEL_PRELOAD in config.py)
+if MODEL_PRELOAD == 'eager':
+    model_registry.preload()
+elif MODEL_PRELOAD == 'background':
+    model_registry.preload(background=True)
 
 # User class for Flask-Login
 class User(UserMixin):
@@ -44,76 +59,36 @@ class User(UserMixin):
 @login_manager.user_loader
 def load_user(user_id):
     try:
-        conn = get_db(AUTH_DB)
+        conn = get_db()
         user = conn.execute('SELECT * FROM users WHERE id = ?', (user_id,)).fetchone()
-        conn.close()
         if user:
             return User(user['id'], user['username'])
     except Exception as e:
-        print(f"Error loading user: {e}")
+        logger.error("Error loading user: %s", e)
     return None
 
-# Database helper function
-def get_db(db_name):
-    db = sqlite3.connect(db_name)
-    db.row_factory = sqlite3.Row
-    return db
-
-# Initialize databases with enhanced error handling
-def init_db():
-    """Initialize all required databases with proper error handling"""
-    try:
-        print("Initializing databases...")
-        
-        # Auth database
-        conn = sqlite3.connect(AUTH_DB)
-        conn.execute('''CREATE TABLE IF NOT EXISTS users
-                        (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                         username TEXT UNIQUE NOT NULL,
-                         password_hash TEXT NOT NULL)''')
-        conn.commit()
-        conn.close()
-        print("✅ auth.db initialized")
-        
-        # TruthLens database for predictions
-        conn = sqlite3.connect(TRUTH_DB)
-        conn.execute('''CREATE TABLE IF NOT EXISTS predictions
-                        (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                         user_id INTEGER NOT NULL,
-                         headline TEXT NOT NULL,
-                         prediction TEXT NOT NULL,
-                         confidence REAL NOT NULL,
-                         timestamp TEXT NOT NULL)''')
-        conn.commit()
-        conn.close()
-        print("✅ truthlens.db initialized")
-        
-        # Feedback database
-        conn = sqlite3.connect(FEEDBACK_DB)
-        conn.execute('''CREATE TABLE IF NOT EXISTS feedback
-                        (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                         prediction_id INTEGER NOT NULL,
-                         user_id INTEGER NOT NULL,
-                         feedback TEXT NOT NULL,
-                         timestamp TEXT NOT NULL)''')
-        conn.commit()
-        conn.close()
-        print("✅ feedback.db initialized")
-        
-        return True
-        
-    except Exception as e:
-        print(f"❌ Database initialization error: {e}")
-        return False
-
 # Helper function for IST time
 def get_ist_time():
     return datetime.utcnow() + timedelta(hours=5, minutes=30)
 
 # Initialize databases on startup
-print("Starting TruthLens application...")
+logger.info("Starting TruthLens application")
 init_db()
 
+# /predict rows are group-committed in the background; rows a previous run
+# journaled but never committed are written back first
+prediction_writer = PredictionWriter()
+try:
+    replayed = prediction_writer.replay_journals()
+    if replayed:
+        logger.info("Replayed %d journaled predictions", replayed)
+except Exception as e:
+    logger.error("Journal replay error: %s", e)
+
+@app.teardown_request
+def release_db(exception=None):
+    storage.release_db()
+
 # Routes
 @app.route('/')
 def index():
@@ -138,13 +113,12 @@ def register():
             return render_template('register.html')
         
         try:
-            conn = get_db(AUTH_DB)
+            conn = get_db()
             
             # Check if user already exists
             existing_user = conn.execute('SELECT id FROM users WHERE username = ?', (username,)).fetchone()
             if existing_user:
                 flash('Username already exists!', 'error')
-                conn.close()
                 return render_template('register.html')
             
             # Create new user
@@ -152,13 +126,12 @@ def register():
             conn.execute('INSERT INTO users (username, password_hash) VALUES (?, ?)',
                         (username, password_hash))
             conn.commit()
-            conn.close()
             
             flash('Registration successful! Please login.', 'success')
             return redirect(url_for('login'))
             
         except Exception as e:
-            print(f"Registration error: {e}")
+            logger.error("Registration error: %s", e)
             flash('Registration failed. Please try again.', 'error')
     
     return render_template('register.html')
@@ -174,9 +147,8 @@ def login():
             return render_template('login.html')
         
         try:
-            conn = get_db(AUTH_DB)
+            conn = get_db()
             user = conn.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
-            conn.close()
             
             if user and check_password_hash(user['password_hash'], password):
                 user_obj = User(user['id'], user['username'])
@@ -187,7 +159,7 @@ def login():
                 flash('Invalid username or password!', 'error')
                 
         except Exception as e:
-            print(f"Login error: {e}")
+            logger.error("Login error: %s", e)
             flash('Login failed. Please try again.', 'error')
     
     return render_template('login.html')
@@ -199,20 +171,97 @@ def logout():
     flash('You have been logged out.', 'info')
     return redirect(url_for('index'))
 
-# Load BERT once when Flask starts (at the top of your app.py)
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-MODEL_PATH = os.path.join(BASE_DIR, 'bert_model')
-TOKENIZER_PATH = os.path.join(BASE_DIR, 'bert_tokenizer')
-
-bert_model = DistilBertForSequenceClassification.from_pretrained(MODEL_PATH)
-bert_tokenizer = DistilBertTokenizerFast.from_pretrained(TOKENIZER_PATH)
-bert_model.eval()
+# Concurrent /predict requests share forward passes through the batching engine
+batching_engine = BatchingEngine(predict_versioned,
+                                 max_batch_size=BATCH_MAX_SIZE,
+                                 max_wait_ms=BATCH_MAX_WAIT_MS,
+                                 max_queue_size=BATCH_QUEUE_SIZE)
+
+# Headlines the distilled TF-IDF student is sure of skip DistilBERT (needs `python train_cascade.py`)
+cascade = Cascade()
+
+def cache_fingerprint(model_fingerprint):
+    """Cache keys cover the model, the backend and the cascade's student, which answers under its own version."""
+    student = cascade.fingerprint()
+    return f'{model_fingerprint}+{student}' if student else model_fingerprint
+
+# Repeat headlines skip the model entirely; keys include the model, backend and student fingerprints
+prediction_cache = PredictionCache(cache_fingerprint(model_registry.resolve().fingerprint()),
+                                   max_size=PREDICTION_CACHE_SIZE,
+                                   ttl=PREDICTION_CACHE_TTL,
+                                   db_path=PREDICTION_CACHE_DB or None,
+                                   db_ttl=PREDICTION_CACHE_DB_TTL)
+
+@model_registry.on_swap
+def invalidate_prediction_cache(model, previous):
+    fingerprint = cache_fingerprint(model.fingerprint)
+    if fingerprint != prediction_cache.fingerprint:
+        prediction_cache.invalidate(fingerprint)
+        logger.info("Prediction cache switched to model %s", model.version)
+
+@cascade.on_load
+def invalidate_student_verdicts(meta):
+    # A retrained, recalibrated or removed student must not keep answering from the cache
+    model = model_registry.current_model()
+    fingerprint = cache_fingerprint(model.fingerprint if model else model_registry.resolve().fingerprint())
+    if fingerprint != prediction_cache.fingerprint:
+        prediction_cache.invalidate(fingerprint)
+        logger.info("Prediction cache switched to cascade %s", meta['version'] if meta else None)
+
+def cache_result(headline, result):
+    # A batch that started on the previous model may finish after a swap; keep its verdict out of the new cache
+    if result[2] in (model_registry.current_version(), cascade.version):
+        prediction_cache.put(headline, result)
+
+def predict_cached(headlines):
+    """predict_documents with the prediction cache and the cascade in front of it:
+    (label, confidence, model_version) per headline."""
+    cascade.refresh()
+    results = [prediction_cache.get(headline) for headline in headlines]
+    misses = [i for i, result in enumerate(results) if result is None]
+    if misses:
+        for i, result in zip(misses, cascade.predict([headlines[i] for i in misses],
+                                                     long_document.predict_documents)):
+            cache_result(headlines[i], result)
+            results[i] = result
+    return results
+
+# Live news is fetched and classified in the background; /live-news only reads the store
+news_ingestor = NewsIngestor(classify=predict_cached)
+
+@app.before_request
+def start_background_threads():
+    # Started lazily so the threads run in each gunicorn worker rather than the preloading master
+    if NEWS_POLL_IN_APP:
+        news_ingestor.ensure_started()
+    model_registry.ensure_watching()
+    metrics.ensure_exporting()
+
+# Request metrics, labelled with the URL rule rather than the path so ids in URLs do not multiply series
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    metrics.HTTP_IN_PROGRESS.inc()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.get('request_started')
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.HTTP_LATENCY.observe(time.perf_counter() - started, route=route, method=request.method)
+        metrics.HTTP_REQUESTS.inc(route=route, method=request.method, status=response.status_code)
+    return response
+
+@app.teardown_request
+def finish_request_timer(exception=None):
+    if g.pop('request_started', None) is not None:
+        metrics.HTTP_IN_PROGRESS.dec()
 
 # Now your route:
 @app.route('/predict', methods=['POST'])
 @login_required
 def predict():
-    print(f"Prediction request from user: {current_user.id}")
+    logger.debug("Prediction request", extra={'user_id': current_user.id})
 
     headline = request.form.get('headline')
     if not headline:
@@ -223,44 +272,192 @@ def predict():
         return jsonify({'error': 'Headline too short. Please enter a meaningful headline.'}), 400
 
     try:
-        # BERT Prediction
-        inputs = bert_tokenizer(headline, return_tensors="pt", truncation=True, padding=True)
-        with torch.no_grad():
-            outputs = bert_model(**inputs)
-            logits = outputs.logits
-            predicted_class = torch.argmax(logits, dim=1).item()
-            confidence = torch.softmax(logits, dim=1)[0][predicted_class].item() * 100
-
-        result = 'REAL' if predicted_class == 1 else 'FAKE'
-        print(f"Prediction: {result}, Confidence: {confidence:.2f}%")
-
-        # Save to DB
+        # BERT Prediction (served from cache, by the cascade's student, or batched with other in-flight requests)
+        cascade.refresh()
+        prediction = prediction_cache.get(headline)
+        if prediction is None:
+            prediction = cascade.split([headline])[0][0]
+            if prediction is None and long_document.needs_windows(headline):
+                # Whole articles are classified window by window rather than cut off at 512 tokens
+                prediction = tuple(long_document.classify([headline])[0][:3])
+            elif prediction is None:
+                try:
+                    prediction = batching_engine.predict(headline)
+                except queue.Full:
+                    return jsonify({'error': 'Server is busy. Please try again shortly.'}), 503
+            cache_result(headline, prediction)
+        result, confidence, model_version = prediction
+
+        logger.debug("Prediction", extra={'result': result, 'confidence': round(confidence, 2),
+                                          'model_version': model_version})
+
+        # Save to DB (queued for the background writer, or inline when write-behind is disabled)
         try:
-            conn = get_db(TRUTH_DB)
-            cursor = conn.cursor()
-            cursor.execute('''INSERT INTO predictions (user_id, headline, prediction, confidence, timestamp)
-                              VALUES (?, ?, ?, ?, ?)''',
-                           (current_user.id, headline, result, confidence, get_ist_time().isoformat()))
-            prediction_id = cursor.lastrowid
-            conn.commit()
-            conn.close()
-
-            print(f"✅ Prediction stored with ID: {prediction_id}")
+            timestamp = get_ist_time().isoformat()
+            write_started = time.perf_counter()
+            if WRITE_BEHIND_ENABLED:
+                try:
+                    prediction_id = prediction_writer.submit(current_user.id, headline, result, confidence, timestamp,
+                                                             model_version)
+                except queue.Full:
+                    return jsonify({'error': 'Server is busy. Please try again shortly.'}), 503
+                logger.debug("Prediction queued", extra={'prediction_id': prediction_id})
+            else:
+                conn = get_db()
+                cursor = conn.cursor()
+                cursor.execute('''INSERT INTO predictions (user_id, headline, prediction, confidence, timestamp,
+                                                          model_version)
+                                  VALUES (?, ?, ?, ?, ?, ?)''',
+                               (current_user.id, headline, result, confidence, timestamp, model_version))
+                prediction_id = cursor.lastrowid
+                conn.commit()
+                logger.debug("Prediction stored", extra={'prediction_id': prediction_id})
+            metrics.PREDICT_PHASE.observe(time.perf_counter() - write_started, phase='db_write')
 
             return jsonify({
                 'result': result,
                 'confidence': f"{confidence:.2f}%",
-                'prediction_id': prediction_id
+                'prediction_id': prediction_id,
+                'model_version': model_version
             })
 
         except Exception as db_error:
-            print(f"❌ DB Error: {db_error}")
+            logger.error("DB error: %s", db_error)
             return jsonify({'error': 'Database error occurred'}), 500
 
     except Exception as e:
-        print(f"❌ BERT Prediction Error: {e}")
+        logger.error("BERT prediction error: %s", e)
         return jsonify({'error': f'Prediction failed: {str(e)}'}), 500
 
+# Column names recognised as the headline column in uploaded CSV/TSV files
+HEADLINE_COLUMNS = ('headline', 'title', 'statement', 'text')
+
+def read_uploaded_headlines(path, column=None):
+    """Lazily yield headlines from a saved CSV/TSV upload without reading it into memory."""
+    with open(path, encoding='utf-8', errors='replace', newline='') as f:
+        yield from read_headline_rows(csv.reader(f, delimiter='\t' if path.endswith('.tsv') else ','), column)
+
+def read_headline_rows(reader, column=None):
+    first_row = next(reader, None)
+    if first_row is None:
+        return
+
+    header = [cell.strip().lower() for cell in first_row]
+    if column is not None and column.isdigit():
+        index = int(column)
+        has_header = False
+    elif column:
+        if column.strip().lower() not in header:
+            raise ValueError(f'Column "{column}" not found in uploaded file')
+        index = header.index(column.strip().lower())
+        has_header = True
+    else:
+        matches = [header.index(name) for name in HEADLINE_COLUMNS if name in header]
+        index = matches[0] if matches else 0
+        has_header = bool(matches)
+
+    if not has_header:
+        yield first_row[index] if index < len(first_row) else ''
+    for row in reader:
+        yield row[index] if index < len(row) else ''
+
+@app.route('/predict/batch', methods=['POST'])
+@login_required
+def predict_batch_route():
+    """Classify many headlines at once.
+
+    Accepts either JSON ({"headlines": [...]}) or a CSV/TSV upload in the "file" form
+    field (optional "column" field: header name or zero-based index). Results are
+    streamed back as newline-delimited JSON, one line per headline, followed by a
+    summary line. Each chunk is committed in its own short transaction before its
+    lines are sent, so a slow client never holds the write lock and every
+    prediction_id it receives is already stored.
+    """
+    logger.debug("Batch prediction request", extra={'user_id': current_user.id})
+
+    if request.is_json:
+        payload = request.get_json(silent=True) or {}
+        headlines = payload.get('headlines')
+        if not isinstance(headlines, list) or not headlines:
+            return jsonify({'error': 'Expected a non-empty "headlines" list'}), 400
+        if len(headlines) > BATCH_API_MAX_HEADLINES:
+            return jsonify({'error': f'Too many headlines (max {BATCH_API_MAX_HEADLINES})'}), 400
+        source = (str(headline) if headline is not None else '' for headline in headlines)
+        upload_path = None
+    elif 'file' in request.files and request.files['file'].filename:
+        upload = request.files['file']
+        if not upload.filename.lower().endswith(('.csv', '.tsv')):
+            return jsonify({'error': 'Only .csv and .tsv files are supported'}), 400
+        # Spool the upload to disk: the request's file handles are closed before the stream finishes
+        suffix = '.tsv' if upload.filename.lower().endswith('.tsv') else '.csv'
+        with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+            upload.save(tmp)
+            upload_path = tmp.name
+        source = islice(read_uploaded_headlines(upload_path, request.form.get('column')), BATCH_API_MAX_HEADLINES)
+    else:
+        return jsonify({'error': 'No headlines provided'}), 400
+
+    user_id = current_user.id
+
+    def generate():
+        total = 0
+        skipped = 0
+        # A dedicated connection: the stream outlives the request context
+        conn = storage.connect()
+        try:
+            items = enumerate(source)
+            while True:
+                chunk = []
+                for index, headline in items:
+                    headline = headline.strip()
+                    if len(headline) < 5:
+                        skipped += 1
+                        yield json.dumps({'index': index, 'error': 'Headline too short'}) + '\n'
+                        continue
+                    chunk.append((index, headline))
+                    if len(chunk) == BATCH_API_CHUNK_SIZE:
+                        break
+                if not chunk:
+                    break
+
+                predictions = predict_cached([headline for _, headline in chunk])
+                timestamp = get_ist_time().isoformat()
+                conn.execute('BEGIN IMMEDIATE')
+                conn.executemany('''INSERT INTO predictions (user_id, headline, prediction, confidence, timestamp,
+                                                            model_version)
+                                    VALUES (?, ?, ?, ?, ?, ?)''',
+                                 [(user_id, headline, result, confidence, timestamp, model_version)
+                                  for (_, headline), (result, confidence, model_version) in zip(chunk, predictions)])
+                # The write lock is held until commit, so AUTOINCREMENT ids in a chunk are consecutive
+                first_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0] - len(chunk) + 1
+                conn.commit()
+
+                for offset, ((index, headline), (result, confidence, model_version)) in \
+                        enumerate(zip(chunk, predictions)):
+                    yield json.dumps({
+                        'index': index,
+                        'headline': headline,
+                        'result': result,
+                        'confidence': f"{confidence:.2f}%",
+                        'prediction_id': first_id + offset,
+                        'model_version': model_version
+                    }) + '\n'
+                total += len(chunk)
+
+            logger.debug("Batch of %d predictions stored", total)
+            yield json.dumps({'done': True, 'count': total, 'skipped': skipped}) + '\n'
+        except Exception as e:
+            conn.rollback()
+            logger.error("Batch prediction error: %s", e)
+            yield json.dumps({'done': False, 'error': f'Batch prediction failed: {str(e)}'}) + '\n'
+        finally:
+            conn.close()
+
+    response = Response(generate(), mimetype='application/x-ndjson')
+    if upload_path:
+        response.call_on_close(lambda: os.remove(upload_path))
+    return response
+
 @app.route('/feedback', methods=['POST'])
 @login_required
 def submit_feedback():
@@ -275,16 +472,20 @@ def submit_feedback():
     
     try:
         # Verify prediction exists and belongs to current user
-        conn = get_db(TRUTH_DB)
+        conn = get_db()
         prediction = conn.execute('SELECT id FROM predictions WHERE id = ? AND user_id = ?',
                                 (prediction_id, current_user.id)).fetchone()
-        conn.close()
+        
+        if not prediction and WRITE_BEHIND_ENABLED and prediction_id.isdigit():
+            # The id may have just been issued and still be queued for the background writer
+            if prediction_writer.wait_for(int(prediction_id), conn=conn):
+                prediction = conn.execute('SELECT id FROM predictions WHERE id = ? AND user_id = ?',
+                                          (prediction_id, current_user.id)).fetchone()
         
         if not prediction:
             return jsonify({'error': 'Prediction not found'}), 404
         
         # Check if feedback already exists
-        conn = get_db(FEEDBACK_DB)
         existing_feedback = conn.execute('SELECT id FROM feedback WHERE prediction_id = ? AND user_id = ?',
                                        (prediction_id, current_user.id)).fetchone()
         
@@ -299,227 +500,269 @@ def submit_feedback():
                         (prediction_id, current_user.id, feedback, get_ist_time().isoformat()))
         
         conn.commit()
-        conn.close()
         
-        print(f"✅ Feedback submitted: {feedback} for prediction {prediction_id}")
+        logger.debug("Feedback submitted", extra={'feedback': feedback, 'prediction_id': prediction_id})
         
         return jsonify({'message': 'Feedback submitted successfully'})
         
     except Exception as e:
-        print(f"❌ Feedback error: {e}")
+        logger.error("Feedback error: %s", e)
         return jsonify({'error': f'Failed to submit feedback: {str(e)}'}), 500
 
 @app.route('/dashboard')
 @login_required
 def dashboard():
-    print(f"Dashboard accessed by user: {current_user.id}")
+    logger.debug("Dashboard accessed", extra={'user_id': current_user.id})
     
     try:
         # Initialize default values
-        total_predictions = 0
-        accuracy_stats = {'accurate': 0, 'wrong': 0}
-        accuracy_percentage = 0
+        stats = {'total_predictions': 0, 'real_predictions': 0, 'fake_predictions': 0,
+                 'accurate_feedback': 0, 'wrong_feedback': 0}
         recent_feedback = []
         
-        # Get total predictions
+        # Counters are kept up to date by triggers on predictions/feedback (see storage.py)
         try:
-            conn = get_db(TRUTH_DB)
-            result = conn.execute('SELECT COUNT(*) as count FROM predictions WHERE user_id = ?',
-                                (current_user.id,)).fetchone()
-            total_predictions = result['count'] if result else 0
-            conn.close()
-            print(f"Total predictions: {total_predictions}")
+            conn = get_db()
+            row = conn.execute('''SELECT total_predictions, real_predictions, fake_predictions,
+                                           accurate_feedback, wrong_feedback
+                                    FROM user_stats WHERE user_id = ?''', (current_user.id,)).fetchone()
+            if row:
+                stats = dict(row)
+            logger.debug("Dashboard stats", extra={'stats': stats})
         except Exception as e:
-            print(f"Error getting predictions: {e}")
+            logger.error("Error getting stats: %s", e)
         
-        # Get feedback stats
-        try:
-            conn = get_db(FEEDBACK_DB)
-            feedback_results = conn.execute('''SELECT feedback, COUNT(*) as count 
-                                             FROM feedback WHERE user_id = ? 
-                                             GROUP BY feedback''', (current_user.id,)).fetchall()
-            conn.close()
-            
-            for result in feedback_results:
-                if result['feedback'] in accuracy_stats:
-                    accuracy_stats[result['feedback']] = result['count']
-            
-            total_feedback = accuracy_stats['accurate'] + accuracy_stats['wrong']
-            accuracy_percentage = (accuracy_stats['accurate'] / total_feedback * 100) if total_feedback > 0 else 0
-            
-            print(f"Feedback stats: {accuracy_stats}")
-        except Exception as e:
-            print(f"Error getting feedback: {e}")
+        total_predictions = stats['total_predictions']
+        accuracy_stats = {'accurate': stats['accurate_feedback'], 'wrong': stats['wrong_feedback']}
+        total_feedback = accuracy_stats['accurate'] + accuracy_stats['wrong']
+        accuracy_percentage = (accuracy_stats['accurate'] / total_feedback * 100) if total_feedback > 0 else 0
         
         # Get recent feedback with headlines
         try:
-            conn_feedback = get_db(FEEDBACK_DB)
-            conn_predictions = get_db(TRUTH_DB)            
-            # Get recent feedback
-            feedback_data = conn_feedback.execute('''SELECT prediction_id, feedback, timestamp 
-                                                   FROM feedback WHERE user_id = ? 
-                                                   ORDER BY timestamp DESC LIMIT 5''',
-                                                (current_user.id,)).fetchall()
-            
-            recent_feedback = []
-            for fb in feedback_data:
-                # Get corresponding headline
-                headline_data = conn_predictions.execute('SELECT headline FROM predictions WHERE id = ?',
-                                                       (fb['prediction_id'],)).fetchone()
-                recent_feedback.append({
-                    'feedback': fb['feedback'],
-                    'timestamp': fb['timestamp'],
-                    'headline': headline_data['headline'] if headline_data else 'Headline not found'
-                })
-            
-            conn_feedback.close()
-            conn_predictions.close()
-            
-            print(f"Recent feedback count: {len(recent_feedback)}")
+            conn = get_db()
+            recent_feedback = [dict(row) for row in conn.execute(
+                '''SELECT f.feedback, f.timestamp, COALESCE(p.headline, 'Headline not found') AS headline
+                   FROM feedback f LEFT JOIN predictions p ON p.id = f.prediction_id
+                   WHERE f.user_id = ?
+                   ORDER BY f.timestamp DESC LIMIT 5''', (current_user.id,))]
+            logger.debug("Recent feedback count: %d", len(recent_feedback))
         except Exception as e:
-            print(f"Error getting recent feedback: {e}")
+            logger.error("Error getting recent feedback: %s", e)
         
         return render_template('dashboard.html', 
                              total_predictions=total_predictions,
                              accuracy_percentage=accuracy_percentage,
                              recent_feedback=recent_feedback,
-                             accuracy_stats=accuracy_stats)
+                             accuracy_stats=accuracy_stats,
+                             prediction_split={'REAL': stats['real_predictions'],
+                                               'FAKE': stats['fake_predictions']})
                              
     except Exception as e:
-        print(f"Dashboard error: {e}")
+        logger.error("Dashboard error: %s", e)
         flash(f'Dashboard error: {str(e)}', 'error')
         return redirect(url_for('index'))
 
+def encode_cursor(row):
+    return f"{row['timestamp']}|{row['id']}"
+
+def decode_cursor(cursor):
+    """Parse a "timestamp|id" history cursor; raises ValueError if malformed."""
+    timestamp, _, row_id = cursor.rpartition('|')
+    if not timestamp:
+        raise ValueError('Invalid cursor')
+    return timestamp, int(row_id)
+
+def highlight_snippet(snippet):
+    """HTML-escape an FTS snippet, then turn its match markers into <mark> tags."""
+    return Markup(str(escape(snippet)).replace(storage.HIGHLIGHT_START, '<mark>')
+                                      .replace(storage.HIGHLIGHT_END, '</mark>'))
+
+def fetch_history_page(user_id, search_query='', cursor=None, limit=HISTORY_PAGE_SIZE):
+    """One page of a user's predictions, plus the cursor for the next page.
+
+    Without a search query, pages are newest first and keyset-paginated: the page
+    starts strictly after the (timestamp, id) cursor, so the index on
+    (user_id, timestamp, id) is walked from that point and the cost of a page does
+    not depend on how far back it is. With a query, results come from the FTS5
+    index ordered by relevance, with highlighted snippets, and the cursor is the
+    offset of the next page.
+    """
+    if search_query:
+        return search_history_page(user_id, search_query, cursor, limit)
+
+    conditions = ['user_id = ?']
+    params = [user_id]
+    if cursor:
+        conditions.append('(timestamp, id) < (?, ?)')
+        params.extend(decode_cursor(cursor))
+    params.append(limit + 1)
+
+    rows = get_db().execute(f'''SELECT id, headline, prediction, confidence, timestamp FROM predictions
+                               WHERE {' AND '.join(conditions)}
+                               ORDER BY timestamp DESC, id DESC LIMIT ?''', params).fetchall()
+    predictions = [dict(row) for row in rows[:limit]]
+    next_cursor = encode_cursor(predictions[-1]) if len(rows) > limit else None
+    return predictions, next_cursor
+
+def search_history_page(user_id, search_query, cursor=None, limit=HISTORY_PAGE_SIZE):
+    match = storage.fts_query(search_query, user_id)
+    if match is None:
+        return [], None
+    offset = int(cursor) if cursor else 0
+    if offset < 0:
+        raise ValueError('Invalid cursor')
+
+    rows = get_db().execute('''SELECT p.id, p.headline, p.prediction, p.confidence, p.timestamp,
+                                      snippet(predictions_fts, 0, ?, ?, '…', 32) AS snippet
+                               FROM predictions_fts JOIN predictions p ON p.id = predictions_fts.rowid
+                               WHERE predictions_fts MATCH ?
+                               ORDER BY bm25(predictions_fts, 1.0, 0.0)
+                               LIMIT ? OFFSET ?''',
+                            (storage.HIGHLIGHT_START, storage.HIGHLIGHT_END, match, limit + 1, offset)).fetchall()
+    predictions = []
+    for row in rows[:limit]:
+        prediction = dict(row)
+        prediction['snippet_html'] = highlight_snippet(prediction.pop('snippet'))
+        predictions.append(prediction)
+    next_cursor = str(offset + limit) if len(rows) > limit else None
+    return predictions, next_cursor
+
 @app.route('/history')
 @login_required
 def history():
     search_query = request.args.get('search', '').strip()
+    cursor = request.args.get('cursor') or None
     
     try:
-        conn = get_db(TRUTH_DB)
-        if search_query:
-            predictions = conn.execute('''SELECT * FROM predictions 
-                                         WHERE user_id = ? AND headline LIKE ? 
-                                         ORDER BY timestamp DESC''',
-                                      (current_user.id, f'%{search_query}%')).fetchall()
-        else:
-            predictions = conn.execute('''SELECT * FROM predictions 
-                                         WHERE user_id = ? 
-                                         ORDER BY timestamp DESC''',
-                                      (current_user.id,)).fetchall()
-        conn.close()
-        
-        # Convert to list of dictionaries for easier template handling
-        predictions_list = [dict(row) for row in predictions]
+        predictions_list, next_cursor = fetch_history_page(current_user.id, search_query, cursor)
         
         return render_template('history.html', 
                              predictions=predictions_list, 
-                             search_query=search_query)
+                             search_query=search_query,
+                             next_cursor=next_cursor)
                              
     except Exception as e:
-        print(f"History error: {e}")
+        logger.error("History error: %s", e)
         flash(f'Error loading history: {str(e)}', 'error')
-        return render_template('history.html', predictions=[], search_query=search_query)
+        return render_template('history.html', predictions=[], search_query=search_query, next_cursor=None)
+
+# JSON variant of /history for infinite scroll
+@app.route('/api/history')
+@login_required
+def history_api():
+    search_query = request.args.get('search', '').strip()
+    cursor = request.args.get('cursor') or None
+    try:
+        limit = min(max(int(request.args.get('limit', HISTORY_PAGE_SIZE)), 1), 100)
+        predictions, next_cursor = fetch_history_page(current_user.id, search_query, cursor, limit)
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor or limit'}), 400
+    for prediction in predictions:
+        if 'snippet_html' in prediction:
+            prediction['snippet_html'] = str(prediction['snippet_html'])
+    return jsonify({'predictions': predictions, 'next_cursor': next_cursor})
 
 @app.route('/live-news')
 @login_required
 def live_news():
-    if not NEWS_API_KEY or NEWS_API_KEY == 'your-news-api-key':
-        flash('News API key not configured. Please contact administrator.', 'error')
-        return render_template('live_news.html', articles=[])
-    
     try:
-        params = {
-            'apiKey': NEWS_API_KEY,
-            'language': 'en',
-            'country': 'us',
-            'pageSize': 20,
-            'sortBy': 'publishedAt'
-        }
-        
-        response = requests.get(NEWS_API_URL, params=params, timeout=10)
-        news_data = response.json()
-        
-        if response.status_code == 200:
-            articles = news_data.get('articles', [])
-            
-            # Filter and clean articles
-            cleaned_articles = []
-            for article in articles:
-                # Skip articles with missing or removed titles
-                if not article.get('title') or article['title'] in ['[Removed]', '', None]:
-                    continue
-                
-                # Clean up the article data
-                cleaned_article = {
-                    'title': article.get('title', '').strip(),
-                    'description': article.get('description', '').strip() if article.get('description') else None,
-                    'url': article.get('url', '#'),
-                    'urlToImage': article.get('urlToImage'),
-                    'publishedAt': article.get('publishedAt'),
-                    'source': {
-                        'name': article.get('source', {}).get('name', 'Unknown Source')
-                    }
-                }
-                
-                # Only add articles with valid titles
-                if len(cleaned_article['title']) > 5:
-                    cleaned_articles.append(cleaned_article)
-            
-            print(f"Fetched {len(cleaned_articles)} valid articles")
-            return render_template('live_news.html', articles=cleaned_articles)
-        else:
-            error_msg = news_data.get('message', 'Unknown error')
-            flash(f'Error fetching news: {error_msg}', 'error')
-            return render_template('live_news.html', articles=[])
-    
-    except requests.RequestException as e:
-        print(f"News API request error: {e}")
-        flash('Unable to fetch live news. Please try again later.', 'error')
-        return render_template('live_news.html', articles=[])
+        articles = latest_articles(get_db(), NEWS_PAGE_SIZE)
+        if not articles and not news_ingestor.sources:
+            flash('News API key not configured. Please contact administrator.', 'error')
+        logger.debug("Showing %d stored articles", len(articles))
+        return render_template('live_news.html', articles=articles)
     except Exception as e:
-        print(f"Live news error: {e}")
-        flash(f'Error fetching news: {str(e)}', 'error')
+        logger.error("Live news error: %s", e)
+        flash(f'Error loading news: {str(e)}', 'error')
         return render_template('live_news.html', articles=[])
 
 
+# New predictions and classified news are pushed to open pages by one shared hub per process
+broadcast_hub = BroadcastHub()
+
+def public_event(event):
+    return {'id': event['id'], 'type': event['type'], 'data': event['data']}
+
+@app.route('/events')
+@login_required
+def events():
+    """Server-sent events: 'news' for every classified article, 'prediction' for this user's own."""
+    since = request.headers.get('Last-Event-ID') or request.args.get('since', '')
+    try:
+        subscriber = broadcast_hub.subscribe(current_user.id, since=int(since) if since.isdigit() else None)
+    except TooManyClients:
+        return jsonify({'error': 'Too many live connections. Please try again later.'}), 503
+
+    response = Response(broadcast_hub.stream(subscriber, EVENTS_STREAM_MAX_SECONDS), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # stop nginx from buffering the stream
+    # The generator's own cleanup never runs if the client leaves before the first byte
+    response.call_on_close(lambda: broadcast_hub.unsubscribe(subscriber))
+    return response
+
+@app.route('/events/poll')
+@login_required
+def events_poll():
+    """Long-poll fallback for /events. Without ?since= it returns the id to start from."""
+    since = request.args.get('since', '')
+    if not since.isdigit():
+        return jsonify({'events': [], 'last_id': broadcast_hub.cursor})
+    try:
+        timeout = min(max(float(request.args.get('timeout', 25)), 0), 30)
+        events = broadcast_hub.poll(current_user.id, int(since), timeout)
+    except ValueError:
+        return jsonify({'error': 'Invalid timeout'}), 400
+    except TooManyClients:
+        return jsonify({'error': 'Too many live connections. Please try again later.'}), 503
+    return jsonify({'events': [public_event(event) for event in events],
+                    'last_id': events[-1]['id'] if events else int(since)})
+
+
 @app.route('/export-csv')
 @login_required
 def export_csv():
+    """Stream the user's predictions as CSV (default) or Parquet.
+
+    Optional query arguments: format=csv|parquet, gzip=1, start/end (YYYY-MM-DD,
+    inclusive), label=REAL|FAKE and min_confidence (0-100).
+    """
     try:
-        conn = get_db(TRUTH_DB)
-        predictions = conn.execute('''SELECT headline, prediction, confidence, timestamp 
-                                     FROM predictions WHERE user_id = ? 
-                                     ORDER BY timestamp DESC''',
-                                  (current_user.id,)).fetchall()
-        conn.close()
-        
-        if not predictions:
+        filters = exports.parse_filters(request.args)
+        export_format = request.args.get('format', 'csv').lower()
+        if export_format not in exports.FORMATS:
+            raise ValueError("'format' must be csv or parquet")
+    except ValueError as e:
+        flash(f'Invalid export options: {e}', 'error')
+        return redirect(url_for('dashboard'))
+    compress = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+
+    try:
+        if not exports.has_rows(get_db(), current_user.id, filters):
             flash('No prediction data to export.', 'info')
             return redirect(url_for('dashboard'))
-        
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow(['Headline', 'Prediction', 'Confidence (%)', 'Timestamp (IST)'])
-        
-        for prediction in predictions:
-            writer.writerow([
-                prediction['headline'], 
-                prediction['prediction'], 
-                f"{prediction['confidence']:.2f}",
-                prediction['timestamp']
-            ])
-        
-        output.seek(0)
-        
-        response = make_response(output.getvalue())
-        response.headers['Content-Disposition'] = f'attachment; filename=truthlens_predictions_{current_user.username}_{datetime.now().strftime("%Y%m%d")}.csv'
-        response.headers['Content-Type'] = 'text/csv'
-        
+
+        pages = exports.iter_pages(current_user.id, filters)
+        filename = f'truthlens_predictions_{current_user.username}_{datetime.now().strftime("%Y%m%d")}'
+        if export_format == 'parquet':
+            # Parquet compresses internally, so gzip selects the codec rather than wrapping the file
+            body = exports.parquet_chunks(pages, compression='gzip' if compress else 'snappy')
+            filename += '.parquet'
+            mimetype = 'application/vnd.apache.parquet'
+        else:
+            body = exports.csv_chunks(pages)
+            filename += '.csv'
+            mimetype = 'text/csv'
+            if compress:
+                body = exports.gzip_chunks(body)
+                filename += '.gz'
+                mimetype = 'application/gzip'
+
+        response = Response(body, mimetype=mimetype)
+        response.headers['Content-Disposition'] = f'attachment; filename={filename}'
         return response
         
     except Exception as e:
-        print(f"Export error: {e}")
+        logger.error("Export error: %s", e)
         flash(f'Error exporting data: {str(e)}', 'error')
         return redirect(url_for('dashboard'))
 
@@ -534,26 +777,132 @@ def debug_data():
     
     # Check predictions
     try:
-        conn = get_db(TRUTH_DB)
+        conn = get_db()
         predictions = conn.execute('SELECT * FROM predictions WHERE user_id = ?', (current_user.id,)).fetchall()
         debug_info['predictions'] = [dict(row) for row in predictions]
         debug_info['predictions_count'] = len(predictions)
-        conn.close()
     except Exception as e:
         debug_info['predictions_error'] = str(e)
     
     # Check feedback
     try:
-        conn = get_db(FEEDBACK_DB)
+        conn = get_db()
         feedback = conn.execute('SELECT * FROM feedback WHERE user_id = ?', (current_user.id,)).fetchall()
         debug_info['feedback'] = [dict(row) for row in feedback]
         debug_info['feedback_count'] = len(feedback)
-        conn.close()
     except Exception as e:
         debug_info['feedback_error'] = str(e)
     
     return jsonify(debug_info)
 
+# Batching, cache, model load and write-behind metrics for tuning BATCH_MAX_SIZE / BATCH_MAX_WAIT_MS, cache and writer sizing
+@app.route('/debug-stats')
+@login_required
+def debug_stats():
+    return jsonify({
+        'batching': batching_engine.stats(),
+        'cascade': cascade.stats(),
+        'cache': prediction_cache.stats(),
+        'models': model_registry.stats(),
+        'writer': prediction_writer.stats(),
+        'news': news_ingestor.stats(),
+        'events': broadcast_hub.stats()
+    })
+
+# Counters and gauges the components already keep, read at scrape time
+@metrics.collector
+def component_metrics():
+    cache = prediction_cache.stats()
+    batching = batching_engine.stats()
+    writer = prediction_writer.stats()
+    version = model_registry.current_version()
+    encoding = model_registry.encoding_stats()
+    stages = cascade.stats()
+    return [
+        ('truthlens_prediction_cache_lookups_total', 'counter', 'Prediction cache lookups by result',
+         [({'result': 'hit'}, cache['hits']), ({'result': 'persistent_hit'}, cache['persistent_hits']),
+          ({'result': 'miss'}, cache['misses'])]),
+        ('truthlens_prediction_cache_entries', 'gauge', 'Headlines in the in-process prediction cache',
+         [({}, cache['size'])]),
+        ('truthlens_prediction_cache_evictions_total', 'counter', 'Entries evicted from the in-process cache',
+         [({}, cache['evictions'])]),
+        ('truthlens_encoding_cache_lookups_total', 'counter', 'Token id cache lookups by result',
+         [({'result': 'hit'}, encoding['cache']['hits']), ({'result': 'miss'}, encoding['cache']['misses'])]
+         if encoding else []),
+        ('truthlens_encoding_cache_entries', 'gauge', 'Texts in the token id cache',
+         [({}, encoding['cache']['size'])] if encoding else []),
+        ('truthlens_encoding_buffers_total', 'counter', 'Input buffers taken from the pool or newly allocated',
+         [({'source': 'pool'}, encoding['pool']['reused']), ({'source': 'allocated'}, encoding['pool']['allocated'])]
+         if encoding else []),
+        ('truthlens_cascade_predictions_total', 'counter', 'Headlines answered by the cascade, by stage',
+         [({'stage': 'student'}, stages['answered']), ({'stage': 'escalated'}, stages['escalated'])]),
+        ('truthlens_cascade_latency_saved_seconds', 'gauge',
+         'Estimated DistilBERT time saved by student answers, less the student\'s own time',
+         [({}, stages['latency_saved_ms'] / 1000)] if stages['latency_saved_ms'] is not None else []),
+        ('truthlens_batching_queue_depth', 'gauge', 'Headlines waiting for a forward pass',
+         [({}, batching['queue_depth'])]),
+        ('truthlens_batching_batches_total', 'counter', 'Forward passes run by the batching engine',
+         [({}, batching['batches'])]),
+        ('truthlens_batching_errors_total', 'counter', 'Batches that failed', [({}, batching['errors'])]),
+        ('truthlens_write_behind_queue_depth', 'gauge', 'Prediction rows waiting for the writer',
+         [({}, writer['queue_depth'])]),
+        ('truthlens_write_behind_rows_written_total', 'counter', 'Prediction rows committed by the writer',
+         [({}, writer['rows_written'])]),
+        ('truthlens_write_behind_errors_total', 'counter', 'Failed write-behind commits', [({}, writer['errors'])]),
+        ('truthlens_events_clients', 'gauge', 'Open event streams', [({}, broadcast_hub.stats()['clients'])]),
+        ('truthlens_model_info', 'gauge', 'Model version being served (1 per worker)',
+         [({'version': version}, 1)] if version else []),
+        ('truthlens_process_resident_memory_bytes', 'gauge', 'Resident memory of the serving processes',
+         [({}, model_registry.rss_bytes())]),
+    ]
+
+# Prometheus scrape endpoint (bearer token required when TRUTHLENS_METRICS_TOKEN is set)
+@app.route('/metrics')
+def metrics_endpoint():
+    if METRICS_TOKEN and not hmac.compare_digest(request.headers.get('Authorization', '').encode(),
+                                                 f'Bearer {METRICS_TOKEN}'.encode()):
+        return Response('Forbidden\n', status=403, mimetype='text/plain')
+    return Response(metrics.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def admin_authorized():
+    token = request.headers.get('X-Admin-Token', '')
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+# Model versions: GET lists the bundles and what this worker serves; POST loads
+# a version in the background, warms it up and swaps it in without dropping
+# requests. {"version": V} also pins V in BUNDLE_DIR/ACTIVE so every other
+# worker follows on its next watch tick ({"version": "latest"} removes the pin);
+# without a version the newest bundle is loaded. ?wait=1 answers after the swap.
+@app.route('/admin/model', methods=['GET', 'POST'])
+def admin_model():
+    if not admin_authorized():
+        return jsonify({'error': 'Forbidden'}), 403
+    if request.method == 'GET':
+        return jsonify({
+            'serving': model_registry.stats(),
+            'active': model_bundles.read_active(),
+            'bundles': [{key: bundle.get(key) for key in ('version', 'created_at', 'metrics')}
+                        for bundle in model_bundles.list_bundles()],
+        })
+
+    payload = request.get_json(silent=True) or request.form
+    version = (payload.get('version') or '').strip() or None
+    try:
+        if version == 'latest':
+            model_bundles.set_active(None)
+        elif version:
+            model_bundles.set_active(version)
+        if request.args.get('wait') == '1':
+            return jsonify({'serving': model_registry.reload(version, background=False)})
+        model_registry.reload(version)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error("Model reload error: %s", e)
+        return jsonify({'error': f'Reload failed: {str(e)}'}), 500
+    return jsonify({'reloading': model_registry.resolve(version).version,
+                    'serving': model_registry.current_version()}), 202
+
 # Error handlers
 @app.errorhandler(404)
 def not_found(error):
@@ -566,6 +915,5 @@ def internal_error(error):
     return redirect(url_for('index'))
 
 if __name__ == '__main__':
-    print("TruthLens application ready!")
-    print("Visit: http://localhost:5000")
+    logger.info("TruthLens application ready! Visit: http://localhost:5000")
     app.run(debug=True, host='0.0.0.0', port=5000)
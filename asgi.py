@@ -0,0 +1,321 @@
+import asyncio
+import functools
+import logging
+import queue
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, suppress
+from urllib.parse import quote
+
+import aiosqlite
+import httpx
+from a2wsgi import WSGIMiddleware
+from flask import flash, g, render_template, session
+from itsdangerous import BadSignature
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import HTMLResponse, JSONResponse, RedirectResponse, StreamingResponse
+from starlette.routing import Mount, Route
+from werkzeug.test import EnvironBuilder
+
+import long_document
+import metrics
+import model_registry
+import storage
+from app import (app as flask_app, User, batching_engine, broadcast_hub, cache_result, cascade, get_ist_time,
+                 news_ingestor, prediction_cache, prediction_writer, public_event)
+from broadcast import TooManyClients
+from config import (DATABASE, SQLITE_BUSY_TIMEOUT_MS, ASGI_DB_CONNECTIONS, ASGI_WSGI_THREADS, ASGI_INFERENCE_THREADS,
+                    LONG_DOC_WINDOW_TOKENS, NEWS_PAGE_SIZE, NEWS_POLL_IN_APP, EVENTS_STREAM_MAX_SECONDS,
+                    WRITE_BEHIND_ENABLED)
+from news_ingest import LATEST_ARTICLES_QUERY
+
+logger = logging.getLogger(__name__)
+
+
+# ASGI serving mode: uvicorn asgi:app (or gunicorn with the uvicorn worker, see
+# gunicorn.conf.py).
+#
+# The routes where a request mostly waits run natively on the event loop:
+# /predict awaits the batching engine's future, /live-news reads the store over
+# aiosqlite, and /events and /events/poll park a coroutine per client instead
+# of a thread, so thousands of idle streams cost a queue each. The live news
+# poller is an asyncio task fetching over httpx. Everything else (login,
+# history, dashboard, exports, admin) is the unchanged Flask app, mounted
+# behind a2wsgi and run in a thread pool.
+#
+# Both halves share one process's components (model, batching engine, caches,
+# writer, broadcast hub) by importing them from app.py, and the async routes
+# accept the Flask session cookie, so logging in through Flask works for both.
+
+inference_executor = ThreadPoolExecutor(max_workers=max(1, ASGI_INFERENCE_THREADS),
+                                        thread_name_prefix='truthlens-inference')
+
+
+class ConnectionPool:
+    """aiosqlite connections (each with its own thread) shared by the async routes."""
+
+    def __init__(self, path=DATABASE, size=ASGI_DB_CONNECTIONS):
+        self.path = path
+        self.size = max(1, size)
+        self._idle = None
+
+    async def open(self):
+        self._idle = asyncio.Queue()
+        for _ in range(self.size):
+            conn = await aiosqlite.connect(self.path, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000)
+            conn.row_factory = sqlite3.Row
+            for pragma in storage.pragmas():
+                await conn.execute(pragma)
+            self._idle.put_nowait(conn)
+
+    async def close(self):
+        while self._idle is not None and not self._idle.empty():
+            await self._idle.get_nowait().close()
+
+    @asynccontextmanager
+    async def connection(self):
+        started = time.perf_counter()
+        conn = await self._idle.get()
+        metrics.DB_CONNECTION_WAIT.observe(time.perf_counter() - started, kind='pool')
+        try:
+            yield conn
+        finally:
+            self._idle.put_nowait(conn)
+
+    async def fetchone(self, sql, params=()):
+        async with self.connection() as conn:
+            async with conn.execute(sql, params) as cursor:
+                return await cursor.fetchone()
+
+    async def fetchall(self, sql, params=()):
+        async with self.connection() as conn:
+            async with conn.execute(sql, params) as cursor:
+                return await cursor.fetchall()
+
+
+db = ConnectionPool()
+
+
+# 🔐 Flask sessions
+
+async def current_user(request):
+    """The user logged in through Flask-Login, read from the Flask session cookie, or None."""
+    cookie = request.cookies.get(flask_app.config['SESSION_COOKIE_NAME'])
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    if not cookie or serializer is None:
+        return None
+    try:
+        data = serializer.loads(cookie, max_age=int(flask_app.permanent_session_lifetime.total_seconds()))
+    except BadSignature:
+        return None
+    if data.get('_user_id') is None:
+        return None
+    row = await db.fetchone('SELECT id, username FROM users WHERE id = ?', (data['_user_id'],))
+    return User(row['id'], row['username']) if row else None
+
+
+def login_required(handler):
+    @functools.wraps(handler)
+    async def wrapper(request):
+        user = await current_user(request)
+        if user is None:
+            next_url = request.url.path + (f'?{request.url.query}' if request.url.query else '')
+            return RedirectResponse(f"/login?next={quote(next_url, safe='')}", status_code=302)
+        request.state.user = user
+        return await handler(request)
+    return wrapper
+
+
+def observed(route):
+    """The request metrics Flask's before/after_request hooks record, for an async route."""
+    def decorate(handler):
+        @functools.wraps(handler)
+        async def wrapper(request):
+            started = time.perf_counter()
+            metrics.HTTP_IN_PROGRESS.inc()
+            status = 500
+            try:
+                response = await handler(request)
+                status = response.status_code
+                return response
+            finally:
+                metrics.HTTP_IN_PROGRESS.dec()
+                metrics.HTTP_LATENCY.observe(time.perf_counter() - started, route=route, method=request.method)
+                metrics.HTTP_REQUESTS.inc(route=route, method=request.method, status=status)
+        return wrapper
+    return decorate
+
+
+def render_page(request, template, user, messages=(), **context):
+    """Render one of the Flask templates inside a Flask request context built from the ASGI request,
+    so url_for, current_user and flashed messages behave as under Flask."""
+    environ = EnvironBuilder(path=request.url.path, base_url=str(request.base_url), query_string=request.url.query,
+                             headers={'Cookie': request.headers.get('cookie', '')}).get_environ()
+    with flask_app.request_context(environ):
+        g._login_user = user
+        for message, category in messages:
+            flash(message, category)
+        body = render_template(template, **context)
+        flask_response = flask_app.response_class(body)
+        flask_app.session_interface.save_session(flask_app, session._get_current_object(), flask_response)
+    response = HTMLResponse(body)
+    for cookie in flask_response.headers.getlist('Set-Cookie'):
+        response.raw_headers.append((b'set-cookie', cookie.encode('latin-1')))
+    return response
+
+
+# 🤖 Prediction
+
+def predict_long(headline):
+    """Runs in inference_executor: the window-by-window verdict for text over one window, else None."""
+    if not long_document.needs_windows(headline):
+        return None
+    return tuple(long_document.classify([headline])[0][:3])
+
+
+@observed('/predict')
+@login_required
+async def predict(request):
+    user = request.state.user
+    headline = (await request.form()).get('headline')
+    if not headline:
+        return JSONResponse({'error': 'No headline provided'}, status_code=400)
+
+    headline = headline.strip()
+    if len(headline) < 5:
+        return JSONResponse({'error': 'Headline too short. Please enter a meaningful headline.'}, status_code=400)
+
+    try:
+        # The SQLite tier of the cache and the writer's id reservation may touch disk: run them off the loop
+        if cascade.stale():
+            # Loading the student's files (and re-keying the cache) reads from disk: not on the loop
+            await run_in_threadpool(cascade.refresh)
+        prediction = await run_in_threadpool(prediction_cache.get, headline)
+        if prediction is None:
+            # With the student loaded it takes tens of microseconds: cheaper on the loop than a hop to a thread
+            prediction = cascade.split([headline])[0][0]
+            if prediction is None and len(headline) > LONG_DOC_WINDOW_TOKENS - 2:
+                prediction = await asyncio.get_running_loop().run_in_executor(inference_executor, predict_long,
+                                                                              headline)
+            if prediction is None:
+                try:
+                    future = batching_engine.submit(headline)
+                except queue.Full:
+                    return JSONResponse({'error': 'Server is busy. Please try again shortly.'}, status_code=503)
+                prediction = await asyncio.wrap_future(future)
+            await run_in_threadpool(cache_result, headline, prediction)
+        result, confidence, model_version = prediction
+    except Exception as e:
+        logger.error("BERT prediction error: %s", e)
+        return JSONResponse({'error': f'Prediction failed: {str(e)}'}, status_code=500)
+
+    try:
+        timestamp = get_ist_time().isoformat()
+        write_started = time.perf_counter()
+        if WRITE_BEHIND_ENABLED:
+            try:
+                prediction_id = await run_in_threadpool(prediction_writer.submit, user.id, headline, result,
+                                                        confidence, timestamp, model_version)
+            except queue.Full:
+                return JSONResponse({'error': 'Server is busy. Please try again shortly.'}, status_code=503)
+        else:
+            async with db.connection() as conn:
+                cursor = await conn.execute('''INSERT INTO predictions (user_id, headline, prediction, confidence,
+                                                                       timestamp, model_version)
+                                               VALUES (?, ?, ?, ?, ?, ?)''',
+                                            (user.id, headline, result, confidence, timestamp, model_version))
+                prediction_id = cursor.lastrowid
+                await conn.commit()
+        metrics.PREDICT_PHASE.observe(time.perf_counter() - write_started, phase='db_write')
+    except Exception as db_error:
+        logger.error("DB error: %s", db_error)
+        return JSONResponse({'error': 'Database error occurred'}, status_code=500)
+
+    return JSONResponse({
+        'result': result,
+        'confidence': f"{confidence:.2f}%",
+        'prediction_id': prediction_id,
+        'model_version': model_version
+    })
+
+
+# 📰 Live news and events
+
+@observed('/live-news')
+@login_required
+async def live_news(request):
+    try:
+        articles = await db.fetchall(LATEST_ARTICLES_QUERY, (NEWS_PAGE_SIZE,))
+        messages = [] if articles or news_ingestor.sources else \
+            [('News API key not configured. Please contact administrator.', 'error')]
+    except Exception as e:
+        logger.error("Live news error: %s", e)
+        articles, messages = [], [(f'Error loading news: {str(e)}', 'error')]
+    return render_page(request, 'live_news.html', request.state.user, messages, articles=articles)
+
+
+@observed('/events')
+@login_required
+async def events(request):
+    """Server-sent events, as /events in app.py."""
+    since = request.headers.get('last-event-id') or request.query_params.get('since', '')
+    try:
+        subscriber = await run_in_threadpool(broadcast_hub.subscribe, request.state.user.id,
+                                             int(since) if since.isdigit() else None,
+                                             asyncio.get_running_loop())
+    except TooManyClients:
+        return JSONResponse({'error': 'Too many live connections. Please try again later.'}, status_code=503)
+    return StreamingResponse(broadcast_hub.astream(subscriber, EVENTS_STREAM_MAX_SECONDS),
+                             media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@observed('/events/poll')
+@login_required
+async def events_poll(request):
+    """Long-poll fallback for /events, as /events/poll in app.py."""
+    since = request.query_params.get('since', '')
+    if not since.isdigit():
+        return JSONResponse({'events': [], 'last_id': broadcast_hub.cursor})
+    try:
+        timeout = min(max(float(request.query_params.get('timeout', 25)), 0), 30)
+        events = await broadcast_hub.apoll(request.state.user.id, int(since), timeout)
+    except ValueError:
+        return JSONResponse({'error': 'Invalid timeout'}, status_code=400)
+    except TooManyClients:
+        return JSONResponse({'error': 'Too many live connections. Please try again later.'}, status_code=503)
+    return JSONResponse({'events': [public_event(event) for event in events],
+                         'last_id': events[-1]['id'] if events else int(since)})
+
+
+@asynccontextmanager
+async def lifespan(starlette_app):
+    await db.open()
+    await run_in_threadpool(cascade.refresh)
+    model_registry.ensure_watching()
+    metrics.ensure_exporting()
+    client = poller = None
+    if NEWS_POLL_IN_APP and news_ingestor.sources:
+        client = httpx.AsyncClient(headers={'User-Agent': 'TruthLens/1.0'})
+        poller = asyncio.create_task(news_ingestor.arun(client))
+    try:
+        yield
+    finally:
+        if poller:
+            poller.cancel()
+            with suppress(asyncio.CancelledError):
+                await poller
+            await client.aclose()
+        await db.close()
+        inference_executor.shutdown(wait=False)
+
+
+app = Starlette(routes=[
+    Route('/predict', predict, methods=['POST']),
+    Route('/live-news', live_news),
+    Route('/events', events),
+    Route('/events/poll', events_poll),
+    Mount('/', app=WSGIMiddleware(flask_app, workers=ASGI_WSGI_THREADS)),
+], lifespan=lifespan)
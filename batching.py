@@ -0,0 +1,128 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+
+# Dynamic micro-batching for DistilBERT inference.
+# Headlines submitted within a short window are grouped, tokenized together
+# (padded to the longest item in the batch) and run in a single forward pass.
+class BatchingEngine:
+    def __init__(self, predict_batch, max_batch_size=16, max_wait_ms=5, max_queue_size=1024,
+                 latency_window=1000):
+        """predict_batch takes a list of texts and returns one result per text, in order."""
+        self.predict_batch = predict_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, max_wait_ms / 1000.0)
+        self.max_queue_size = max_queue_size
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._lock = threading.Lock()
+        self._worker = None
+        self._worker_pid = None
+
+        # Metrics
+        self._batches = 0
+        self._items = 0
+        self._errors = 0
+        self._max_queue_depth = 0
+        self._batch_sizes = {}
+        self._queue_wait_total = 0.0
+        self._inference_total = 0.0
+        self._latencies = deque(maxlen=latency_window)
+
+    def _ensure_started(self):
+        # Threads do not survive fork, so a worker started in a gunicorn master
+        # is restarted lazily in each child process.
+        pid = os.getpid()
+        if self._worker is not None and self._worker_pid == pid and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker_pid == pid and self._worker.is_alive():
+                return
+            if self._worker_pid != pid:
+                self._queue = queue.Queue(maxsize=self.max_queue_size)
+            self._worker_pid = pid
+            self._worker = threading.Thread(target=self._run, name='truthlens-batcher', daemon=True)
+            self._worker.start()
+
+    def submit(self, text):
+        """Queue a text for prediction and return a Future. Raises queue.Full when overloaded."""
+        self._ensure_started()
+        future = Future()
+        self._queue.put_nowait((text, future, time.perf_counter()))
+        depth = self._queue.qsize()
+        if depth > self._max_queue_depth:
+            self._max_queue_depth = depth
+        return future
+
+    def predict(self, text, timeout=30):
+        """Blocking helper: submit a text and wait for its result."""
+        return self.submit(text).result(timeout=timeout)
+
+    def _collect_batch(self):
+        first = self._queue.get()
+        batch = [first]
+        deadline = first[2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            started = time.perf_counter()
+            texts = [item[0] for item in batch]
+            try:
+                results = self.predict_batch(texts)
+            except Exception as e:
+                self._errors += 1
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            finished = time.perf_counter()
+            for (_, future, enqueued), result in zip(batch, results):
+                future.set_result(result)
+                self._latencies.append(finished - enqueued)
+
+            size = len(batch)
+            self._batches += 1
+            self._items += size
+            self._batch_sizes[size] = self._batch_sizes.get(size, 0) + 1
+            self._queue_wait_total += sum(started - item[2] for item in batch)
+            self._inference_total += finished - started
+
+    def stats(self):
+        latencies = sorted(self._latencies)
+
+        def percentile(p):
+            if not latencies:
+                return 0.0
+            index = min(len(latencies) - 1, int(round(p / 100.0 * (len(latencies) - 1))))
+            return round(latencies[index] * 1000, 2)
+
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000,
+            'queue_depth': self._queue.qsize(),
+            'max_queue_depth': self._max_queue_depth,
+            'batches': self._batches,
+            'items': self._items,
+            'errors': self._errors,
+            'avg_batch_size': round(self._items / self._batches, 2) if self._batches else 0.0,
+            'batch_size_counts': dict(sorted(self._batch_sizes.items())),
+            'avg_queue_wait_ms': round(self._queue_wait_total / self._items * 1000, 2) if self._items else 0.0,
+            'avg_inference_ms': round(self._inference_total / self._batches * 1000, 2) if self._batches else 0.0,
+            'latency_p50_ms': percentile(50),
+            'latency_p99_ms': percentile(99),
+        }
@@ -0,0 +1,159 @@
+"""HTTP load test of /predict, /history and /dashboard.
+
+    python -m benchmarks.bench_http --concurrency 8 --duration 20
+    python -m benchmarks.bench_http --url http://127.0.0.1:5000   # a running server
+
+By default the requests go through Flask's test client inside this process,
+against a throwaway database (benchmarks.common.use_scratch_database), so the
+numbers cover the app, the model and SQLite without any network or server in
+between. With --url they go over HTTP to a running server instead, e.g. one
+started with gunicorn (see bench_workers.py for worker-count sweeps).
+
+Each client thread registers and logs in its own user, seeds --seed
+predictions so history and dashboard have something to show, then requests
+one endpoint in a loop for --duration seconds.
+"""
+import argparse
+import sys
+import threading
+import time
+import uuid
+
+from benchmarks.common import TEST_DATA, load_headlines, latency_metrics, result, write_json, print_cases
+
+DEFAULT_ENDPOINTS = ['predict', 'history', 'dashboard']
+
+
+class TestClientSession:
+    """Flask test client with the same post/get shape as a requests session."""
+
+    def __init__(self):
+        import app
+        app.app.config['TESTING'] = True
+        self.client = app.app.test_client()
+
+    def post(self, path, data):
+        return self.client.post(path, data=data).status_code
+
+    def get(self, path):
+        return self.client.get(path).status_code
+
+
+class HttpSession:
+    def __init__(self, base_url):
+        import requests
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+
+    def post(self, path, data):
+        return self.session.post(self.base_url + path, data=data, timeout=60).status_code
+
+    def get(self, path):
+        return self.session.get(self.base_url + path, timeout=60).status_code
+
+
+def logged_in_session(url):
+    session = HttpSession(url) if url else TestClientSession()
+    username = f'bench-{uuid.uuid4().hex[:12]}'
+    session.post('/register', data={'username': username, 'password': 'benchmark'})
+    session.post('/login', data={'username': username, 'password': 'benchmark'})
+    if session.get('/dashboard') != 200:
+        raise RuntimeError('could not log in as a benchmark user')
+    return session
+
+
+def request_for(endpoint, headlines):
+    """A function(session, i) sending the i-th request to an endpoint; returns the status code."""
+    if endpoint == 'predict':
+        return lambda session, i: session.post('/predict', data={'headline': headlines[i % len(headlines)]})
+    if endpoint == 'history':
+        return lambda session, i: session.get('/history')
+    if endpoint == 'dashboard':
+        return lambda session, i: session.get('/dashboard')
+    raise ValueError(f"Unknown endpoint '{endpoint}'")
+
+
+def drive(sessions, send, concurrency, duration, warmup):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    start_at = time.perf_counter() + warmup
+    stop_at = start_at + duration
+
+    def client(n):
+        i = n
+        while True:
+            sent = time.perf_counter()
+            if sent >= stop_at:
+                return
+            try:
+                ok = send(sessions[n], i) == 200
+            except Exception:
+                ok = False
+            done = time.perf_counter()
+            if sent >= start_at:
+                with lock:
+                    if ok:
+                        latencies.append(done - sent)
+                    else:
+                        errors[0] += 1
+            i += concurrency
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    latencies.sort()
+    metrics = latency_metrics(latencies) if latencies else {}
+    return {'requests_per_sec': round(len(latencies) / duration, 2), **metrics,
+            'requests': len(latencies), 'errors': errors[0]}
+
+
+def run(endpoints=DEFAULT_ENDPOINTS, concurrency=8, duration=10.0, warmup=2.0, seed=50, url=None, data=TEST_DATA):
+    if not url and 'config' not in sys.modules:
+        from benchmarks.common import use_scratch_database
+        use_scratch_database()
+    headlines = load_headlines(data)
+    sessions = [logged_in_session(url) for _ in range(concurrency)]
+    for n, session in enumerate(sessions):
+        for i in range(seed):
+            session.post('/predict', data={'headline': headlines[(n * seed + i) % len(headlines)]})
+
+    cases = []
+    for endpoint in endpoints:
+        metrics = drive(sessions, request_for(endpoint, headlines), concurrency, duration, warmup)
+        cases.append({'case': endpoint, 'metrics': metrics})
+        print(f"  {endpoint:<10} {metrics['requests_per_sec']:>9} req/s  p50 {metrics.get('p50_ms')} ms  "
+              f"p99 {metrics.get('p99_ms')} ms  errors {metrics['errors']}")
+    params = {'endpoints': list(endpoints), 'concurrency': concurrency, 'duration': duration, 'seed': seed,
+              'target': url or 'test-client'}
+    return result('http', params, cases)
+
+
+def add_arguments(parser):
+    parser.add_argument('--endpoints', nargs='+', choices=DEFAULT_ENDPOINTS, default=DEFAULT_ENDPOINTS)
+    parser.add_argument('--concurrency', type=int, default=8, help='client threads, each with its own user')
+    parser.add_argument('--duration', type=float, default=10, help='measured seconds per endpoint')
+    parser.add_argument('--warmup', type=float, default=2, help='unmeasured seconds before each endpoint')
+    parser.add_argument('--seed', type=int, default=50, help='predictions made per user before measuring')
+    parser.add_argument('--url', default=None, help='base URL of a running server (default: Flask test client)')
+
+
+def run_from_args(args):
+    return run(args.endpoints, args.concurrency, args.duration, args.warmup, args.seed, args.url)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+    document = run_from_args(args)
+    print_cases(document)
+    if args.output:
+        write_json(document, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Tokenizer and model latency/throughput by batch size and sequence length.
+
+    python -m benchmarks.bench_inference --batch-sizes 1 8 32 128 --lengths natural 64 256
+
+Statements come from liar_dataset/test.tsv. "natural" uses them as they are
+(padded per batch to the longest one, as /predict does); a number N joins
+consecutive statements until each text has at least N tokens and truncates to
+exactly N, to show how cost grows with sequence length. Each case times the
+tokenizer alone and predict_batch (tokenizer + forward pass + softmax), the
+function behind predict_news and the batching engine.
+"""
+import argparse
+import time
+
+from benchmarks.common import (TEST_DATA, load_headlines, time_calls, latency_metrics, result, write_json,
+                               print_cases)
+
+DEFAULT_BATCH_SIZES = [1, 2, 4, 8, 16, 32, 64, 128]
+DEFAULT_LENGTHS = ['natural', 64, 128, 256]
+
+
+def texts_of_length(tokenizer, headlines, length, count):
+    """count texts of at least `length` tokens, each made of consecutive statements."""
+    texts, i = [], 0
+    while len(texts) < count:
+        parts, tokens = [], 0
+        while tokens < length:
+            headline = headlines[i % len(headlines)]
+            parts.append(headline)
+            tokens += len(tokenizer.tokenize(headline))
+            i += 1
+        texts.append(' '.join(parts))
+    return texts
+
+
+def repeats_for(fn, budget_seconds, max_repeat, min_repeat=3):
+    """How many timed calls fit into the per-case time budget, judging by one call."""
+    started = time.perf_counter()
+    fn()
+    once = max(time.perf_counter() - started, 1e-6)
+    return max(min_repeat, min(max_repeat, int(budget_seconds / once)))
+
+
+def run(batch_sizes=DEFAULT_BATCH_SIZES, lengths=DEFAULT_LENGTHS, data=TEST_DATA, max_repeat=50, budget=5.0):
+    import model_registry
+    from predict_bert import predict_batch, predict_news
+
+    tokenizer = model_registry.get_tokenizer()
+    headlines = load_headlines(data)
+    cases = []
+
+    durations = time_calls(lambda: predict_news(headlines[0]), repeats_for(lambda: predict_news(headlines[0]),
+                                                                          budget, max_repeat))
+    cases.append({'case': 'predict_news', 'metrics': {
+        **latency_metrics(durations), 'items_per_sec': round(1 / (sum(durations) / len(durations)), 2)}})
+
+    for length in lengths:
+        if length == 'natural':
+            texts, max_length = headlines[:max(batch_sizes)], 512
+        else:
+            texts, max_length = texts_of_length(tokenizer, headlines, int(length), max(batch_sizes)), int(length)
+        for batch_size in batch_sizes:
+            batch = texts[:batch_size]
+
+            def tokenize():
+                return tokenizer(batch, return_tensors="pt", padding="longest", truncation=True,
+                                 max_length=max_length)
+
+            def predict():
+                return predict_batch(batch, max_length=max_length)
+
+            repeat = repeats_for(predict, budget, max_repeat)
+            tokenize_durations = time_calls(tokenize, repeat)
+            predict_durations = time_calls(predict, repeat)
+            mean = sum(predict_durations) / len(predict_durations)
+            cases.append({'case': f'batch={batch_size} len={length}', 'metrics': {
+                **latency_metrics(tokenize_durations, 'tokenize_'),
+                **latency_metrics(predict_durations),
+                'items_per_sec': round(batch_size / mean, 2),
+                'tokens': int(tokenize()['input_ids'].shape[1]),
+                'repeat': repeat,
+            }})
+            print(f"  {cases[-1]['case']:<24} {cases[-1]['metrics']['p50_ms']:>10} ms  "
+                  f"{cases[-1]['metrics']['items_per_sec']:>9} items/s")
+
+    params = {'batch_sizes': list(batch_sizes), 'lengths': [str(length) for length in lengths], 'data': data,
+              'backend': model_registry.stats()['inference_backend'], 'model_version': model_registry.current_version()}
+    return result('inference', params, cases)
+
+
+def add_arguments(parser):
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=DEFAULT_BATCH_SIZES)
+    parser.add_argument('--lengths', nargs='+', default=DEFAULT_LENGTHS,
+                        help="'natural' and/or token counts")
+    parser.add_argument('--data', default=TEST_DATA)
+    parser.add_argument('--max-repeat', type=int, default=50, help='timed calls per case at most')
+    parser.add_argument('--budget', type=float, default=5.0, help='seconds to spend per case, roughly')
+
+
+def run_from_args(args):
+    return run(args.batch_sizes, args.lengths, args.data, args.max_repeat, args.budget)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+    document = run_from_args(args)
+    print_cases(document)
+    if args.output:
+        write_json(document, args.output)
+
+
+if __name__ == '__main__':
+    main()
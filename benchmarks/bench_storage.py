@@ -0,0 +1,183 @@
+"""Insert and query throughput of the SQLite store as the prediction and feedback tables grow.
+
+    python -m benchmarks.bench_storage --rows 10000 100000 1000000 10000000
+
+Builds a scratch database with the production schema (including the search,
+statistics and event-log triggers every insert pays for) and grows the
+predictions table to each size in --rows, with feedback on --feedback-ratio of
+them. Rows are spread over --users users, with one "heavy" user owning 1% of
+them. At every size it measures:
+
+  bulk_insert      rows/sec while growing (executemany, --chunk rows per commit)
+  insert_one       one prediction per commit, as /predict does with write-behind off
+  feedback_insert  one feedback row per commit
+  history_*        first and a deep keyset page of the heavy user's history
+  dashboard        user_stats row + recent feedback join
+  search           full-text search over the heavy user's headlines
+  export_page      one EXPORT_PAGE_SIZE keyset page of the heavy user's history
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.common import (TEST_DATA, load_headlines, time_calls, latency_metrics, result, write_json,
+                               print_cases)
+
+DEFAULT_ROWS = [10000, 100000, 1000000]
+HEAVY_USER = 1
+
+
+def row_stream(headlines, users, start_index, count, rng, epoch):
+    for i in range(start_index, start_index + count):
+        user_id = HEAVY_USER if i % 100 == 0 else rng.randint(2, users)
+        headline = f"{headlines[i % len(headlines)]} #{i}"
+        prediction = 'REAL' if rng.random() < 0.5 else 'FAKE'
+        timestamp = (epoch + timedelta(seconds=i)).isoformat()
+        yield user_id, headline, prediction, round(rng.uniform(50, 100), 2), timestamp
+
+
+def grow(conn, headlines, users, current, target, chunk, feedback_ratio, rng, epoch):
+    """Insert predictions (and feedback for a share of them) up to target rows; returns rows/sec."""
+    started = time.perf_counter()
+    index = current
+    while index < target:
+        count = min(chunk, target - index)
+        rows = list(row_stream(headlines, users, index, count, rng, epoch))
+        cursor = conn.executemany('''INSERT INTO predictions (user_id, headline, prediction, confidence, timestamp)
+                                     VALUES (?, ?, ?, ?, ?)''', rows)
+        last_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+        first_id = last_id - cursor.rowcount + 1
+        conn.executemany('''INSERT INTO feedback (prediction_id, user_id, feedback, timestamp)
+                            VALUES (?, ?, ?, ?)''',
+                         [(first_id + offset, row[0], 'accurate' if rng.random() < 0.7 else 'wrong', row[4])
+                          for offset, row in enumerate(rows) if rng.random() < feedback_ratio])
+        conn.commit()
+        index += count
+    elapsed = time.perf_counter() - started
+    return (target - current) / elapsed if target > current else None
+
+
+def measure(conn, headlines, users, size, repeat, page_size, rng, epoch):
+    import storage
+
+    metrics = {}
+    counter = [size]
+
+    def insert_one():
+        counter[0] += 1
+        conn.execute('''INSERT INTO predictions (user_id, headline, prediction, confidence, timestamp)
+                        VALUES (?, ?, ?, ?, ?)''', next(row_stream(headlines, users, counter[0], 1, rng, epoch)))
+        conn.commit()
+
+    def feedback_insert():
+        conn.execute('''INSERT INTO feedback (prediction_id, user_id, feedback, timestamp)
+                        VALUES (?, ?, 'wrong', ?)''', (rng.randint(1, size), HEAVY_USER, datetime.utcnow().isoformat()))
+        conn.commit()
+
+    history_sql = '''SELECT id, headline, prediction, confidence, timestamp FROM predictions
+                     WHERE user_id = ?{} ORDER BY timestamp DESC, id DESC LIMIT ?'''
+    deep = conn.execute('''SELECT timestamp, id FROM predictions WHERE user_id = ?
+                           ORDER BY timestamp LIMIT 1 OFFSET ?''', (HEAVY_USER, max(0, size // 200))).fetchone()
+
+    def history_first():
+        conn.execute(history_sql.format(''), (HEAVY_USER, 20)).fetchall()
+
+    def history_deep():
+        conn.execute(history_sql.format(' AND (timestamp, id) < (?, ?)'),
+                     (HEAVY_USER, deep['timestamp'], deep['id'], 20)).fetchall()
+
+    def dashboard():
+        conn.execute('SELECT * FROM user_stats WHERE user_id = ?', (HEAVY_USER,)).fetchone()
+        conn.execute('''SELECT f.feedback, f.timestamp, COALESCE(p.headline, 'Headline not found') AS headline
+                        FROM feedback f LEFT JOIN predictions p ON p.id = f.prediction_id
+                        WHERE f.user_id = ? ORDER BY f.timestamp DESC LIMIT 5''', (HEAVY_USER,)).fetchall()
+
+    search_term = headlines[0].split()[1] if len(headlines[0].split()) > 1 else headlines[0]
+
+    def search():
+        conn.execute('''SELECT p.id FROM predictions_fts JOIN predictions p ON p.id = predictions_fts.rowid
+                        WHERE predictions_fts MATCH ? ORDER BY bm25(predictions_fts, 1.0, 0.0) LIMIT 21''',
+                     (storage.fts_query(search_term, HEAVY_USER),)).fetchall()
+
+    def export_page():
+        conn.execute(history_sql.format(''), (HEAVY_USER, page_size)).fetchall()
+
+    for name, fn in (('insert_one', insert_one), ('feedback_insert', feedback_insert),
+                     ('history_first', history_first), ('history_deep', history_deep), ('dashboard', dashboard),
+                     ('search', search), ('export_page', export_page)):
+        durations = time_calls(fn, repeat)
+        metrics[name] = {**latency_metrics(durations), 'ops_per_sec': round(len(durations) / sum(durations), 1)}
+    return metrics
+
+
+def run(sizes=DEFAULT_ROWS, users=1000, feedback_ratio=0.1, chunk=1000, repeat=200, data=TEST_DATA, seed=0,
+        db_path=None):
+    import storage
+    from config import EXPORT_PAGE_SIZE
+
+    headlines = load_headlines(data)
+    rng = random.Random(seed)
+    epoch = datetime(2024, 1, 1)
+    tmp_dir = None
+    if db_path is None:
+        tmp_dir = tempfile.TemporaryDirectory(prefix='truthlens-bench-storage-')
+        db_path = os.path.join(tmp_dir.name, 'store.db')
+    conn = storage.connect(db_path)
+    cases = []
+    try:
+        storage.create_schema(conn)
+        conn.executemany('INSERT INTO users (id, username, password_hash) VALUES (?, ?, ?)',
+                         [(i, f'user{i}', 'x') for i in range(1, users + 1)])
+        conn.commit()
+        current = 0
+        for size in sorted(sizes):
+            rate = grow(conn, headlines, users, current, size, chunk, feedback_ratio, rng, epoch)
+            conn.execute('ANALYZE')
+            measured = measure(conn, headlines, users, size, repeat, EXPORT_PAGE_SIZE, rng, epoch)
+            current = conn.execute('SELECT MAX(id) FROM predictions').fetchone()[0]
+            db_mb = round(sum(os.path.getsize(path) for path in (db_path, db_path + '-wal')
+                              if os.path.exists(path)) / 2 ** 20, 1)
+            cases.append({'case': f'rows={size} bulk_insert',
+                          'metrics': {'rows_per_sec': round(rate, 1) if rate else None, 'db_size_mb': db_mb}})
+            for name, metrics in measured.items():
+                cases.append({'case': f'rows={size} {name}', 'metrics': metrics})
+            print(f"  rows={size:<9} bulk {round(rate or 0)} rows/s, "
+                  f"history p50 {measured['history_first']['p50_ms']} ms, {db_mb} MB")
+    finally:
+        conn.close()
+        if tmp_dir is not None:
+            tmp_dir.cleanup()
+    params = {'rows': sorted(sizes), 'users': users, 'feedback_ratio': feedback_ratio, 'chunk': chunk,
+              'repeat': repeat}
+    return result('storage', params, cases)
+
+
+def add_arguments(parser):
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROWS, help='prediction table sizes')
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--feedback-ratio', type=float, default=0.1, help='share of predictions with feedback')
+    parser.add_argument('--chunk', type=int, default=1000, help='rows per commit while growing')
+    parser.add_argument('--repeat', type=int, default=200, help='timed operations per query/insert case')
+    parser.add_argument('--db', default=None, help='database file to build (default: a temporary one)')
+
+
+def run_from_args(args):
+    return run(args.rows, args.users, args.feedback_ratio, args.chunk, args.repeat, db_path=args.db)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+    document = run_from_args(args)
+    print_cases(document)
+    if args.output:
+        write_json(document, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Tokenization time per request: the transformers tokenizer against encoding.Encoder.
+
+    python -m benchmarks.bench_tokenizer --requests 5000 --distinct 500 --tokenizer-batch-sizes 1 8 16
+
+Replays a stream of --requests headlines drawn (with repeats, as real traffic
+has) from --distinct statements of liar_dataset/test.tsv, a batch at a
+time, through three ways of building model inputs:
+
+  wrapper       tokenizer(batch, return_tensors="pt", padding="longest", ...),
+                what predict_batch did for every batch before encoding.py
+  encoder-cold  Encoder with the id cache off: Rust tokenizer + pooled buffers
+  encoder-warm  Encoder with the id cache on, as served by the app
+
+Before timing, the encoder's ids and attention masks are checked against the
+wrapper's for the whole stream.
+"""
+import argparse
+import random
+import time
+
+from benchmarks.common import TEST_DATA, load_headlines, latency_metrics, result, write_json, print_cases
+
+DEFAULT_BATCH_SIZES = [1, 8, 16]
+
+
+def request_stream(headlines, requests, distinct, seed=0):
+    rng = random.Random(seed)
+    pool = headlines[:distinct]
+    return [rng.choice(pool) for _ in range(requests)]
+
+
+def check_same_inputs(tokenizer, encoder, batches):
+    for batch in batches:
+        expected = tokenizer(batch, return_tensors="pt", padding="longest", truncation=True, max_length=512)
+        with encoder.batch(batch) as inputs:
+            for row in range(len(batch)):
+                mask = inputs['attention_mask'][row].bool()
+                if (mask.sum() != expected['attention_mask'][row].sum()
+                        or inputs['input_ids'][row][mask].tolist()
+                        != expected['input_ids'][row][expected['attention_mask'][row].bool()].tolist()):
+                    raise AssertionError(f"Encoder inputs differ from the tokenizer's for: {batch[row]!r}")
+
+
+def time_batches(fn, batches):
+    durations = []
+    for batch in batches:
+        started = time.perf_counter()
+        fn(batch)
+        durations.append(time.perf_counter() - started)
+    return sorted(durations)
+
+
+def run(batch_sizes=DEFAULT_BATCH_SIZES, requests=5000, distinct=500, data=TEST_DATA):
+    import model_registry
+    from encoding import Encoder
+
+    tokenizer = model_registry.get_tokenizer()
+    stream = request_stream(load_headlines(data), requests, distinct)
+    cases = []
+    for batch_size in batch_sizes:
+        batches = [stream[start:start + batch_size] for start in range(0, len(stream), batch_size)]
+        cold, warm = Encoder(tokenizer, cache_size=0), Encoder(tokenizer)
+        check_same_inputs(tokenizer, Encoder(tokenizer), batches)
+
+        def wrapper(batch):
+            tokenizer(batch, return_tensors="pt", padding="longest", truncation=True, max_length=512)
+
+        def encode_with(encoder):
+            def encode(batch):
+                with encoder.batch(batch):
+                    pass
+            return encode
+
+        for name, fn in (('wrapper', wrapper), ('encoder-cold', encode_with(cold)), ('encoder-warm', encode_with(warm))):
+            fn(batches[0])
+            durations = time_batches(fn, batches)
+            total = sum(durations)
+            cases.append({'case': f'{name} batch={batch_size}', 'metrics': {
+                **latency_metrics(durations),
+                'per_request_ms': round(total / len(stream) * 1000, 4),
+                'requests_per_sec': round(len(stream) / total, 2),
+            }})
+            print(f"  {cases[-1]['case']:<24} {cases[-1]['metrics']['per_request_ms'] * 1000:>10.1f} µs/request  "
+                  f"{cases[-1]['metrics']['requests_per_sec']:>11} requests/s")
+        print(f"  id cache hit rate {warm.stats()['cache']['hit_rate']:.0%}, "
+              f"buffers reused {warm.stats()['pool']['reused']} / allocated {warm.stats()['pool']['allocated']}")
+
+    params = {'batch_sizes': list(batch_sizes), 'requests': requests, 'distinct': distinct, 'data': data}
+    return result('tokenizer', params, cases)
+
+
+def add_arguments(parser):
+    parser.add_argument('--tokenizer-batch-sizes', type=int, nargs='+', default=DEFAULT_BATCH_SIZES,
+                        help='headlines per tokenizer call')
+    parser.add_argument('--requests', type=int, default=5000, help='headlines in the replayed stream')
+    parser.add_argument('--distinct', type=int, default=500, help='distinct headlines in the stream')
+
+
+def run_from_args(args):
+    return run(args.tokenizer_batch_sizes, args.requests, args.distinct)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+    document = run_from_args(args)
+    print_cases(document)
+    if args.output:
+        write_json(document, args.output)
+
+
+if __name__ == '__main__':
+    main()
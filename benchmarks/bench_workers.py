@@ -0,0 +1,171 @@
+"""Throughput of /predict under gunicorn as the worker count grows.
+
+    python -m benchmarks.bench_workers --workers 1 2 4 --concurrency 32 --duration 20
+
+Each run starts `gunicorn -c gunicorn.conf.py app:app` against a throwaway
+database directory with the prediction cache disabled, drives /predict with
+LIAR test statements from a pool of client threads, and reports requests/sec,
+p50/p99 latency and the total proportional set size (PSS) of the server
+processes, which shows how much of the model is shared between workers.
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+from benchmarks.common import ROOT, load_headlines
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def process_tree_pss_mb(pid):
+    """Sum PSS over a process and its direct children (Linux only)."""
+    pids = [pid]
+    for entry in os.listdir('/proc'):
+        if entry.isdigit():
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    if int(f.read().rsplit(')', 1)[1].split()[1]) == pid:
+                        pids.append(int(entry))
+            except (OSError, IndexError, ValueError):
+                continue
+    total_kb = 0
+    for p in pids:
+        try:
+            with open(f'/proc/{p}/smaps_rollup') as f:
+                for line in f:
+                    if line.startswith('Pss:'):
+                        total_kb += int(line.split()[1])
+        except OSError:
+            return None
+    return round(total_kb / 1024, 1)
+
+
+def start_server(workers, port, db_dir, extra_env):
+    env = dict(os.environ,
+               TRUTHLENS_WORKERS=str(workers),
+               TRUTHLENS_BIND=f'127.0.0.1:{port}',
+               TRUTHLENS_DB_DIR=db_dir,
+               TRUTHLENS_PREDICTION_CACHE_SIZE='0',
+               TRUTHLENS_PREDICTION_CACHE_DB='',
+               **extra_env)
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+                              cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.time() + 180
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f'gunicorn exited with code {server.returncode}')
+        try:
+            if requests.get(f'{base_url}/login', timeout=1).status_code == 200:
+                return server, base_url
+        except requests.RequestException:
+            time.sleep(0.5)
+    server.terminate()
+    raise RuntimeError('gunicorn did not become ready in time')
+
+
+def login(base_url):
+    session = requests.Session()
+    session.post(f'{base_url}/register', data={'username': 'benchmark', 'password': 'benchmark'})
+    session.post(f'{base_url}/login', data={'username': 'benchmark', 'password': 'benchmark'})
+    return session.cookies.get_dict()
+
+
+def drive(base_url, cookies, headlines, concurrency, duration, warmup):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    start_at = time.perf_counter() + warmup
+    stop_at = start_at + duration
+
+    def client(offset):
+        session = requests.Session()
+        session.cookies.update(cookies)
+        i = offset
+        while True:
+            sent = time.perf_counter()
+            if sent >= stop_at:
+                return
+            try:
+                ok = session.post(f'{base_url}/predict', data={'headline': headlines[i % len(headlines)]},
+                                  timeout=60).status_code == 200
+            except requests.RequestException:
+                ok = False
+            done = time.perf_counter()
+            if sent >= start_at:
+                with lock:
+                    if ok:
+                        latencies.append(done - sent)
+                    else:
+                        errors[0] += 1
+            i += concurrency
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    latencies.sort()
+
+    def percentile(p):
+        return round(latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] * 1000, 1) if latencies else None
+
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'requests_per_sec': round(len(latencies) / duration, 2),
+        'p50_ms': percentile(50),
+        'p99_ms': percentile(99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--concurrency', type=int, default=32, help='concurrent client threads')
+    parser.add_argument('--duration', type=float, default=20, help='measured seconds per run')
+    parser.add_argument('--warmup', type=float, default=5, help='unmeasured seconds before each run')
+    parser.add_argument('--backend', default=None, help='TRUTHLENS_INFERENCE_BACKEND for the server')
+    parser.add_argument('--data', default=os.path.join(ROOT, 'liar_dataset', 'test.tsv'))
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    headlines = load_headlines(args.data)
+    extra_env = {'TRUTHLENS_INFERENCE_BACKEND': args.backend} if args.backend else {}
+    results = []
+    print(f"{'workers':>7} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7} {'PSS MB':>9}")
+    for workers in args.workers:
+        with tempfile.TemporaryDirectory() as db_dir:
+            server, base_url = start_server(workers, free_port(), db_dir, extra_env)
+            try:
+                row = drive(base_url, login(base_url), headlines, args.concurrency, args.duration, args.warmup)
+                row['pss_mb'] = process_tree_pss_mb(server.pid)
+            finally:
+                server.send_signal(signal.SIGTERM)
+                server.wait(timeout=60)
+        row['workers'] = workers
+        results.append(row)
+        print(f"{workers:>7} {row['requests_per_sec']:>9} {row['p50_ms']!s:>9} {row['p99_ms']!s:>9} "
+              f"{row['errors']:>7} {row['pss_mb']!s:>9}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'concurrency': args.concurrency, 'duration': args.duration, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""Helpers shared by the benchmark scripts: data loading, timing, JSON results and baseline comparison.
+
+Every benchmark returns a result document
+
+    {"suite": "inference", "params": {...}, "environment": {...},
+     "cases": [{"case": "batch=8 len=64", "metrics": {"items_per_sec": 812.4, "p50_ms": 9.8}}, ...]}
+
+Metric names say which way is better: *_per_sec is higher-is-better, *_ms and
+*_mb are lower-is-better; other metrics are reported but never compared.
+"""
+import csv
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEST_DATA = os.path.join(ROOT, 'liar_dataset', 'test.tsv')
+
+
+def load_headlines(path=TEST_DATA):
+    with open(path, encoding='utf-8', newline='') as f:
+        return [row[2] for row in csv.reader(f, delimiter='\t', quoting=csv.QUOTE_NONE) if len(row) > 2]
+
+
+def use_scratch_database():
+    """Point TRUTHLENS_DB_DIR at a throwaway directory and turn off caches and background work.
+
+    Call before anything imports config; TRUTHLENS_* variables already set are kept.
+    """
+    if 'config' in sys.modules:
+        raise RuntimeError('use_scratch_database() must run before config is imported')
+    db_dir = tempfile.mkdtemp(prefix='truthlens-bench-')
+    os.environ['TRUTHLENS_DB_DIR'] = db_dir
+    os.environ.setdefault('TRUTHLENS_PREDICTION_CACHE_SIZE', '0')
+    os.environ.setdefault('TRUTHLENS_PREDICTION_CACHE_DB', '')
+    os.environ.setdefault('TRUTHLENS_NEWS_POLL_IN_APP', '0')
+    os.environ.setdefault('TRUTHLENS_MODEL_WATCH_INTERVAL', '0')
+    return db_dir
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(round(p / 100.0 * (len(sorted_values) - 1))))]
+
+
+def time_calls(fn, repeat, warmup=1):
+    """Call fn repeat times (after warmup unmeasured calls); returns sorted durations in seconds."""
+    for _ in range(warmup):
+        fn()
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - started)
+    return sorted(durations)
+
+
+def latency_metrics(durations, prefix=''):
+    """p50/p99/mean in milliseconds of a sorted list of durations in seconds."""
+    return {
+        f'{prefix}p50_ms': round(percentile(durations, 50) * 1000, 3),
+        f'{prefix}p99_ms': round(percentile(durations, 99) * 1000, 3),
+        f'{prefix}mean_ms': round(sum(durations) / len(durations) * 1000, 3),
+    }
+
+
+def environment():
+    info = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    try:
+        info['git_commit'] = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                            text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        info['git_commit'] = None
+    for module in ('torch', 'transformers', 'onnxruntime'):
+        if module in sys.modules:
+            info[module] = getattr(sys.modules[module], '__version__', None)
+    return info
+
+
+def result(suite, params, cases):
+    return {'suite': suite, 'params': params, 'environment': environment(), 'cases': cases}
+
+
+def write_json(document, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(document, f, indent=2)
+
+
+def read_json(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _direction(metric):
+    if metric.endswith('_per_sec'):
+        return 1
+    if metric.endswith(('_ms', '_mb')):
+        return -1
+    return 0
+
+
+def compare(documents, baseline_documents, tolerance=0.10):
+    """Compare result documents with a baseline, case by case and metric by metric.
+
+    Returns rows of (suite, case, metric, baseline, current, change, status) where
+    change is the relative change in the "better" direction (positive = faster)
+    and status is 'regression', 'improvement' or 'ok' against the tolerance.
+    """
+    baseline = {(doc['suite'], case['case']): case['metrics']
+                for doc in baseline_documents for case in doc['cases']}
+    rows = []
+    for doc in documents:
+        for case in doc['cases']:
+            before = baseline.get((doc['suite'], case['case']))
+            if before is None:
+                continue
+            for metric, current in case['metrics'].items():
+                direction = _direction(metric)
+                old = before.get(metric)
+                if not direction or not isinstance(old, (int, float)) or not isinstance(current, (int, float)) \
+                        or old <= 0:
+                    continue
+                change = direction * (current - old) / old
+                status = 'regression' if change < -tolerance else 'improvement' if change > tolerance else 'ok'
+                rows.append((doc['suite'], case['case'], metric, old, current, round(change, 4), status))
+    return rows
+
+
+def print_comparison(rows):
+    print(f"{'suite':<10} {'case':<34} {'metric':<18} {'baseline':>11} {'current':>11} {'change':>8}")
+    for suite, case, metric, old, current, change, status in rows:
+        marker = {'regression': '❌', 'improvement': '✅'}.get(status, '  ')
+        print(f"{suite:<10} {case:<34} {metric:<18} {old:>11} {current:>11} {change * 100:>+7.1f}% {marker}")
+
+
+def print_cases(document):
+    print(f"📊 {document['suite']}")
+    for case in document['cases']:
+        metrics = '  '.join(f'{name}={value}' for name, value in case['metrics'].items())
+        print(f"  {case['case']:<34} {metrics}")
@@ -0,0 +1,63 @@
+"""Run benchmark suites, save the results and compare them with a baseline.
+
+    python -m benchmarks.run --output baseline.json
+    python -m benchmarks.run --baseline baseline.json --output results.json --tolerance 0.1
+    python -m benchmarks.run --suites storage --rows 10000 100000
+
+Writes {"results": [<one result document per suite>]} (see benchmarks/common.py).
+With --baseline, every *_per_sec, *_ms and *_mb metric of a case that also
+appears in the baseline is compared, and the exit status is 1 when any of them
+got worse by more than --tolerance, so the command can gate a CI job.
+"""
+import argparse
+import sys
+
+from benchmarks.common import use_scratch_database, write_json, read_json, compare, print_comparison
+
+SUITES = ['inference', 'tokenizer', 'storage', 'http']
+
+
+def suite_module(name):
+    if name == 'inference':
+        from benchmarks import bench_inference as module
+    elif name == 'tokenizer':
+        from benchmarks import bench_tokenizer as module
+    elif name == 'storage':
+        from benchmarks import bench_storage as module
+    else:
+        from benchmarks import bench_http as module
+    return module
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--suites', nargs='+', choices=SUITES, default=SUITES)
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--baseline', help='results JSON from an earlier run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='allowed relative slowdown per metric')
+    for name in SUITES:
+        suite_module(name).add_arguments(parser.add_argument_group(name))
+    args = parser.parse_args(argv)
+
+    use_scratch_database()
+    documents = []
+    for name in args.suites:
+        print(f"⏱️ Running {name} benchmark")
+        documents.append(suite_module(name).run_from_args(args))
+    if args.output:
+        write_json({'results': documents}, args.output)
+        print(f"✅ Results saved to {args.output}")
+
+    if args.baseline:
+        rows = compare(documents, read_json(args.baseline)['results'], args.tolerance)
+        print_comparison(rows)
+        regressions = [row for row in rows if row[-1] == 'regression']
+        if regressions:
+            print(f"❌ {len(regressions)} metrics regressed by more than {args.tolerance:.0%}")
+            return 1
+        print(f"✅ No regressions beyond {args.tolerance:.0%} ({len(rows)} metrics compared)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,295 @@
+import asyncio
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+import storage
+from config import (DATABASE, EVENTS_MAX_CLIENTS, EVENTS_MAX_CLIENTS_PER_USER, EVENTS_CLIENT_QUEUE_SIZE,
+                    EVENTS_HEARTBEAT_SECONDS, EVENTS_POLL_INTERVAL_MS, EVENTS_BACKLOG, EVENTS_LOG_KEEP)
+
+logger = logging.getLogger(__name__)
+
+
+# In-process broadcast hub for live updates. One relay thread per process tails
+# the event_log table (see storage.EVENTS_SCHEMA) and fans each new event out to
+# the queues of the connected clients, so the database cost is one query per
+# poll interval however many clients are connected. News events go to everyone;
+# prediction events only to the user who made the prediction.
+
+EVENT_QUERY = '''SELECT e.id, e.kind, e.user_id,
+                        p.headline, p.prediction, p.confidence, p.timestamp,
+                        n.title, n.description, n.url, n.image_url, n.published_at, n.source_name,
+                        n.prediction AS news_prediction, n.confidence AS news_confidence
+                 FROM event_log e
+                 LEFT JOIN predictions p ON e.kind = 'prediction' AND p.id = e.ref_id
+                 LEFT JOIN news_articles n ON e.kind = 'news' AND n.id = e.ref_id
+                 WHERE e.id > ? ORDER BY e.id LIMIT ?'''
+
+
+class TooManyClients(Exception):
+    pass
+
+
+def event_from_row(row):
+    if row['kind'] == 'news':
+        data = {'title': row['title'], 'description': row['description'], 'url': row['url'],
+                'image_url': row['image_url'], 'published_at': row['published_at'],
+                'source_name': row['source_name'], 'prediction': row['news_prediction'],
+                'confidence': row['news_confidence']}
+    else:
+        data = {'headline': row['headline'], 'prediction': row['prediction'],
+                'confidence': row['confidence'], 'timestamp': row['timestamp']}
+    return {'id': row['id'], 'type': row['kind'], 'user_id': row['user_id'], 'data': data}
+
+
+def format_sse(event):
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+
+
+class Subscriber:
+    """One connected client. Pass an event loop to consume events with `await aget()`."""
+
+    def __init__(self, user_id, max_queue_size, loop=None, since=None):
+        self.user_id = user_id
+        self.loop = loop
+        self.last_id = since or 0
+        self.queue = asyncio.Queue(maxsize=max_queue_size) if loop else queue.Queue(maxsize=max_queue_size)
+        self.dropped = 0
+        self.connected_at = time.time()
+
+    def wants(self, event):
+        return event['user_id'] is None or event['user_id'] == self.user_id
+
+    def offer(self, event):
+        # A client resuming in a worker whose relay lags behind has already seen these
+        if event['id'] <= self.last_id:
+            return
+        self.last_id = event['id']
+        if self.loop:
+            try:
+                self.loop.call_soon_threadsafe(self._put, event)
+            except RuntimeError:
+                self.dropped += 1  # the client's event loop has already closed
+        else:
+            self._put(event)
+
+    def _put(self, event):
+        # A client that cannot keep up loses events rather than holding up the fan-out
+        try:
+            self.queue.put_nowait(event)
+        except (queue.Full, asyncio.QueueFull):
+            self.dropped += 1
+
+    def get(self, timeout=None):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    async def aget(self, timeout=None):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class BroadcastHub:
+    def __init__(self, db_path=DATABASE, max_clients=EVENTS_MAX_CLIENTS,
+                 max_clients_per_user=EVENTS_MAX_CLIENTS_PER_USER, client_queue_size=EVENTS_CLIENT_QUEUE_SIZE,
+                 heartbeat_seconds=EVENTS_HEARTBEAT_SECONDS, poll_interval_ms=EVENTS_POLL_INTERVAL_MS,
+                 backlog=EVENTS_BACKLOG, log_keep=EVENTS_LOG_KEEP):
+        self.db_path = db_path
+        self.max_clients = max_clients
+        self.max_clients_per_user = max_clients_per_user
+        self.client_queue_size = client_queue_size
+        self.heartbeat = heartbeat_seconds
+        self.poll_interval = max(0.05, poll_interval_ms / 1000.0)
+        self.log_keep = log_keep
+
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._recent = deque(maxlen=backlog)
+        self._cursor = None
+        self._relay = None
+        self._relay_pid = None
+
+        # Metrics
+        self._published = 0
+        self._delivered = 0
+        self._rejected = 0
+        self._dropped = 0
+        self._peak_clients = 0
+        self._relay_polls = 0
+        self._relay_errors = 0
+
+    def _ensure_started(self):
+        # One relay per process; a hub inherited through fork starts its own
+        pid = os.getpid()
+        if self._relay is not None and self._relay_pid == pid and self._relay.is_alive():
+            return
+        with self._lock:
+            if self._relay is not None and self._relay_pid == pid and self._relay.is_alive():
+                return
+            if self._relay_pid != pid:
+                self._subscribers = set()
+                conn = storage.connect(self.db_path)
+                try:
+                    self._cursor = conn.execute('SELECT COALESCE(MAX(id), 0) FROM event_log').fetchone()[0]
+                finally:
+                    conn.close()
+            self._relay_pid = pid
+            self._relay = threading.Thread(target=self._run, name='truthlens-events-relay', daemon=True)
+            self._relay.start()
+
+    def subscribe(self, user_id, since=None, loop=None):
+        """Register a client; events after `since` still in the backlog are queued first.
+
+        Raises TooManyClients when the process-wide or per-user limit is reached.
+        """
+        self._ensure_started()
+        subscriber = Subscriber(user_id, self.client_queue_size, loop, since)
+        with self._lock:
+            if len(self._subscribers) >= self.max_clients or \
+                    sum(1 for s in self._subscribers if s.user_id == user_id) >= self.max_clients_per_user:
+                self._rejected += 1
+                raise TooManyClients
+            self._subscribers.add(subscriber)
+            self._peak_clients = max(self._peak_clients, len(self._subscribers))
+            if since is not None:
+                for event in self.events_since(since, user_id):
+                    subscriber.offer(event)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers.discard(subscriber)
+                self._dropped += subscriber.dropped
+
+    @property
+    def cursor(self):
+        """Id of the newest event this process has relayed; a resume point for long-poll clients."""
+        self._ensure_started()
+        return self._cursor
+
+    def events_since(self, since, user_id):
+        """Events after `since` up to the relay cursor visible to user_id (call with the lock held)."""
+        if since >= self._cursor:
+            return []
+        if self._recent and self._recent[0]['id'] <= since + 1:
+            events = [e for e in self._recent if e['id'] > since]
+        else:
+            # Older than the in-memory backlog: read the gap back from the event log
+            conn = storage.connect(self.db_path)
+            try:
+                rows = conn.execute(EVENT_QUERY, (since, self._recent.maxlen)).fetchall()
+            finally:
+                conn.close()
+            events = [e for e in map(event_from_row, rows) if e['id'] <= self._cursor]
+        return [e for e in events if e['user_id'] is None or e['user_id'] == user_id]
+
+    def publish(self, event):
+        """Fan an event out to every interested client. Event ids must increase."""
+        with self._lock:
+            self._recent.append(event)
+            self._cursor = max(self._cursor or 0, event['id'])
+            self._published += 1
+            for subscriber in self._subscribers:
+                if subscriber.wants(event):
+                    subscriber.offer(event)
+                    self._delivered += 1
+
+    def _run(self):
+        conn = storage.connect(self.db_path)
+        last_prune = time.monotonic()
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                rows = conn.execute(EVENT_QUERY, (self._cursor, 500)).fetchall()
+                self._relay_polls += 1
+                for row in rows:
+                    self.publish(event_from_row(row))
+                if time.monotonic() - last_prune > 60:
+                    conn.execute('DELETE FROM event_log WHERE id <= (SELECT MAX(id) FROM event_log) - ?',
+                                 (self.log_keep,))
+                    conn.commit()
+                    last_prune = time.monotonic()
+            except Exception as e:
+                conn.rollback()
+                self._relay_errors += 1
+                logger.error("Event relay error: %s", e)
+
+    def stream(self, subscriber, max_seconds):
+        """SSE body for a subscriber: events as they arrive, a heartbeat comment when idle."""
+        deadline = time.monotonic() + max_seconds
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                event = subscriber.get(timeout=min(self.heartbeat, remaining))
+                yield format_sse(event) if event else ': heartbeat\n\n'
+        finally:
+            self.unsubscribe(subscriber)
+
+    def poll(self, user_id, since, timeout):
+        """Long-poll: wait up to timeout for events after `since`, then return everything queued."""
+        subscriber = self.subscribe(user_id, since=since)
+        try:
+            events = []
+            event = subscriber.get(timeout=timeout)
+            while event is not None:
+                events.append(event)
+                event = subscriber.get(timeout=0.05 if len(events) < self.client_queue_size else 0)
+            return events
+        finally:
+            self.unsubscribe(subscriber)
+
+    async def astream(self, subscriber, max_seconds):
+        """stream() for a subscriber created with loop=: an idle client is a parked coroutine, not a thread."""
+        deadline = time.monotonic() + max_seconds
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                event = await subscriber.aget(timeout=min(self.heartbeat, remaining))
+                yield format_sse(event) if event else ': heartbeat\n\n'
+        finally:
+            self.unsubscribe(subscriber)
+
+    async def apoll(self, user_id, since, timeout):
+        """poll() on the running event loop."""
+        subscriber = self.subscribe(user_id, since=since, loop=asyncio.get_running_loop())
+        try:
+            events = []
+            event = await subscriber.aget(timeout=timeout)
+            while event is not None:
+                events.append(event)
+                event = await subscriber.aget(timeout=0.05 if len(events) < self.client_queue_size else 0)
+            return events
+        finally:
+            self.unsubscribe(subscriber)
+
+    def stats(self):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        return {
+            'clients': len(subscribers),
+            'peak_clients': self._peak_clients,
+            'max_clients': self.max_clients,
+            'rejected': self._rejected,
+            'published': self._published,
+            'delivered': self._delivered,
+            'dropped': self._dropped + sum(s.dropped for s in subscribers),
+            'queued': sum(s.queue.qsize() for s in subscribers),
+            'relay_polls': self._relay_polls,
+            'relay_errors': self._relay_errors,
+            'cursor': self._cursor,
+        }
@@ -0,0 +1,360 @@
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import model_registry
+
+
+# 📚 Score whole archives of headlines offline.
+#
+#   python bulk_score.py liar_dataset/train.tsv liar_dataset/test.tsv -o scores.jsonl
+#   python bulk_score.py archive.jsonl -o scores.parquet --workers 4 --threads 2
+#
+# Input files (TSV, CSV or JSONL) are streamed CHUNK rows at a time and never
+# read into memory whole. Chunks go to a pool of worker processes, each holding
+# its own copy of the model and --threads torch threads. A worker tokenizes its
+# chunk, sorts it by token count and pads every batch only to the longest text
+# in that batch, which removes most of the padding a random order would need.
+#
+# Results are written in input order: appended to a JSONL file, or to numbered
+# part files in a Parquet directory. Every --checkpoint-rows rows the output is
+# fsynced and OUTPUT.checkpoint.json records how far the input has been read, so
+# running the same command after a crash or Ctrl-C continues from there.
+
+HEADLINE_FIELDS = ('headline', 'title', 'statement', 'text')
+LIAR_COLUMNS = 14  # LIAR TSVs have no header: id, label, statement, subject, ...
+LIAR_STATEMENT = 2
+
+
+def _cpu_count():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def output_format(path, fmt=None):
+    if fmt:
+        return fmt
+    return 'jsonl' if path.endswith(('.jsonl', '.ndjson', '.json')) else 'parquet'
+
+
+# 📥 Input
+
+def read_jsonl(path, column=None):
+    with open(path, encoding='utf-8') as f:
+        for row, line in enumerate(f):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            field = column or next((name for name in HEADLINE_FIELDS if name in record), None)
+            yield row, record.get('id'), record.get(field) if field else None
+
+
+def read_delimited(path, column=None):
+    csv.field_size_limit(2 ** 31 - 1)
+    with open(path, encoding='utf-8', errors='replace', newline='') as f:
+        if path.endswith('.tsv'):
+            reader = csv.reader(f, delimiter='\t', quoting=csv.QUOTE_NONE)
+        else:
+            reader = csv.reader(f)
+        first = next(reader, None)
+        if first is None:
+            return
+        header = [cell.strip().lower() for cell in first]
+        id_index = None
+        if column is not None and column.isdigit():
+            index, has_header = int(column), False
+        elif column:
+            if column.strip().lower() not in header:
+                raise ValueError(f'Column "{column}" not found in {path}')
+            index, has_header = header.index(column.strip().lower()), True
+        elif any(name in header for name in HEADLINE_FIELDS):
+            index, has_header = next(header.index(name) for name in HEADLINE_FIELDS if name in header), True
+        elif len(first) == LIAR_COLUMNS:
+            index, id_index, has_header = LIAR_STATEMENT, 0, False
+        else:
+            index, has_header = 0, False
+        if has_header and 'id' in header:
+            id_index = header.index('id')
+
+        rows = reader if has_header else _prepend(first, reader)
+        for row, cells in enumerate(rows):
+            headline = cells[index] if index < len(cells) else None
+            yield row, cells[id_index] if id_index is not None and id_index < len(cells) else None, headline
+
+
+def _prepend(first, rows):
+    yield first
+    yield from rows
+
+
+def read_records(paths, column=None):
+    """(source, row, id, headline) for every row of every input, in order."""
+    for path in paths:
+        reader = read_jsonl if path.endswith(('.jsonl', '.ndjson')) else read_delimited
+        for row, record_id, headline in reader(path, column):
+            yield path, row, record_id, headline
+
+
+def chunks(records, size):
+    while True:
+        chunk = list(islice(records, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# ⚙️ Worker processes
+
+def init_worker(version, threads):
+    import torch
+    # Ctrl-C reaches the whole process group; the main process decides how to stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    torch.set_num_threads(threads)
+    model_registry.reload(version, background=False)
+
+
+def score_texts(texts, batch_size, max_length):
+    """(label, confidence) per text, run in batches of similar token counts."""
+    import torch
+    from predict_bert import LABELS, pad_encoded
+
+    model = model_registry.get_model()
+    encodings = model.tokenizer(texts, truncation=True, max_length=max_length)
+    order = sorted(range(len(texts)), key=lambda i: len(encodings['input_ids'][i]))
+    results = [None] * len(texts)
+    for start in range(0, len(order), batch_size):
+        batch = order[start:start + batch_size]
+        inputs = pad_encoded([encodings['input_ids'][i] for i in batch], model.tokenizer.pad_token_id)
+        probs = torch.nn.functional.softmax(model.backend.logits(inputs), dim=1)
+        confidences, predictions = probs.max(dim=1)
+        for i, prediction, confidence in zip(batch, predictions.tolist(), confidences.tolist()):
+            results[i] = (LABELS[prediction], round(confidence * 100, 2))
+    return results, model.version
+
+
+# 💾 Output
+
+class JsonlOutput:
+    def __init__(self, path, state=None):
+        self.path = path
+        self.file = open(path, 'ab')
+        # Drop whatever a killed run wrote after its last checkpoint
+        self.file.truncate((state or {}).get('bytes', 0))
+        self.file.seek(0, os.SEEK_END)
+
+    def write(self, records):
+        self.file.write(''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in records).encode('utf-8'))
+
+    def commit(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return {'bytes': self.file.tell()}
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetOutput:
+    """A directory of part-NNNNN.parquet files, one per checkpoint."""
+
+    def __init__(self, path, state=None):
+        self.path = path
+        self.parts = (state or {}).get('parts', 0)
+        self.rows = []
+        os.makedirs(path, exist_ok=True)
+        for name in os.listdir(path):
+            # Parts a killed run wrote after its last checkpoint
+            if name.startswith('part-') and int(name[5:10]) >= self.parts:
+                os.remove(os.path.join(path, name))
+
+    def write(self, records):
+        self.rows.extend(records)
+
+    def commit(self):
+        if self.rows:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pylist(self.rows, schema=pa.schema([
+                ('source', pa.string()), ('row', pa.int64()), ('id', pa.string()), ('headline', pa.string()),
+                ('prediction', pa.string()), ('confidence', pa.float64()), ('model_version', pa.string())]))
+            part = os.path.join(self.path, f'part-{self.parts:05d}.parquet')
+            pq.write_table(table, part + '.tmp')
+            os.replace(part + '.tmp', part)
+            self.parts += 1
+            self.rows = []
+        return {'parts': self.parts}
+
+    def close(self):
+        pass
+
+
+OUTPUTS = {'jsonl': JsonlOutput, 'parquet': ParquetOutput}
+
+
+def checkpoint_path(output):
+    return output.rstrip('/\\') + '.checkpoint.json'
+
+
+def read_checkpoint(output):
+    try:
+        with open(checkpoint_path(output), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_checkpoint(output, checkpoint):
+    path = checkpoint_path(output)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump({**checkpoint, 'updated_at': time.time()}, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + '.tmp', path)
+
+
+class Progress:
+    """Live rows/sec on stderr: over the last few seconds and since the start of this run."""
+
+    def __init__(self, done, interval):
+        self.started = self.last_time = time.perf_counter()
+        self.start_rows = self.last_rows = self.rows = done
+        self.interval = interval
+
+    def update(self, rows, force=False):
+        self.rows = rows
+        now = time.perf_counter()
+        if not force and now - self.last_time < self.interval:
+            return
+        current = (rows - self.last_rows) / max(now - self.last_time, 1e-9)
+        sys.stderr.write(f"\r⚙️ {rows:,} rows  {current:,.0f} rows/s now  {self.average():,.0f} rows/s average   ")
+        sys.stderr.flush()
+        self.last_time, self.last_rows = now, rows
+
+    def average(self):
+        return (self.rows - self.start_rows) / max(time.perf_counter() - self.started, 1e-9)
+
+
+def parse_args(argv=None):
+    cpus = _cpu_count()
+    parser = argparse.ArgumentParser(description="Score TSV/CSV/JSONL files of headlines with the served model")
+    parser.add_argument('inputs', nargs='+', help="TSV, CSV or JSONL files, scored in the order given")
+    parser.add_argument('-o', '--output', required=True, help="results.jsonl, or a directory for Parquet parts")
+    parser.add_argument('--format', choices=sorted(OUTPUTS), default=None,
+                        help="default: jsonl for .jsonl/.json outputs, parquet otherwise")
+    parser.add_argument('--column', default=None,
+                        help="headline column name or index (JSONL: field); default: headline/title/statement/text, "
+                             "or the statement column of LIAR TSVs")
+    parser.add_argument('--model-version', default=None, help="'local', a bundle version or 'latest' (default)")
+    parser.add_argument('--workers', type=int, default=max(1, cpus // 2), help="worker processes")
+    parser.add_argument('--threads', type=int, default=None, help="torch threads per worker (default: cores / workers)")
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--chunk-size', type=int, default=2048, help="rows sent to a worker at a time")
+    parser.add_argument('--max-length', type=int, default=512)
+    parser.add_argument('--checkpoint-rows', type=int, default=50000, help="rows between checkpoints")
+    parser.add_argument('--progress-interval', type=float, default=2.0, help="seconds between progress lines")
+    parser.add_argument('--restart', action='store_true', help="ignore an existing checkpoint and start over")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.environ.setdefault('TOKENIZERS_PARALLELISM', 'false')
+    threads = args.threads or max(1, _cpu_count() // args.workers)
+    fmt = output_format(args.output, args.format)
+    inputs = [os.path.abspath(path) for path in args.inputs]
+    version = model_registry.resolve(args.model_version).version
+
+    checkpoint = None if args.restart else read_checkpoint(args.output)
+    if checkpoint:
+        if checkpoint['inputs'] != inputs or checkpoint['format'] != fmt:
+            sys.exit(f"❌ {checkpoint_path(args.output)} belongs to another run; use --restart to start over")
+        if checkpoint['model_version'] != version:
+            sys.exit(f"❌ The run was started with model {checkpoint['model_version']}, not {version}; "
+                     f"pass --model-version {checkpoint['model_version']} or --restart")
+        if checkpoint.get('complete'):
+            print(f"✅ {args.output} is already complete ({checkpoint['scored']:,} rows scored)")
+            return checkpoint
+        print(f"⏯️ Resuming after {checkpoint['rows_done']:,} rows")
+    else:
+        checkpoint = {'inputs': inputs, 'format': fmt, 'column': args.column, 'model_version': version,
+                      'rows_done': 0, 'scored': 0, 'skipped': 0, 'output': {}}
+        if os.path.isfile(args.output):
+            os.remove(args.output)
+
+    output = OUTPUTS[fmt](args.output, checkpoint['output'])
+    records = islice(read_records(args.inputs, checkpoint['column']), checkpoint['rows_done'], None)
+    progress = Progress(checkpoint['rows_done'], args.progress_interval)
+    print(f"⚙️ Scoring with model {version}: {args.workers} workers x {threads} threads, batches of {args.batch_size}")
+
+    context = multiprocessing.get_context('spawn')
+    pool = ProcessPoolExecutor(args.workers, mp_context=context, initializer=init_worker,
+                               initargs=(version, threads))
+    pending = deque()
+    since_checkpoint = 0
+    try:
+        source = chunks(records, args.chunk_size)
+        while True:
+            # Keep every worker busy without reading further ahead than that
+            while len(pending) < args.workers * 2:
+                chunk = next(source, None)
+                if chunk is None:
+                    break
+                texts = [headline.strip() for _, _, _, headline in chunk if headline and headline.strip()]
+                future = pool.submit(score_texts, texts, args.batch_size, args.max_length) if texts else None
+                pending.append((chunk, future))
+            if not pending:
+                break
+
+            chunk, future = pending.popleft()
+            results, model_version = future.result() if future else ([], version)
+            scored = iter(results)
+            rows = []
+            for path, row, record_id, headline in chunk:
+                if not headline or not headline.strip():
+                    checkpoint['skipped'] += 1
+                    continue
+                prediction, confidence = next(scored)
+                rows.append({'source': path, 'row': row, 'id': None if record_id is None else str(record_id),
+                             'headline': headline.strip(), 'prediction': prediction, 'confidence': confidence,
+                             'model_version': model_version})
+            output.write(rows)
+            checkpoint['rows_done'] += len(chunk)
+            checkpoint['scored'] += len(rows)
+            since_checkpoint += len(chunk)
+            if since_checkpoint >= args.checkpoint_rows:
+                checkpoint['output'] = output.commit()
+                write_checkpoint(args.output, checkpoint)
+                since_checkpoint = 0
+            progress.update(checkpoint['rows_done'])
+
+        checkpoint['output'] = output.commit()
+        checkpoint['complete'] = True
+        write_checkpoint(args.output, checkpoint)
+    except KeyboardInterrupt:
+        pool.shutdown(wait=False, cancel_futures=True)
+        progress.update(checkpoint['rows_done'], force=True)
+        print("\n⏸️ Interrupted; rerun the same command to resume from the last checkpoint")
+        raise SystemExit(130)
+    finally:
+        output.close()
+        pool.shutdown(wait=True, cancel_futures=True)
+
+    progress.update(checkpoint['rows_done'], force=True)
+    print(f"\n✅ Scored {checkpoint['scored']:,} headlines ({checkpoint['skipped']:,} empty rows skipped) "
+          f"at {progress.average():,.0f} rows/s → {args.output}")
+    return checkpoint
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import Counter
+
+import joblib
+
+import model_registry
+from config import MODEL_FILE, VECTORIZER_FILE, CASCADE_FILE, CASCADE_ENABLED
+from predict_bert import LABELS
+from prediction_cache import model_fingerprint
+from preprocessing import preprocess
+
+logger = logging.getLogger(__name__)
+
+
+# Two-stage prediction cascade. A TF-IDF + logistic regression student,
+# distilled from DistilBERT by train_cascade.py, reads every headline first
+# (well under a millisecond) and answers the ones it is confident about; only
+# the rest are escalated to the full model.
+#
+# The student is scored by LinearScorer, a plain Python copy of the vectorizer
+# and the logistic regression. For one headline, preprocess_texts (Arrow
+# regex kernels compiled per call) plus sklearn's transform and predict_proba
+# (input checks, sparse matrices) cost around 10 ms; the dot product over the
+# headline's few dozen n-grams takes tens of microseconds.
+#
+# train_cascade.py calibrates the confidence threshold on LIAR validation so
+# the cascade as a whole agrees with DistilBERT on a target share of it, and
+# writes it to CASCADE_FILE together with the teacher's fingerprint. The
+# student only answers while that same teacher is being served (after a hot
+# swap everything escalates until the cascade is retrained), and never for
+# text longer than anything it was calibrated on. Files written by a new
+# training run are picked up by refresh(), which callers run before looking in
+# the prediction cache, and on_load listeners are told so cached student
+# verdicts can be dropped. split() only uses what refresh() has loaded, so it
+# never reads files on the calling thread (the event loop, under asgi.py).
+
+class LinearScorer:
+    """A fitted TfidfVectorizer (l2 norm) + binary LogisticRegression, computed per text in plain Python."""
+
+    def __init__(self, vectorizer, student):
+        self.analyzer = vectorizer.build_analyzer()
+        self.sublinear_tf = vectorizer.sublinear_tf
+        coef = student.coef_[0]
+        self.weights = {feature: (float(vectorizer.idf_[i]), float(coef[i]))
+                        for feature, i in vectorizer.vocabulary_.items()}
+        self.intercept = float(student.intercept_[0])
+        self.classes = [int(label_id) for label_id in student.classes_]
+
+    def probability(self, text):
+        """predict_proba's probability of classes[1] for the raw text."""
+        counts = Counter(feature for feature in self.analyzer(preprocess(text)) if feature in self.weights)
+        score = norm = 0.0
+        for feature, count in counts.items():
+            idf, coef = self.weights[feature]
+            value = ((1 + math.log(count)) if self.sublinear_tf else count) * idf
+            norm += value * value
+            score += value * coef
+        z = self.intercept + (score / math.sqrt(norm) if norm else 0.0)
+        return 1 / (1 + math.exp(-z)) if z >= 0 else math.exp(z) / (1 + math.exp(z))
+
+    def predict(self, text):
+        """(label id, confidence in [0, 1]) for the raw text."""
+        probability = self.probability(text)
+        return (self.classes[1], probability) if probability >= 0.5 else (self.classes[0], 1 - probability)
+
+
+class Cascade:
+    def __init__(self, model_file=MODEL_FILE, vectorizer_file=VECTORIZER_FILE, config_file=CASCADE_FILE,
+                 enabled=CASCADE_ENABLED):
+        self.model_file = model_file
+        self.vectorizer_file = vectorizer_file
+        self.config_file = config_file
+        self.enabled = enabled
+        self._state = (None, None)  # (mtime of config_file, (scorer, meta) or None)
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._warned_fingerprint = None
+
+        # Metrics
+        self._answered = 0
+        self._escalated = 0
+        self._student_seconds = 0.0
+
+    def on_load(self, listener):
+        """Call listener(meta) whenever a different student is picked up (meta None once its files are gone)."""
+        self._listeners.append(listener)
+        return listener
+
+    def fingerprint(self):
+        """Hash of the student's files, or None when it is disabled or not trained (see model_fingerprint)."""
+        if not self.enabled or not os.path.exists(self.config_file):
+            return None
+        return model_fingerprint(self.config_file, self.model_file, self.vectorizer_file)
+
+    def _mtime(self):
+        if not self.enabled:
+            return None
+        try:
+            return os.path.getmtime(self.config_file)
+        except OSError:
+            return None
+
+    def stale(self):
+        """Whether refresh() has files to load or drop (a stat, no reading)."""
+        return self._state[0] != self._mtime()
+
+    def refresh(self):
+        """(scorer, meta), reloaded when train_cascade.py has written new files; None without them."""
+        mtime = self._mtime()
+        state = self._state
+        if state[0] == mtime:
+            return state[1]
+        with self._lock:
+            if self._state[0] == mtime:
+                return self._state[1]
+            loaded = None
+            if mtime is not None:
+                try:
+                    with open(self.config_file, encoding='utf-8') as f:
+                        meta = json.load(f)
+                    loaded = (LinearScorer(joblib.load(self.vectorizer_file), joblib.load(self.model_file)), meta)
+                except (OSError, ValueError) as e:
+                    logger.error("Cascade files could not be loaded: %s", e)
+                else:
+                    logger.info("Cascade %s loaded (threshold %.3f, %.1f%% escalated on validation)",
+                                meta['version'], meta['threshold'], meta['validation']['escalation_rate'] * 100)
+            elif self._state[1] is not None:
+                logger.info("Cascade files removed; escalating everything")
+            changed = loaded is not None or self._state[1] is not None
+            self._state = (mtime, loaded)
+        if changed:
+            for listener in self._listeners:
+                listener(loaded[1] if loaded else None)
+        return loaded
+
+    def active(self):
+        """The (scorer, meta) refresh() loaded, if they were distilled from the model being served
+        (None until that model has loaded: the student cannot vouch for a model it has not seen)."""
+        state = self._state[1]
+        model = model_registry.current_model()
+        if state is None or model is None:
+            return None
+        fingerprint = model.fingerprint
+        if fingerprint != state[1]['teacher_fingerprint']:
+            if self._warned_fingerprint != fingerprint:
+                self._warned_fingerprint = fingerprint
+                logger.warning("Cascade was distilled from %s, not the model being served; escalating everything "
+                               "until train_cascade.py is run again", state[1]['teacher_version'])
+            return None
+        return state
+
+    @property
+    def version(self):
+        """model_version recorded for the student's answers (None while inactive)."""
+        state = self.active()
+        return state[1]['version'] if state else None
+
+    def split(self, texts):
+        """The student's (label, confidence, model_version) for the texts it is sure of, None for the others,
+        and the indices of the others, which need the full model."""
+        results = [None] * len(texts)
+        state = self.active()
+        if state is not None:
+            scorer, meta = state
+            started = time.perf_counter()
+            for i, text in enumerate(texts):
+                if len(text) <= meta['max_chars']:
+                    label_id, confidence = scorer.predict(text)
+                    if confidence >= meta['threshold']:
+                        results[i] = (LABELS[label_id], confidence * 100, meta['version'])
+            self._student_seconds += time.perf_counter() - started
+        escalate = [i for i, result in enumerate(results) if result is None]
+        if state is not None:
+            self._answered += len(texts) - len(escalate)
+            self._escalated += len(escalate)
+        return results, escalate
+
+    def predict(self, texts, predict_full):
+        """split(), with the escalated texts run through predict_full (a predict_versioned-like function)."""
+        results, escalate = self.split(texts)
+        if escalate:
+            for i, result in zip(escalate, predict_full([texts[i] for i in escalate])):
+                results[i] = result
+        return results
+
+    def stats(self):
+        state = self._state[1]
+        meta = state[1] if state else {}
+        total = self._answered + self._escalated
+        full_ms = meta.get('latency', {}).get('full_ms_per_item')
+        return {
+            'enabled': self.enabled,
+            'version': meta.get('version'),
+            'teacher_version': meta.get('teacher_version'),
+            'threshold': meta.get('threshold'),
+            'validation': meta.get('validation'),
+            'answered': self._answered,
+            'escalated': self._escalated,
+            'escalation_rate': round(self._escalated / total, 4) if total else None,
+            'student_ms_per_item': round(self._student_seconds / total * 1000, 3) if total else None,
+            # Full-model time the answered headlines would have cost (per-item time measured at calibration),
+            # less the time the student spent on every headline
+            'latency_saved_ms': round(self._answered * full_ms - self._student_seconds * 1000, 1)
+            if full_ms is not None else None,
+        }
@@ -1,12 +1,187 @@
 # config.py
 import os
 
-DB_DIR = "database"
+DB_DIR = os.environ.get("TRUTHLENS_DB_DIR", "database")
 MODEL_DIR = "models"
 
+# Single SQLite store (WAL mode) for users, predictions and feedback
+DATABASE = os.environ.get("TRUTHLENS_DATABASE", os.path.join(DB_DIR, "store.db"))
+SQLITE_CACHE_SIZE_KB = int(os.environ.get("TRUTHLENS_SQLITE_CACHE_SIZE_KB", 20000))
+SQLITE_MMAP_SIZE = int(os.environ.get("TRUTHLENS_SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("TRUTHLENS_SQLITE_BUSY_TIMEOUT_MS", 5000))
+
+# Legacy per-table databases, imported into DATABASE by `python manage.py migrate`
 AUTH_DB = os.path.join(DB_DIR, "auth.db")
 FEEDBACK_DB = os.path.join(DB_DIR, "feedback.db")
 TRUTH_DB = os.path.join(DB_DIR, "truthlens.db")
 
 MODEL_FILE = os.path.join(MODEL_DIR, "finalized_model.pkl")
 VECTORIZER_FILE = os.path.join(MODEL_DIR, "vectorizer.pkl")
+
+# Prediction cascade (cascade.py): the TF-IDF + logistic regression student at
+# MODEL_FILE / VECTORIZER_FILE, distilled from DistilBERT by
+# `python train_cascade.py`, answers the headlines it is confident about and
+# escalates the rest to DistilBERT. Its threshold is calibrated so the cascade
+# agrees with DistilBERT on CASCADE_TARGET_AGREEMENT of LIAR validation, and is
+# kept with the teacher's fingerprint in CASCADE_FILE. TRUTHLENS_CASCADE=0
+# sends everything to DistilBERT.
+CASCADE_FILE = os.path.join(MODEL_DIR, "cascade.json")
+CASCADE_ENABLED = os.environ.get("TRUTHLENS_CASCADE", "1") == "1"
+CASCADE_TARGET_AGREEMENT = float(os.environ.get("TRUTHLENS_CASCADE_TARGET_AGREEMENT", 0.97))
+
+# Micro-batching for /predict: requests arriving within BATCH_MAX_WAIT_MS are
+# grouped into a single forward pass of at most BATCH_MAX_SIZE headlines.
+BATCH_MAX_SIZE = int(os.environ.get("TRUTHLENS_BATCH_MAX_SIZE", 16))
+BATCH_MAX_WAIT_MS = float(os.environ.get("TRUTHLENS_BATCH_MAX_WAIT_MS", 5))
+BATCH_QUEUE_SIZE = int(os.environ.get("TRUTHLENS_BATCH_QUEUE_SIZE", 1024))
+
+# /predict/batch: headlines are run through the model BATCH_API_CHUNK_SIZE at a time
+BATCH_API_CHUNK_SIZE = int(os.environ.get("TRUTHLENS_BATCH_API_CHUNK_SIZE", 32))
+BATCH_API_MAX_HEADLINES = int(os.environ.get("TRUTHLENS_BATCH_API_MAX_HEADLINES", 10000))
+
+# Long articles (long_document.py): text over one LONG_DOC_WINDOW_TOKENS window
+# is split into windows overlapping by LONG_DOC_STRIDE tokens instead of being
+# truncated. Windows of all pending documents share forward passes and their
+# logits are combined by LONG_DOC_AGGREGATION ("mean", "max" or "attention").
+# A document stops once LONG_DOC_MIN_WINDOWS windows give it an aggregate
+# confidence of LONG_DOC_EARLY_STOP_CONFIDENCE % (0 runs every window), and
+# never runs more than LONG_DOC_MAX_WINDOWS windows.
+LONG_DOC_WINDOW_TOKENS = int(os.environ.get("TRUTHLENS_LONG_DOC_WINDOW_TOKENS", 512))
+LONG_DOC_STRIDE = int(os.environ.get("TRUTHLENS_LONG_DOC_STRIDE", 128))
+LONG_DOC_AGGREGATION = os.environ.get("TRUTHLENS_LONG_DOC_AGGREGATION", "mean")
+LONG_DOC_EARLY_STOP_CONFIDENCE = float(os.environ.get("TRUTHLENS_LONG_DOC_EARLY_STOP_CONFIDENCE", 90))
+LONG_DOC_MIN_WINDOWS = int(os.environ.get("TRUTHLENS_LONG_DOC_MIN_WINDOWS", 2))
+LONG_DOC_MAX_WINDOWS = int(os.environ.get("TRUTHLENS_LONG_DOC_MAX_WINDOWS", 32))
+
+# Tokenization (encoding.py): token ids of the last ENCODING_CACHE_SIZE distinct
+# texts are cached per model, and padded batches are built in reusable int64
+# buffers for up to ENCODING_POOL_SHAPES batch shapes. Batch widths are rounded
+# up to a multiple of ENCODING_PAD_MULTIPLE tokens (more padding, fewer shapes).
+ENCODING_CACHE_SIZE = int(os.environ.get("TRUTHLENS_ENCODING_CACHE_SIZE", 20000))
+ENCODING_POOL_SHAPES = int(os.environ.get("TRUTHLENS_ENCODING_POOL_SHAPES", 128))
+ENCODING_PAD_MULTIPLE = int(os.environ.get("TRUTHLENS_ENCODING_PAD_MULTIPLE", 1))
+
+BERT_MODEL_DIR = "bert_model"
+BERT_TOKENIZER_DIR = "bert_tokenizer"
+
+# Prediction cache: in-process LRU plus an optional SQLite tier that survives
+# restarts (set TRUTHLENS_PREDICTION_CACHE_DB to an empty string to disable it)
+PREDICTION_CACHE_SIZE = int(os.environ.get("TRUTHLENS_PREDICTION_CACHE_SIZE", 10000))
+PREDICTION_CACHE_TTL = int(os.environ.get("TRUTHLENS_PREDICTION_CACHE_TTL", 24 * 3600))
+PREDICTION_CACHE_DB = os.environ.get("TRUTHLENS_PREDICTION_CACHE_DB", os.path.join(DB_DIR, "prediction_cache.db"))
+PREDICTION_CACHE_DB_TTL = int(os.environ.get("TRUTHLENS_PREDICTION_CACHE_DB_TTL", 7 * 24 * 3600))
+
+# When the web app loads DistilBERT: "background" (start loading at import and
+# keep serving), "eager" (block until loaded) or "lazy" (on the first prediction)
+MODEL_PRELOAD = os.environ.get("TRUTHLENS_MODEL_PRELOAD", "background")
+
+# Inference backend used for serving: "pytorch" (fp32), "quantized" (dynamic
+# int8) or "onnx" (ONNX Runtime). Build the optimized artifacts with
+# `python convert_model.py`.
+INFERENCE_BACKEND = os.environ.get("TRUTHLENS_INFERENCE_BACKEND", "pytorch")
+OPTIMIZED_MODEL_DIR = os.path.join(MODEL_DIR, "optimized")
+QUANTIZED_MODEL_FILE = os.path.join(OPTIMIZED_MODEL_DIR, "distilbert_int8.pt")
+ONNX_MODEL_FILE = os.path.join(OPTIMIZED_MODEL_DIR, "distilbert.onnx")
+
+# Rows per /history page (keyset-paginated on (timestamp, id))
+HISTORY_PAGE_SIZE = int(os.environ.get("TRUTHLENS_HISTORY_PAGE_SIZE", 20))
+
+# /export-csv: rows fetched per keyset page (and per Parquet row group) while streaming
+EXPORT_PAGE_SIZE = int(os.environ.get("TRUTHLENS_EXPORT_PAGE_SIZE", 1000))
+
+# Write-behind persistence for /predict: rows are journaled, queued and
+# group-committed by a background writer instead of inserted inline.
+# The journal (one JSONL file per process) is replayed at startup after a
+# crash; set TRUTHLENS_WRITE_BEHIND_FSYNC=1 to fsync every journal append so
+# queued rows also survive power loss, not just a process crash.
+WRITE_BEHIND_ENABLED = os.environ.get("TRUTHLENS_WRITE_BEHIND", "1") == "1"
+WRITE_BEHIND_MAX_BATCH = int(os.environ.get("TRUTHLENS_WRITE_BEHIND_MAX_BATCH", 256))
+WRITE_BEHIND_FLUSH_INTERVAL_MS = float(os.environ.get("TRUTHLENS_WRITE_BEHIND_FLUSH_INTERVAL_MS", 50))
+WRITE_BEHIND_QUEUE_SIZE = int(os.environ.get("TRUTHLENS_WRITE_BEHIND_QUEUE_SIZE", 10000))
+WRITE_BEHIND_ID_BLOCK = int(os.environ.get("TRUTHLENS_WRITE_BEHIND_ID_BLOCK", 100))
+WRITE_BEHIND_JOURNAL_DIR = os.environ.get("TRUTHLENS_WRITE_BEHIND_JOURNAL_DIR", os.path.join(DB_DIR, "journal"))
+WRITE_BEHIND_FSYNC = os.environ.get("TRUTHLENS_WRITE_BEHIND_FSYNC", "0") == "1"
+
+# Live news ingestion (news_ingest.py): sources are polled every
+# NEWS_POLL_INTERVAL seconds and new headlines are classified before
+# /live-news shows them. Set TRUTHLENS_NEWS_POLL_IN_APP=0 to run the poller as
+# its own process with `python manage.py ingest-news --loop` instead. Point
+# TRUTHLENS_NEWS_API_URL at a local server returning NewsAPI-shaped JSON to
+# test without the real API.
+NEWS_API_KEY = os.environ.get("TRUTHLENS_NEWS_API_KEY", "")
+NEWS_API_URL = os.environ.get("TRUTHLENS_NEWS_API_URL", "https://newsapi.org/v2/top-headlines")
+NEWS_API_COUNTRY = os.environ.get("TRUTHLENS_NEWS_API_COUNTRY", "us")
+NEWS_POLL_INTERVAL = max(1, int(os.environ.get("TRUTHLENS_NEWS_POLL_INTERVAL", 300)))
+NEWS_POLL_IN_APP = os.environ.get("TRUTHLENS_NEWS_POLL_IN_APP", "1") == "1"
+NEWS_FETCH_TIMEOUT = float(os.environ.get("TRUTHLENS_NEWS_FETCH_TIMEOUT", 10))
+NEWS_PAGE_SIZE = int(os.environ.get("TRUTHLENS_NEWS_PAGE_SIZE", 20))
+# Classify title, description and article text together (long ones by window)
+# rather than the title alone
+NEWS_CLASSIFY_FULL_TEXT = os.environ.get("TRUTHLENS_NEWS_CLASSIFY_FULL_TEXT", "0") == "1"
+
+# ASGI serving mode (asgi.py): /predict, /live-news and /events(/poll) run on
+# an asyncio event loop, so slow or idle connections hold no thread; every
+# other route is the Flask app in a pool of ASGI_WSGI_THREADS threads. Async
+# routes query SQLite over ASGI_DB_CONNECTIONS aiosqlite connections, and long
+# articles are classified in an executor of ASGI_INFERENCE_THREADS threads
+# (headlines go through the batching engine's own thread).
+ASGI_DB_CONNECTIONS = int(os.environ.get("TRUTHLENS_ASGI_DB_CONNECTIONS", 4))
+ASGI_WSGI_THREADS = int(os.environ.get("TRUTHLENS_ASGI_WSGI_THREADS", 16))
+ASGI_INFERENCE_THREADS = int(os.environ.get("TRUTHLENS_ASGI_INFERENCE_THREADS", 1))
+
+# Live event stream (/events SSE, /events/poll long-poll): each process tails
+# the event_log table once per EVENTS_POLL_INTERVAL_MS and fans events out to
+# its connected clients. Streams are closed after EVENTS_STREAM_MAX_SECONDS
+# (browsers reconnect and resume from Last-Event-ID) so they never pin a
+# worker thread indefinitely.
+EVENTS_MAX_CLIENTS = int(os.environ.get("TRUTHLENS_EVENTS_MAX_CLIENTS", 200))
+EVENTS_MAX_CLIENTS_PER_USER = int(os.environ.get("TRUTHLENS_EVENTS_MAX_CLIENTS_PER_USER", 5))
+EVENTS_CLIENT_QUEUE_SIZE = int(os.environ.get("TRUTHLENS_EVENTS_CLIENT_QUEUE_SIZE", 100))
+EVENTS_HEARTBEAT_SECONDS = float(os.environ.get("TRUTHLENS_EVENTS_HEARTBEAT_SECONDS", 15))
+EVENTS_POLL_INTERVAL_MS = float(os.environ.get("TRUTHLENS_EVENTS_POLL_INTERVAL_MS", 500))
+EVENTS_BACKLOG = int(os.environ.get("TRUTHLENS_EVENTS_BACKLOG", 1000))
+EVENTS_STREAM_MAX_SECONDS = float(os.environ.get("TRUTHLENS_EVENTS_STREAM_MAX_SECONDS", 300))
+EVENTS_LOG_KEEP = int(os.environ.get("TRUTHLENS_EVENTS_LOG_KEEP", 10000))
+
+# Tokenized LIAR splits cached by preprocessing.py (memory-mapped Arrow)
+DATASET_CACHE_DIR = os.environ.get("TRUTHLENS_DATASET_CACHE_DIR", os.path.join("liar_dataset", "cache"))
+
+# Versioned model bundles written by train_bert_liar.py (model, tokenizer and a
+# manifest with metrics and a checksum), and the trainer's checkpoints
+BUNDLE_DIR = os.environ.get("TRUTHLENS_BUNDLE_DIR", os.path.join(MODEL_DIR, "bundles"))
+CHECKPOINT_DIR = os.environ.get("TRUTHLENS_CHECKPOINT_DIR", os.path.join(MODEL_DIR, "checkpoints"))
+
+# Feedback fine-tuning (finetune_feedback.py): candidate bundles are written to
+# CANDIDATE_DIR, which the app does not watch, until promoted into BUNDLE_DIR.
+# Each run trains on the feedback since the last run plus FEEDBACK_REPLAY_RATIO
+# LIAR examples per feedback example, so the model does not drift from LIAR.
+CANDIDATE_DIR = os.environ.get("TRUTHLENS_CANDIDATE_DIR", os.path.join(MODEL_DIR, "candidates"))
+FEEDBACK_DATASET_DIR = os.environ.get("TRUTHLENS_FEEDBACK_DATASET_DIR", os.path.join("liar_dataset", "feedback"))
+FEEDBACK_MIN_EXAMPLES = int(os.environ.get("TRUTHLENS_FEEDBACK_MIN_EXAMPLES", 50))
+FEEDBACK_REPLAY_RATIO = float(os.environ.get("TRUTHLENS_FEEDBACK_REPLAY_RATIO", 4))
+
+# Served model version: "latest" (the version named in BUNDLE_DIR/ACTIVE, else
+# the newest bundle, else bert_model/ + bert_tokenizer/), "local" (always
+# bert_model/) or a bundle version. Every MODEL_WATCH_INTERVAL seconds each
+# worker checks whether that resolves to a different version and, if so, loads
+# and warms it in the background before swapping it in (0 disables the watch).
+MODEL_VERSION = os.environ.get("TRUTHLENS_MODEL_VERSION", "latest")
+MODEL_WATCH_INTERVAL = float(os.environ.get("TRUTHLENS_MODEL_WATCH_INTERVAL", 30))
+
+# Token for the /admin/* endpoints (X-Admin-Token header); they are disabled when empty
+ADMIN_TOKEN = os.environ.get("TRUTHLENS_ADMIN_TOKEN", "")
+
+# /metrics (Prometheus text format). Each worker writes its samples to
+# METRICS_DIR every METRICS_EXPORT_INTERVAL seconds so that a scrape of any
+# worker reports the sum over all of them; an empty METRICS_DIR reports only
+# the worker that answers. When METRICS_TOKEN is set, scrapers must send it as
+# "Authorization: Bearer <token>".
+METRICS_DIR = os.environ.get("TRUTHLENS_METRICS_DIR", os.path.join(DB_DIR, "metrics"))
+METRICS_EXPORT_INTERVAL = float(os.environ.get("TRUTHLENS_METRICS_EXPORT_INTERVAL", 5))
+METRICS_TOKEN = os.environ.get("TRUTHLENS_METRICS_TOKEN", "")
+
+# Logging: level and format ("text", or "json" for one object per line).
+# Per-request messages are logged at DEBUG, so they cost nothing at the
+# default INFO level; set TRUTHLENS_LOG_LEVEL=DEBUG to see them.
+LOG_LEVEL = os.environ.get("TRUTHLENS_LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("TRUTHLENS_LOG_FORMAT", "text")
@@ -0,0 +1,146 @@
+import argparse
+import csv
+import inspect
+import os
+import time
+
+import torch
+
+import model_registry
+from config import OPTIMIZED_MODEL_DIR
+from inference_backends import TorchBackend, QuantizedTorchBackend, OnnxBackend, backend_artifacts
+
+
+# 🔧 Build optimized CPU inference artifacts from bert_model/ and check that
+# they agree with the fp32 PyTorch model.
+#
+#   python convert_model.py                      # build int8 + ONNX artifacts
+#   python convert_model.py --backend onnx       # build only the ONNX export
+#   python convert_model.py --check              # build, then run the parity check
+#   python convert_model.py --check-only         # parity check on existing artifacts
+#   python convert_model.py --bundle VERSION     # build into a model bundle's optimized/ directory
+
+class _LogitsOnly(torch.nn.Module):
+    """Return a plain logits tensor so the ONNX graph has a single named output."""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        return self.model(input_ids=input_ids, attention_mask=attention_mask).logits
+
+
+def export_quantized(model, optimized_dir=OPTIMIZED_MODEL_DIR):
+    path = backend_artifacts('quantized', optimized_dir)[0]
+    quantized = QuantizedTorchBackend.quantize(model)
+    torch.save(quantized.state_dict(), path)
+    print(f"📦 Saved dynamic int8 model to {path}")
+
+
+def export_onnx(model, tokenizer, optimized_dir=OPTIMIZED_MODEL_DIR):
+    path = backend_artifacts('onnx', optimized_dir)[0]
+    sample = tokenizer(["TruthLens export sample headline", "a second, longer sample headline for padding"],
+                       return_tensors="pt", padding=True)
+    kwargs = {}
+    if 'dynamo' in inspect.signature(torch.onnx.export).parameters:
+        kwargs['dynamo'] = False  # the TorchScript exporter handles DistilBERT's dynamic axes reliably
+    torch.onnx.export(
+        _LogitsOnly(model),
+        (sample['input_ids'], sample['attention_mask']),
+        path,
+        input_names=['input_ids', 'attention_mask'],
+        output_names=['logits'],
+        dynamic_axes={
+            'input_ids': {0: 'batch', 1: 'sequence'},
+            'attention_mask': {0: 'batch', 1: 'sequence'},
+            'logits': {0: 'batch'},
+        },
+        opset_version=14,
+        **kwargs,
+    )
+    print(f"📦 Saved ONNX export to {path}")
+
+
+def load_statements(path, limit=None):
+    with open(path, encoding='utf-8', newline='') as f:
+        statements = [row[2] for row in csv.reader(f, delimiter='\t', quoting=csv.QUOTE_NONE) if len(row) > 2]
+    return statements[:limit] if limit else statements
+
+
+def parity_check(backends, tokenizer, texts, batch_size=64):
+    """Compare each backend's logits with the fp32 PyTorch reference."""
+    report = {}
+    results = {name: {'logits': [], 'seconds': 0.0} for name in backends}
+
+    for start in range(0, len(texts), batch_size):
+        inputs = tokenizer(texts[start:start + batch_size], return_tensors="pt", padding="longest",
+                           truncation=True, max_length=512)
+        for name, backend in backends.items():
+            started = time.perf_counter()
+            logits = backend.logits(inputs)
+            results[name]['seconds'] += time.perf_counter() - started
+            results[name]['logits'].append(logits.float())
+
+    reference_logits = torch.cat(results['pytorch']['logits'])
+    reference_labels = reference_logits.argmax(dim=1)
+    for name in backends:
+        logits = torch.cat(results[name]['logits'])
+        drift = (logits - reference_logits).abs()
+        report[name] = {
+            'agreement': round((logits.argmax(dim=1) == reference_labels).float().mean().item(), 4),
+            'max_logit_drift': round(drift.max().item(), 5),
+            'mean_logit_drift': round(drift.mean().item(), 5),
+            'ms_per_item': round(results[name]['seconds'] / len(texts) * 1000, 3),
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build optimized DistilBERT inference artifacts")
+    parser.add_argument('--backend', choices=['quantized', 'onnx', 'all'], default='all')
+    parser.add_argument('--check', action='store_true', help="run the parity check after converting")
+    parser.add_argument('--check-only', action='store_true', help="only run the parity check")
+    parser.add_argument('--data', default=os.path.join('liar_dataset', 'test.tsv'))
+    parser.add_argument('--limit', type=int, default=None, help="number of statements to check")
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--bundle', default=None,
+                        help="model bundle version to convert instead of bert_model/ ('latest' for the newest)")
+    args = parser.parse_args()
+
+    from transformers import DistilBertForSequenceClassification, DistilBertTokenizerFast
+    if args.bundle:
+        source = model_registry.resolve(args.bundle)
+    else:
+        source = model_registry.ModelSource.local()
+    model_dir, optimized_dir = source.model_dir, source.optimized_dir
+    tokenizer = DistilBertTokenizerFast.from_pretrained(source.tokenizer_dir)
+    targets = ['quantized', 'onnx'] if args.backend == 'all' else [args.backend]
+
+    if not args.check_only:
+        os.makedirs(optimized_dir, exist_ok=True)
+        model = DistilBertForSequenceClassification.from_pretrained(model_dir)
+        model.eval()
+        for target in targets:
+            if target == 'quantized':
+                export_quantized(model, optimized_dir)
+            else:
+                export_onnx(model, tokenizer, optimized_dir)
+
+    if args.check or args.check_only:
+        backends = {'pytorch': TorchBackend.load(model_dir, optimized_dir)}
+        if 'quantized' in targets:
+            backends['quantized'] = QuantizedTorchBackend.load(model_dir, optimized_dir)
+        if 'onnx' in targets:
+            backends['onnx'] = OnnxBackend.load(model_dir, optimized_dir)
+        texts = load_statements(args.data, args.limit)
+        print(f"🧪 Parity check on {len(texts)} statements from {args.data}")
+        report = parity_check(backends, tokenizer, texts, args.batch_size)
+        for name, row in report.items():
+            print(f"  {name:<10} agreement={row['agreement'] * 100:.2f}%  "
+                  f"max_logit_drift={row['max_logit_drift']}  mean_logit_drift={row['mean_logit_drift']}  "
+                  f"{row['ms_per_item']} ms/item")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import torch
+from tokenizers import Tokenizer
+
+from config import ENCODING_CACHE_SIZE, ENCODING_POOL_SHAPES, ENCODING_PAD_MULTIPLE
+
+
+# Fast path from headlines to model inputs, one Encoder per loaded model.
+#
+# Calling the transformers tokenizer for every batch goes through its Python
+# wrapper, which re-applies truncation and padding settings to the Rust
+# tokenizer, builds Python lists and then allocates fresh tensors. Headlines
+# are short and repeat a lot (the same story is checked by many users), so:
+#
+#   - token ids are cached per exact text in a bounded LRU, as ready int64
+#     tensors; cache misses go to the Rust tokenizer in one encode_batch call
+#     (a private copy of it, so truncation set here cannot race the wrapper)
+#   - padded batches are written into int64 buffers taken from a pool keyed by
+#     (rows, width) and handed back once the forward pass is done, so a warm
+#     /predict allocates no tensors before the model runs
+#
+# Batch widths are rounded up to a multiple of pad_multiple tokens, which trades
+# a little extra padding for fewer distinct shapes to keep buffers for.
+
+class BufferPool:
+    """Reusable (input_ids, attention_mask) int64 buffers, a few per batch shape."""
+
+    def __init__(self, max_shapes=ENCODING_POOL_SHAPES, per_shape=4):
+        self.max_shapes = max_shapes
+        self.per_shape = per_shape
+        self._free = OrderedDict()
+        self._lock = threading.Lock()
+        self.reused = 0
+        self.allocated = 0
+
+    def acquire(self, rows, width):
+        shape = (rows, width)
+        with self._lock:
+            free = self._free.get(shape)
+            if free:
+                self._free.move_to_end(shape)
+                self.reused += 1
+                return free.pop()
+            self.allocated += 1
+        return torch.empty(shape, dtype=torch.long), torch.empty(shape, dtype=torch.long)
+
+    def release(self, buffers):
+        if self.max_shapes <= 0:
+            return
+        shape = tuple(buffers[0].shape)
+        with self._lock:
+            free = self._free.setdefault(shape, [])
+            self._free.move_to_end(shape)
+            if len(free) < self.per_shape:
+                free.append(buffers)
+            while len(self._free) > self.max_shapes:
+                self._free.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {'shapes': len(self._free), 'buffers': sum(len(free) for free in self._free.values()),
+                    'reused': self.reused, 'allocated': self.allocated}
+
+
+class Encoder:
+    def __init__(self, tokenizer, max_length=512, cache_size=ENCODING_CACHE_SIZE, pad_multiple=ENCODING_PAD_MULTIPLE,
+                 pool=None):
+        self.backend = Tokenizer.from_str(tokenizer.backend_tokenizer.to_str())
+        self.backend.no_padding()
+        self.backend.enable_truncation(max_length)
+        self.max_length = max_length
+        self.pad_token_id = tokenizer.pad_token_id
+        self.cache_size = cache_size
+        self.pad_multiple = max(1, pad_multiple)
+        self.pool = pool or BufferPool()
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def encode_ids(self, texts):
+        """A 1-d int64 tensor of token ids per text (shared with the cache: do not modify)."""
+        ids, missing = [None] * len(texts), []
+        with self._lock:
+            for i, text in enumerate(texts):
+                cached = self._cache.get(text)
+                if cached is None:
+                    missing.append(i)
+                else:
+                    self._cache.move_to_end(text)
+                    ids[i] = cached
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+        if missing:
+            unique = list(dict.fromkeys(texts[i] for i in missing))
+            encoded = {text: torch.tensor(encoding.ids, dtype=torch.long)
+                       for text, encoding in zip(unique, self.backend.encode_batch(unique))}
+            for i in missing:
+                ids[i] = encoded[texts[i]]
+            if self.cache_size > 0:
+                with self._lock:
+                    self._cache.update(encoded)
+                    while len(self._cache) > self.cache_size:
+                        self._cache.popitem(last=False)
+        return ids
+
+    @contextmanager
+    def batch(self, texts):
+        """Padded model inputs for texts, in pooled buffers that are reused once the block exits."""
+        ids = self.encode_ids(list(texts))
+        longest = max((len(row_ids) for row_ids in ids), default=1)
+        width = min(-(-longest // self.pad_multiple) * self.pad_multiple, self.max_length)
+        input_ids, attention_mask = self.pool.acquire(len(ids), width)
+        input_ids.fill_(self.pad_token_id)
+        attention_mask.zero_()
+        for row, row_ids in enumerate(ids):
+            input_ids[row, :len(row_ids)] = row_ids
+            attention_mask[row, :len(row_ids)] = 1
+        try:
+            yield {'input_ids': input_ids, 'attention_mask': attention_mask}
+        finally:
+            self.pool.release((input_ids, attention_mask))
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            cache = {'size': len(self._cache), 'max_size': self.cache_size, 'hits': self.hits,
+                     'misses': self.misses, 'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0}
+        return {'cache': cache, 'pool': self.pool.stats(), 'pad_multiple': self.pad_multiple}
@@ -0,0 +1,169 @@
+import csv
+import io
+import zlib
+from datetime import date, timedelta
+
+import storage
+from config import EXPORT_PAGE_SIZE
+
+
+# Streaming export of a user's prediction history. Rows are read one keyset page
+# at a time and encoded as they go, so memory stays flat however long the history
+# is and the first bytes reach the client before the last rows are read.
+
+CSV_HEADER = ['Headline', 'Prediction', 'Confidence (%)', 'Timestamp (IST)', 'Model Version']
+FORMATS = {'csv', 'parquet'}
+LABELS = {'REAL', 'FAKE'}
+
+
+def parse_filters(args):
+    """Validate export query arguments; raises ValueError with a user-facing message."""
+    filters = {}
+    for name in ('start', 'end'):
+        value = (args.get(name) or '').strip()
+        if value:
+            try:
+                filters[name] = date.fromisoformat(value)
+            except ValueError:
+                raise ValueError(f"'{name}' must be a date in YYYY-MM-DD format")
+    if 'start' in filters and 'end' in filters and filters['start'] > filters['end']:
+        raise ValueError("'start' must not be after 'end'")
+
+    label = (args.get('label') or '').strip().upper()
+    if label:
+        if label not in LABELS:
+            raise ValueError("'label' must be REAL or FAKE")
+        filters['label'] = label
+
+    min_confidence = (args.get('min_confidence') or '').strip()
+    if min_confidence:
+        try:
+            filters['min_confidence'] = float(min_confidence)
+        except ValueError:
+            raise ValueError("'min_confidence' must be a number between 0 and 100")
+        if not 0 <= filters['min_confidence'] <= 100:
+            raise ValueError("'min_confidence' must be a number between 0 and 100")
+    return filters
+
+
+def _where(user_id, filters):
+    # Timestamps are ISO-8601 strings, so date bounds compare correctly as text
+    clauses, params = ['user_id = ?'], [user_id]
+    if 'start' in filters:
+        clauses.append('timestamp >= ?')
+        params.append(filters['start'].isoformat())
+    if 'end' in filters:
+        clauses.append('timestamp < ?')
+        params.append((filters['end'] + timedelta(days=1)).isoformat())
+    if 'label' in filters:
+        clauses.append('prediction = ?')
+        params.append(filters['label'])
+    if 'min_confidence' in filters:
+        clauses.append('confidence >= ?')
+        params.append(filters['min_confidence'])
+    return ' AND '.join(clauses), params
+
+
+def has_rows(conn, user_id, filters):
+    where, params = _where(user_id, filters)
+    return conn.execute(f'SELECT 1 FROM predictions WHERE {where} LIMIT 1', params).fetchone() is not None
+
+
+def iter_pages(user_id, filters, page_size=EXPORT_PAGE_SIZE):
+    """Yield lists of rows, newest first, paging on (timestamp, id) over a dedicated connection."""
+    where, params = _where(user_id, filters)
+    conn = storage.connect()
+    try:
+        cursor = None
+        while True:
+            keyset = ' AND (timestamp, id) < (?, ?)' if cursor else ''
+            rows = conn.execute(f'''SELECT id, headline, prediction, confidence, timestamp, model_version
+                                    FROM predictions WHERE {where}{keyset}
+                                    ORDER BY timestamp DESC, id DESC LIMIT ?''',
+                                params + list(cursor or ()) + [page_size]).fetchall()
+            if not rows:
+                return
+            yield rows
+            if len(rows) < page_size:
+                return
+            cursor = (rows[-1]['timestamp'], rows[-1]['id'])
+    finally:
+        conn.close()
+
+
+def csv_chunks(pages):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADER)
+    for rows in pages:
+        writer.writerows((row['headline'], row['prediction'], f"{row['confidence']:.2f}", row['timestamp'],
+                          row['model_version'] or '') for row in rows)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object that hands the Parquet writer's output back in pieces."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def parquet_chunks(pages, compression='snappy'):
+    """One Parquet row group per page, flushed to the client as soon as it is written."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ('id', pa.int64()),
+        ('headline', pa.string()),
+        ('prediction', pa.dictionary(pa.int8(), pa.string())),
+        ('confidence', pa.float64()),
+        ('timestamp', pa.string()),
+        ('model_version', pa.string()),
+    ])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression=compression)
+    try:
+        for rows in pages:
+            writer.write_table(pa.Table.from_pydict({
+                'id': [row['id'] for row in rows],
+                'headline': [row['headline'] for row in rows],
+                'prediction': pa.array([row['prediction'] for row in rows]).dictionary_encode(),
+                'confidence': [row['confidence'] for row in rows],
+                'timestamp': [row['timestamp'] for row in rows],
+                'model_version': [row['model_version'] for row in rows],
+            }, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def gzip_chunks(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31: gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,194 @@
+import argparse
+import csv
+import os
+
+import numpy as np
+from sklearn.metrics import accuracy_score
+from transformers import (DistilBertTokenizerFast, DistilBertForSequenceClassification, Trainer,
+                          DataCollatorWithPadding, EarlyStoppingCallback, set_seed)
+
+import model_bundles
+import model_registry
+import storage
+from config import (CANDIDATE_DIR, CHECKPOINT_DIR, FEEDBACK_DATASET_DIR, FEEDBACK_MIN_EXAMPLES,
+                    FEEDBACK_REPLAY_RATIO)
+from logs import configure_logging
+from prediction_cache import normalize_headline
+from preprocessing import preprocess_texts, tokenized_split
+from train_bert_liar import compute_metrics, training_arguments
+
+
+# 🔁 Fine-tune the served model on user feedback and write a candidate bundle.
+#
+#   python finetune_feedback.py                  # feedback since the last run + LIAR replay
+#   python finetune_feedback.py --dry-run        # only build and save the corrected-label dataset
+#   python manage.py promote-candidate VERSION   # serve a candidate once it has been checked
+#
+# Feedback is read in (timestamp, id) order from the 'feedback-finetune'
+# watermark, so each run only sees feedback given (or changed) since the
+# previous one. A prediction marked "accurate" keeps its label and one marked
+# "wrong" gets the opposite one. The new examples are mixed with a random
+# sample of LIAR training statements (--replay-ratio per example) so the model
+# does not forget LIAR while it learns from a few hundred headlines. The
+# watermark only moves once the candidate has been written.
+
+WATERMARK = 'feedback-finetune'
+LABEL_IDS = {'FAKE': 0, 'REAL': 1}  # matches the binary LIAR labels (preprocessing.LABEL_MAP)
+
+FEEDBACK_QUERY = '''SELECT f.id, f.timestamp, f.feedback, p.id AS prediction_id, p.headline, p.prediction
+                    FROM feedback f JOIN predictions p ON p.id = f.prediction_id
+                    WHERE (f.timestamp, f.id) > (?, ?)
+                    ORDER BY f.timestamp, f.id LIMIT ?'''
+
+
+def corrected_label(prediction, feedback):
+    label = LABEL_IDS[prediction]
+    return label if feedback == 'accurate' else 1 - label
+
+
+def read_new_feedback(conn, watermark, limit):
+    """Corrected examples from feedback after the watermark, and the watermark after them.
+
+    A headline seen more than once keeps its most recent label.
+    """
+    rows = conn.execute(FEEDBACK_QUERY, (*watermark, limit)).fetchall()
+    if not rows:
+        return [], watermark
+    examples = {}
+    for row in rows:
+        if row['prediction'] in LABEL_IDS and row['feedback'] in ('accurate', 'wrong'):
+            examples[normalize_headline(row['headline'])] = (
+                row['prediction_id'], row['headline'], corrected_label(row['prediction'], row['feedback']))
+    return list(examples.values()), (rows[-1]['timestamp'], rows[-1]['id'])
+
+
+def save_examples(examples, name, dataset_dir=FEEDBACK_DATASET_DIR):
+    """Keep each run's corrected-label dataset next to LIAR for auditing and full retrains."""
+    os.makedirs(dataset_dir, exist_ok=True)
+    path = os.path.join(dataset_dir, f'{name}.tsv')
+    labels = {value: key for key, value in LABEL_IDS.items()}
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f, delimiter='\t')
+        writer.writerow(['prediction_id', 'label', 'headline'])
+        writer.writerows((prediction_id, labels[label], headline) for prediction_id, headline, label in examples)
+    return path
+
+
+def feedback_dataset(examples, tokenizer, max_length):
+    from datasets import Dataset
+    texts = preprocess_texts([headline for _, headline, _ in examples])
+    encodings = tokenizer(texts, truncation=True, max_length=max_length)
+    return Dataset.from_dict({
+        "input_ids": encodings["input_ids"],
+        "attention_mask": encodings["attention_mask"],
+        "labels": [label for _, _, label in examples],
+        "length": [len(ids) for ids in encodings["input_ids"]],
+    })
+
+
+def training_set(examples, tokenizer, args):
+    """New feedback examples plus a seeded random replay sample of LIAR training statements."""
+    from datasets import concatenate_datasets
+    new = feedback_dataset(examples, tokenizer, args.max_length)
+    liar = tokenized_split(args.train, tokenizer, args.max_length)
+    replay_size = min(len(liar), int(len(examples) * args.replay_ratio))
+    if replay_size == 0:
+        return new, 0
+    replay = liar.shuffle(seed=args.seed).select(range(replay_size))
+    return concatenate_datasets([new.cast(replay.features), replay]).shuffle(seed=args.seed), replay_size
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Fine-tune the served model on user feedback")
+    parser.add_argument('--base', default=None,
+                        help="model version to start from: 'local' (bert_model/), a bundle version or 'latest' "
+                             "(default: the version the app serves)")
+    parser.add_argument('--train', default=os.path.join('liar_dataset', 'train.tsv'), help="LIAR replay source")
+    parser.add_argument('--valid', default=os.path.join('liar_dataset', 'valid.tsv'))
+    parser.add_argument('--min-examples', type=int, default=FEEDBACK_MIN_EXAMPLES,
+                        help="skip the run (keeping the watermark) until this many new examples exist")
+    parser.add_argument('--max-examples', type=int, default=50000, help="feedback rows read per run")
+    parser.add_argument('--replay-ratio', type=float, default=FEEDBACK_REPLAY_RATIO,
+                        help="LIAR examples replayed per feedback example")
+    parser.add_argument('--epochs', type=float, default=1)
+    parser.add_argument('--max-steps', type=int, default=0)
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--eval-batch-size', type=int, default=64)
+    parser.add_argument('--grad-accum', type=int, default=1)
+    parser.add_argument('--lr', type=float, default=2e-5)
+    parser.add_argument('--warmup-steps', type=int, default=0)
+    parser.add_argument('--weight-decay', type=float, default=0.01)
+    parser.add_argument('--max-length', type=int, default=512)
+    parser.add_argument('--workers', type=int, default=0)
+    parser.add_argument('--bf16', choices=['auto', 'on', 'off'], default='auto')
+    parser.add_argument('--output-dir', default=os.path.join(CHECKPOINT_DIR, 'feedback'))
+    parser.add_argument('--candidate-dir', default=CANDIDATE_DIR)
+    parser.add_argument('--dry-run', action='store_true',
+                        help="build and save the dataset only; no training, watermark unchanged")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--logging-steps', type=int, default=10)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_logging()
+    set_seed(args.seed)
+    storage.init_db()
+    conn = storage.connect()
+    try:
+        watermark = storage.get_watermark(conn, WATERMARK)
+        examples, new_watermark = read_new_feedback(conn, watermark, args.max_examples)
+        print(f"📥 {len(examples)} corrected examples from feedback after {watermark[0] or 'the beginning'}")
+        if not examples:
+            print("⏭️ No new feedback")
+            return None
+        if len(examples) < args.min_examples and not args.dry_run:
+            print(f"⏭️ Waiting for at least {args.min_examples} new examples; watermark unchanged")
+            return None
+        dataset_path = save_examples(examples, f"feedback-{new_watermark[0].replace(':', '')}-{new_watermark[1]}")
+        print(f"📦 Saved corrected-label dataset to {dataset_path}")
+        if args.dry_run:
+            return None
+
+        # 🧠 Start from the model being served (or --base)
+        base = model_registry.resolve(args.base)
+        tokenizer = DistilBertTokenizerFast.from_pretrained(base.tokenizer_dir)
+        model = DistilBertForSequenceClassification.from_pretrained(base.model_dir, num_labels=2)
+        train_dataset, replay_size = training_set(examples, tokenizer, args)
+        val_dataset = tokenized_split(args.valid, tokenizer, args.max_length).sort("length")
+        print(f"⚙️ Fine-tuning {base.version} on {len(examples)} feedback + {replay_size} LIAR replay examples")
+
+        trainer = Trainer(
+            model=model,
+            args=training_arguments(args),
+            train_dataset=train_dataset,
+            eval_dataset=val_dataset,
+            tokenizer=tokenizer,
+            data_collator=DataCollatorWithPadding(tokenizer),
+            compute_metrics=compute_metrics,
+            callbacks=[EarlyStoppingCallback(early_stopping_patience=1)],
+        )
+        base_accuracy = trainer.evaluate()['eval_accuracy']
+        trainer.train()
+        preds_output = trainer.predict(val_dataset)
+        accuracy = accuracy_score(preds_output.label_ids, np.argmax(preds_output.predictions, axis=-1))
+        print(f"✅ LIAR validation accuracy: {base_accuracy:.4f} (base) → {accuracy:.4f} (candidate)")
+        if accuracy < base_accuracy:
+            print("⚠️ The candidate is less accurate on LIAR validation than the base model")
+
+        metrics = {'accuracy': accuracy, 'base_accuracy': base_accuracy, 'global_step': trainer.state.global_step}
+        params = {'base_version': base.version, 'feedback_examples': len(examples), 'replay_examples': replay_size,
+                  'feedback_from': list(watermark), 'feedback_to': list(new_watermark), 'dataset': dataset_path,
+                  'epochs': args.epochs, 'lr': args.lr, 'batch_size': args.batch_size, 'seed': args.seed}
+        path = model_bundles.write_bundle(trainer.model, tokenizer, metrics, params, bundle_dir=args.candidate_dir)
+        storage.set_watermark(conn, WATERMARK, *new_watermark)
+        print(f"📦 Wrote candidate bundle {path}")
+        print(f"➡️ Serve it with: python manage.py promote-candidate {os.path.basename(path)}")
+        return path
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
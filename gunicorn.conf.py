@@ -0,0 +1,60 @@
+# Production launch config: gunicorn -c gunicorn.conf.py app:app
+# (ASGI mode: TRUTHLENS_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn -c gunicorn.conf.py asgi:app)
+#
+# The app (and DistilBERT) is imported once in the master process and the
+# workers are forked from it, so the model weights are shared copy-on-write
+# instead of being loaded N times. Each worker gets its own slice of the CPU
+# cores for torch's intra-op thread pool.
+import gc
+import os
+
+def _cpu_count():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+bind = os.environ.get("TRUTHLENS_BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("TRUTHLENS_WORKERS", max(1, _cpu_count() // 2)))
+# Threads let concurrent requests in one worker share forward passes in the batching engine
+# (uvicorn workers run asgi.py on an event loop and ignore `threads`)
+worker_class = os.environ.get("TRUTHLENS_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("TRUTHLENS_THREADS", 8))
+timeout = int(os.environ.get("TRUTHLENS_TIMEOUT", 120))
+preload_app = True
+
+# intra-op threads per worker so that workers x threads ~= cores
+TORCH_THREADS = int(os.environ.get("TRUTHLENS_TORCH_THREADS", max(1, _cpu_count() // workers)))
+
+# These must be set before torch/tokenizers are imported by the app:
+# - load the model in the master (instead of lazily in every worker). ONNX
+#   Runtime sessions own thread pools that do not survive fork, so with the
+#   onnx backend each worker creates its own session on first use instead
+#   (the .onnx file itself is memory-mapped and shared through the page cache)
+# - keep the master single-threaded so no OpenMP pool exists at fork time
+# - the Rust tokenizer's own thread pool is not fork-safe and competes with torch
+if os.environ.get("TRUTHLENS_INFERENCE_BACKEND", "pytorch") == "onnx":
+    os.environ.setdefault("TRUTHLENS_MODEL_PRELOAD", "lazy")
+else:
+    os.environ.setdefault("TRUTHLENS_MODEL_PRELOAD", "eager")
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+os.environ.setdefault("MKL_NUM_THREADS", "1")
+os.environ["TOKENIZERS_PARALLELISM"] = "false"
+
+
+def when_ready(server):
+    # Move everything allocated while loading into the permanent generation so
+    # the garbage collector does not touch (and un-share) those pages in workers
+    gc.freeze()
+    server.log.info(f"TruthLens: {workers} workers x {threads} threads, {TORCH_THREADS} torch threads per worker")
+
+
+def post_fork(server, worker):
+    import torch
+
+    torch.set_num_threads(TORCH_THREADS)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Can only be set once, before any inter-op work has run in this process
+        pass
@@ -0,0 +1,97 @@
+import logging
+import os
+
+import torch
+
+from config import BERT_MODEL_DIR, OPTIMIZED_MODEL_DIR, QUANTIZED_MODEL_FILE, ONNX_MODEL_FILE
+
+logger = logging.getLogger(__name__)
+
+
+# Interchangeable CPU inference backends for the DistilBERT classifier. Every
+# backend takes tokenizer output (input_ids / attention_mask tensors) and
+# returns a float logits tensor of shape (batch, num_labels).
+#
+# model_dir is the save_pretrained() directory (bert_model/ or a bundle's
+# model/) and optimized_dir holds the artifacts convert_model.py built from it.
+
+class TorchBackend:
+    name = 'pytorch'
+
+    def __init__(self, model):
+        self.model = model
+
+    @classmethod
+    def load(cls, model_dir=BERT_MODEL_DIR, optimized_dir=OPTIMIZED_MODEL_DIR):
+        from transformers import DistilBertForSequenceClassification
+        model = DistilBertForSequenceClassification.from_pretrained(model_dir)
+        model.eval()
+        return cls(model)
+
+    def logits(self, inputs):
+        with torch.no_grad():
+            return self.model(input_ids=inputs['input_ids'], attention_mask=inputs['attention_mask']).logits
+
+
+class QuantizedTorchBackend(TorchBackend):
+    """Dynamic int8 quantization of the Linear layers; activations stay fp32."""
+    name = 'quantized'
+
+    @staticmethod
+    def quantize(model):
+        return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    @classmethod
+    def load(cls, model_dir=BERT_MODEL_DIR, optimized_dir=OPTIMIZED_MODEL_DIR):
+        from transformers import DistilBertConfig, DistilBertForSequenceClassification
+        path = backend_artifacts(cls.name, optimized_dir)[0]
+        if os.path.exists(path):
+            # Build the quantized module structure without fp32 weights, then load the int8 ones
+            model = cls.quantize(DistilBertForSequenceClassification(DistilBertConfig.from_pretrained(model_dir)))
+            model.load_state_dict(torch.load(path))
+        else:
+            logger.warning("%s not found, quantizing %s at load time", path, model_dir)
+            model = cls.quantize(DistilBertForSequenceClassification.from_pretrained(model_dir))
+        model.eval()
+        return cls(model)
+
+
+class OnnxBackend:
+    name = 'onnx'
+
+    def __init__(self, session):
+        self.session = session
+
+    @classmethod
+    def load(cls, model_dir=BERT_MODEL_DIR, optimized_dir=OPTIMIZED_MODEL_DIR):
+        import onnxruntime as ort
+        path = backend_artifacts(cls.name, optimized_dir)[0]
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} not found. Run: python convert_model.py --backend onnx")
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = torch.get_num_threads()
+        options.inter_op_num_threads = 1
+        return cls(ort.InferenceSession(path, options, providers=['CPUExecutionProvider']))
+
+    def logits(self, inputs):
+        outputs = self.session.run(['logits'], {
+            'input_ids': inputs['input_ids'].numpy(),
+            'attention_mask': inputs['attention_mask'].numpy(),
+        })
+        return torch.from_numpy(outputs[0])
+
+
+BACKENDS = {backend.name: backend for backend in (TorchBackend, QuantizedTorchBackend, OnnxBackend)}
+
+
+def load_backend(name, model_dir=BERT_MODEL_DIR, optimized_dir=OPTIMIZED_MODEL_DIR):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{name}'. Choose one of: {', '.join(BACKENDS)}")
+    return BACKENDS[name].load(model_dir, optimized_dir)
+
+
+def backend_artifacts(name, optimized_dir=OPTIMIZED_MODEL_DIR):
+    """Files a backend's predictions depend on, beyond the model and tokenizer directories."""
+    files = {'quantized': [QUANTIZED_MODEL_FILE], 'onnx': [ONNX_MODEL_FILE]}.get(name, [])
+    return [os.path.join(optimized_dir, os.path.basename(path)) for path in files]
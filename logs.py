@@ -0,0 +1,56 @@
+import json
+import logging
+import sys
+import time
+
+from config import LOG_LEVEL, LOG_FORMAT
+
+
+# Logging for the web app and the background threads. Modules log through
+# logging.getLogger(__name__) and pass details as fields
+# (logger.info("Prediction stored", extra={'prediction_id': 7})); the text
+# format appends them as key=value, the json format emits one object per line
+# for log shippers. configure_logging() only installs a handler when nothing
+# (gunicorn --log-config, a test runner) has configured the root logger yet.
+
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+def record_fields(record):
+    """The extra={...} fields passed with a log call."""
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES}
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        fields = record_fields(record)
+        if fields:
+            line += ' ' + ' '.join(f'{key}={value}' for key, value in fields.items())
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f'.{int(record.msecs):03d}Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            **record_fields(record),
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level=LOG_LEVEL, fmt=LOG_FORMAT):
+    root = logging.getLogger()
+    if not root.handlers:
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(JsonFormatter() if fmt == 'json' else TextFormatter())
+        root.addHandler(handler)
+    root.setLevel(level)
@@ -0,0 +1,145 @@
+import time
+from collections import namedtuple
+
+import torch
+
+import metrics
+import model_registry
+from config import (BATCH_API_CHUNK_SIZE, LONG_DOC_WINDOW_TOKENS, LONG_DOC_STRIDE, LONG_DOC_AGGREGATION,
+                    LONG_DOC_EARLY_STOP_CONFIDENCE, LONG_DOC_MIN_WINDOWS, LONG_DOC_MAX_WINDOWS)
+from predict_bert import LABELS, pad_encoded, predict_versioned
+
+
+# Classification of articles longer than the model's 512-token input.
+#
+# predict_batch truncates, so everything after the first 512 tokens of an
+# article used to be ignored. Here a long text is cut into windows of `window`
+# tokens, each overlapping the previous one by `stride` tokens and carrying its
+# own [CLS]/[SEP], and the windows' logits are combined into one verdict:
+#
+#   mean       average the logits of all windows, then softmax
+#   max        the single most confident window decides
+#   attention  weighted mean of the logits, each window weighted by
+#              softmax(its logit margin), so a few decisive paragraphs are not
+#              drowned out by boilerplate that the model is unsure about
+#
+# Windows are run in rounds: every pending document contributes its first
+# min_windows windows, then as many again as it has run so far (2, 4, 8, ...).
+# A round's windows from all documents are sorted by length and share forward
+# passes of batch_size windows. After each round, documents whose aggregate
+# confidence has reached early_stop_confidence are done, so a clear-cut article
+# costs a couple of windows however long it is.
+
+AGGREGATIONS = ('mean', 'max', 'attention')
+
+Verdict = namedtuple('Verdict', 'label confidence model_version windows_used windows_total')
+
+
+def split_windows(tokenizer, texts, window=LONG_DOC_WINDOW_TOKENS, stride=LONG_DOC_STRIDE,
+                  max_windows=LONG_DOC_MAX_WINDOWS):
+    """Token id lists per text: its first max_windows overlapping windows."""
+    encodings = tokenizer(list(texts), truncation=True, max_length=window, stride=stride,
+                          return_overflowing_tokens=True)
+    windows = [[] for _ in texts]
+    for ids, i in zip(encodings['input_ids'], encodings['overflow_to_sample_mapping']):
+        if len(windows[i]) < max_windows:
+            windows[i].append(ids)
+    return windows
+
+
+def needs_windows(text, window=LONG_DOC_WINDOW_TOKENS, tokenizer=None):
+    """Whether text runs past one window. Every token covers at least one character,
+    so only text longer than the window in characters has to be tokenized to tell."""
+    if len(text) <= window - 2:  # room for [CLS] and [SEP]
+        return False
+    tokenizer = tokenizer or model_registry.get_model().tokenizer
+    return len(tokenizer(text, truncation=True, max_length=window + 1)['input_ids']) > window
+
+
+def aggregate(logits, method=LONG_DOC_AGGREGATION):
+    """Class probabilities for a document from its (windows, labels) logits."""
+    if method == 'mean':
+        return torch.softmax(logits.mean(dim=0), dim=0)
+    if method == 'max':
+        probs = torch.softmax(logits, dim=1)
+        return probs[probs.max(dim=1).values.argmax()]
+    if method == 'attention':
+        top = logits.topk(2, dim=1).values
+        weights = torch.softmax(top[:, 0] - top[:, 1], dim=0)
+        return torch.softmax((weights[:, None] * logits).sum(dim=0), dim=0)
+    raise ValueError(f"Unknown aggregation '{method}'. Choose one of: {', '.join(AGGREGATIONS)}")
+
+
+def _forward(model, windows, pending, batch_size):
+    """Logits per (document, window) in pending, in batches of similar length."""
+    pending = sorted(pending, key=lambda key: len(windows[key[0]][key[1]]))
+    logits = {}
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start:start + batch_size]
+        inputs = pad_encoded([windows[i][w] for i, w in batch], model.tokenizer.pad_token_id)
+        started = time.perf_counter()
+        batch_logits = model.backend.logits(inputs).float()
+        metrics.PREDICT_PHASE.observe(time.perf_counter() - started, phase='forward')
+        metrics.MODEL_BATCH_SIZE.observe(len(batch))
+        logits.update(zip(batch, batch_logits))
+    return logits
+
+
+def classify(texts, aggregation=LONG_DOC_AGGREGATION, window=LONG_DOC_WINDOW_TOKENS, stride=LONG_DOC_STRIDE,
+             max_windows=LONG_DOC_MAX_WINDOWS, min_windows=LONG_DOC_MIN_WINDOWS,
+             early_stop_confidence=LONG_DOC_EARLY_STOP_CONFIDENCE, batch_size=BATCH_API_CHUNK_SIZE):
+    """One Verdict per text (confidence in %), however long the text is."""
+    if aggregation not in AGGREGATIONS:
+        raise ValueError(f"Unknown aggregation '{aggregation}'. Choose one of: {', '.join(AGGREGATIONS)}")
+    model = model_registry.get_model()
+    started = time.perf_counter()
+    windows = split_windows(model.tokenizer, texts, window, stride, max_windows)
+    metrics.PREDICT_PHASE.observe(time.perf_counter() - started, phase='tokenize')
+
+    logits = [[] for _ in texts]
+    probs = [None] * len(texts)
+    active = list(range(len(texts)))
+    first_round = max(1, min_windows)
+    while active:
+        pending = []
+        for i in active:
+            done = len(logits[i])
+            pending.extend((i, w) for w in range(done, min(len(windows[i]), done + max(first_round, done))))
+        results = _forward(model, windows, pending, batch_size)
+        for i, w in pending:
+            logits[i].append(results[i, w])
+
+        still_active = []
+        for i in active:
+            probs[i] = aggregate(torch.stack(logits[i]), aggregation)
+            confident = early_stop_confidence and probs[i].max().item() * 100 >= early_stop_confidence
+            if len(logits[i]) < len(windows[i]) and not confident:
+                still_active.append(i)
+        active = still_active
+
+    verdicts = []
+    for i in range(len(texts)):
+        confidence, prediction = probs[i].max(dim=0)
+        metrics.LONG_DOC_WINDOWS.observe(len(logits[i]))
+        metrics.LONG_DOC_WINDOWS_SKIPPED.inc(len(windows[i]) - len(logits[i]))
+        verdicts.append(Verdict(LABELS[prediction.item()], confidence.item() * 100, model.version,
+                                len(logits[i]), len(windows[i])))
+    return verdicts
+
+
+def predict_documents(texts):
+    """predict_versioned, with texts longer than one window classified by window instead of truncated."""
+    texts = list(texts)
+    tokenizer = model_registry.get_model().tokenizer
+    long = [i for i, text in enumerate(texts) if needs_windows(text, tokenizer=tokenizer)]
+    if not long:
+        return predict_versioned(texts)
+    long_set = set(long)
+    short = [i for i in range(len(texts)) if i not in long_set]
+    results = [None] * len(texts)
+    if short:
+        for i, result in zip(short, predict_versioned([texts[i] for i in short])):
+            results[i] = result
+    for i, verdict in zip(long, classify([texts[i] for i in long])):
+        results[i] = tuple(verdict[:3])
+    return results
@@ -0,0 +1,138 @@
+import argparse
+import time
+
+import storage
+from config import CANDIDATE_DIR
+from logs import configure_logging
+
+
+# 🛠️ Maintenance commands
+#   python manage.py init-db     # create the schema in config.DATABASE
+#   python manage.py migrate     # import auth.db / truthlens.db / feedback.db into it
+#   python manage.py rebuild-fts # rebuild the full-text search index over headlines
+#   python manage.py rebuild-stats # recompute the per-user dashboard statistics
+#   python manage.py replay-journal # commit predictions left in write-behind journals
+#   python manage.py ingest-news [--loop] # fetch and classify live news now (or keep polling)
+#   python manage.py models      # list model bundles and the version being served
+#   python manage.py activate-model VERSION|latest # pin the version every worker serves
+#   python manage.py promote-candidate VERSION # move a feedback fine-tuning candidate into the served bundles
+
+def cmd_init_db(args):
+    storage.init_db()
+
+
+def cmd_migrate(args):
+    storage.init_db()
+    imported = storage.migrate_legacy()
+    for table, count in imported.items():
+        print(f"✅ {table}: {count} rows imported")
+    if not imported:
+        print("No legacy databases found.")
+
+
+def cmd_rebuild_fts(args):
+    storage.init_db()
+    print(f"✅ Search index rebuilt for {storage.rebuild_search_index()} predictions")
+
+
+def cmd_rebuild_stats(args):
+    storage.init_db()
+    print(f"✅ Statistics recomputed for {storage.rebuild_user_stats()} users")
+
+
+def cmd_replay_journal(args):
+    from write_behind import PredictionWriter
+    storage.init_db()
+    print(f"✅ Replayed {PredictionWriter().replay_journals()} journaled predictions")
+
+
+def cmd_ingest_news(args):
+    from news_ingest import NewsIngestor
+    from long_document import predict_documents
+    storage.init_db()
+    ingestor = NewsIngestor(classify=predict_documents)
+    if not ingestor.sources:
+        print("❌ No news sources configured (set TRUTHLENS_NEWS_API_KEY)")
+        return
+    while True:
+        print(f"✅ Stored {ingestor.run_once(force=not args.loop)} new articles")
+        if not args.loop:
+            break
+        time.sleep(min(ingestor.interval, 60))
+
+
+def cmd_models(args):
+    import model_bundles
+    import model_registry
+    serving = model_registry.resolve()
+    bundles = model_bundles.list_bundles()
+    for bundle in bundles:
+        marker = '*' if bundle['version'] == serving.version else ' '
+        accuracy = (bundle.get('metrics') or {}).get('accuracy')
+        print(f"{marker} {bundle['version']}  accuracy={accuracy}  created {bundle['created_at']}")
+    if not bundles:
+        print("No model bundles found.")
+    for candidate in model_bundles.list_bundles(CANDIDATE_DIR):
+        metrics = candidate.get('metrics') or {}
+        print(f"  candidate {candidate['version']}  accuracy={metrics.get('accuracy')} "
+              f"(base {metrics.get('base_accuracy')})  created {candidate['created_at']}")
+    print(f"Serving: {serving.version} (TRUTHLENS_MODEL_VERSION={model_registry.MODEL_VERSION}, "
+          f"ACTIVE={model_bundles.read_active()})")
+
+
+def cmd_activate_model(args):
+    import model_bundles
+    try:
+        model_bundles.set_active(None if args.version == 'latest' else args.version)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return
+    print(f"✅ Active model set to {args.version}; workers switch within TRUTHLENS_MODEL_WATCH_INTERVAL seconds")
+
+
+def cmd_promote_candidate(args):
+    import model_bundles
+    try:
+        path = model_bundles.promote(args.version, CANDIDATE_DIR)
+    except (ValueError, FileExistsError) as e:
+        print(f"❌ {e}")
+        return
+    print(f"✅ Promoted {args.version} to {path}; workers following 'latest' switch to it on their next check")
+
+
+COMMANDS = {
+    'init-db': cmd_init_db,
+    'migrate': cmd_migrate,
+    'rebuild-fts': cmd_rebuild_fts,
+    'rebuild-stats': cmd_rebuild_stats,
+    'replay-journal': cmd_replay_journal,
+    'ingest-news': cmd_ingest_news,
+    'models': cmd_models,
+    'activate-model': cmd_activate_model,
+    'promote-candidate': cmd_promote_candidate,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TruthLens maintenance commands")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('init-db', help="create the database schema")
+    subparsers.add_parser('migrate', help="import the legacy per-table SQLite files")
+    subparsers.add_parser('rebuild-fts', help="rebuild the full-text search index")
+    subparsers.add_parser('rebuild-stats', help="recompute per-user dashboard statistics")
+    subparsers.add_parser('replay-journal', help="commit predictions left in write-behind journals")
+    ingest = subparsers.add_parser('ingest-news', help="fetch and classify live news")
+    ingest.add_argument('--loop', action='store_true',
+                        help="keep polling every NEWS_POLL_INTERVAL seconds (run as a standalone service)")
+    subparsers.add_parser('models', help="list model bundles and the version being served")
+    activate = subparsers.add_parser('activate-model', help="pin the model version served by every worker")
+    activate.add_argument('version', help="bundle version, or 'latest' to follow the newest bundle")
+    promote = subparsers.add_parser('promote-candidate', help="serve a feedback fine-tuning candidate")
+    promote.add_argument('version')
+    args = parser.parse_args()
+    configure_logging()
+    COMMANDS[args.command](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+import bisect
+import glob
+import json
+import logging
+import os
+import threading
+import time
+
+from config import METRICS_DIR, METRICS_EXPORT_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+
+# Request, model and database metrics in the Prometheus text format (/metrics).
+#
+# Counters, gauges and histograms are kept in process memory and updated
+# inline (a lock and an addition per observation). Anything another module
+# already counts, like the prediction cache or the write-behind queue, is read
+# from its stats() at scrape time by a collector instead of being counted twice.
+#
+# gunicorn runs several workers and a scrape reaches only one of them, so every
+# worker also writes its samples to METRICS_DIR/metrics-<pid>.json every
+# METRICS_EXPORT_INTERVAL seconds and /metrics adds up the files of all live
+# workers (counters, histograms and gauges alike: in-flight requests, queue
+# depths and cache entries are per-worker totals). A restarted worker starts
+# its counters from zero again, which Prometheus treats as a counter reset.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+_registry = []
+_collectors = []
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, dict(zip(self.labelnames, key)), value) for key, value in self._values.items()]
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def samples(self):
+        with self._lock:
+            values = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        samples = []
+        for key, counts, total in values:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                samples.append((self.name + '_bucket', {**labels, 'le': _format_value(bound)}, cumulative))
+            samples.append((self.name + '_sum', labels, total))
+            samples.append((self.name + '_count', labels, cumulative))
+        return samples
+
+
+def collector(fn):
+    """Register fn() -> [(name, kind, help, [(labels, value), ...]), ...], called at every scrape."""
+    _collectors.append(fn)
+    return fn
+
+
+# Metrics updated inline by the app, the model and the store
+HTTP_REQUESTS = Counter('truthlens_http_requests_total', 'HTTP requests by route, method and status',
+                        ('route', 'method', 'status'))
+HTTP_LATENCY = Histogram('truthlens_http_request_duration_seconds', 'Time to produce a response, by route',
+                         ('route', 'method'))
+HTTP_IN_PROGRESS = Gauge('truthlens_http_requests_in_progress', 'Requests being handled right now')
+PREDICT_PHASE = Histogram('truthlens_predict_phase_seconds',
+                          'Time spent per prediction phase: tokenize, forward and softmax per model batch, '
+                          'db_write per /predict request', ('phase',))
+MODEL_BATCH_SIZE = Histogram('truthlens_model_batch_size', 'Texts per forward pass', buckets=BATCH_SIZE_BUCKETS)
+LONG_DOC_WINDOWS = Histogram('truthlens_long_document_windows', 'Windows run per document longer than one window',
+                             buckets=BATCH_SIZE_BUCKETS)
+LONG_DOC_WINDOWS_SKIPPED = Counter('truthlens_long_document_windows_skipped_total',
+                                   'Windows of long documents left unrun after an early confident verdict')
+DB_CONNECTION_WAIT = Histogram('truthlens_db_connection_wait_seconds',
+                               'Time to get a pooled SQLite connection (pool) or the write lock (write_lock)',
+                               ('kind',))
+
+
+def families():
+    """This process's metrics as [(name, kind, help, [(sample_name, labels, value), ...]), ...]."""
+    result = [(metric.name, metric.kind, metric.help, metric.samples()) for metric in _registry]
+    for fn in _collectors:
+        try:
+            for name, kind, help, samples in fn():
+                result.append((name, kind, help, [(name, labels, value) for labels, value in samples]))
+        except Exception as e:
+            logger.error("Metrics collector %s failed: %s", fn.__name__, e)
+    return result
+
+
+def merge(*family_lists):
+    """Add up samples with the same name and labels across processes."""
+    merged = {}
+    for family_list in family_lists:
+        for name, kind, help, samples in family_list:
+            entry = merged.setdefault(name, (kind, help, {}))
+            for sample_name, labels, value in samples:
+                key = (sample_name, tuple(sorted(labels.items())))
+                entry[2][key] = entry[2].get(key, 0) + value
+    return [(name, kind, help, [(sample_name, dict(labels), value) for (sample_name, labels), value in values.items()])
+            for name, (kind, help, values) in merged.items()]
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def render(family_list):
+    lines = []
+    for name, kind, help, samples in family_list:
+        lines.append(f'# HELP {name} {_escape(help)}')
+        lines.append(f'# TYPE {name} {kind}')
+        for sample_name, labels, value in samples:
+            label_text = ','.join(f'{key}="{_escape(val)}"' for key, val in labels.items())
+            lines.append(f'{sample_name}{{{label_text}}} {_format_value(value)}' if label_text
+                         else f'{sample_name} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def export(metrics_dir=METRICS_DIR):
+    """Write this process's samples where the other workers' /metrics can read them."""
+    os.makedirs(metrics_dir, exist_ok=True)
+    path = os.path.join(metrics_dir, f'metrics-{os.getpid()}.json')
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump({'families': families(), 'exported_at': time.time()}, f)
+    os.replace(path + '.tmp', path)
+
+
+def read_exports(metrics_dir=METRICS_DIR):
+    """Samples exported by the other live processes; files of exited processes are removed."""
+    family_lists = []
+    for path in glob.glob(os.path.join(metrics_dir, 'metrics-*.json')):
+        try:
+            pid = int(os.path.basename(path)[len('metrics-'):-len('.json')])
+        except ValueError:
+            continue
+        if pid == os.getpid():
+            continue
+        if not _pid_alive(pid):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            continue
+        try:
+            with open(path, encoding='utf-8') as f:
+                family_lists.append([tuple(family) for family in json.load(f)['families']])
+        except (OSError, ValueError, KeyError):
+            continue  # being replaced right now; the next scrape gets it
+    return family_lists
+
+
+def exposition():
+    """The /metrics body: this process live, plus every other worker's last export."""
+    if not METRICS_DIR:
+        return render(families())
+    return render(merge(families(), *read_exports()))
+
+
+_exporter = None
+_exporter_pid = None
+_exporter_lock = threading.Lock()
+
+
+def ensure_exporting(interval=METRICS_EXPORT_INTERVAL):
+    """Start this process's export thread (no-op without METRICS_DIR or with interval 0)."""
+    global _exporter, _exporter_pid
+    if not METRICS_DIR or interval <= 0:
+        return
+    pid = os.getpid()
+    if _exporter is not None and _exporter_pid == pid and _exporter.is_alive():
+        return
+    with _exporter_lock:
+        if _exporter is not None and _exporter_pid == pid and _exporter.is_alive():
+            return
+        _exporter_pid = pid
+        _exporter = threading.Thread(target=_export_loop, args=(interval,), name='truthlens-metrics-export',
+                                     daemon=True)
+        _exporter.start()
+
+
+def _export_loop(interval):
+    while True:
+        try:
+            export()
+        except Exception as e:
+            logger.error("Metrics export failed: %s", e)
+        time.sleep(interval)
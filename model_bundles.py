@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime
+
+from config import BUNDLE_DIR
+
+
+# Versioned model bundles: one directory per trained model under BUNDLE_DIR,
+#
+#   models/bundles/20260101-120000/
+#       model/          save_pretrained() output
+#       tokenizer/      tokenizer files
+#       manifest.json   version, metrics, training parameters, checksum
+#       optimized/      int8 / ONNX artifacts from convert_model.py --bundle
+#                       (derived files, left out of the checksum)
+#
+# A bundle is built in a hidden temporary directory and renamed into place, so
+# anything watching BUNDLE_DIR only ever sees complete bundles. The optional
+# BUNDLE_DIR/ACTIVE file names the version to serve instead of the newest one.
+
+MANIFEST = 'manifest.json'
+OPTIMIZED = 'optimized'
+ACTIVE = 'ACTIVE'
+
+
+def new_version():
+    return datetime.utcnow().strftime('%Y%m%d-%H%M%S')
+
+
+def directory_checksum(path):
+    """sha256 over every file's relative path and contents, manifest and optimized/ excluded."""
+    digest = hashlib.sha256()
+    for root, dirs, names in os.walk(path):
+        if root == path and OPTIMIZED in dirs:
+            dirs.remove(OPTIMIZED)
+        dirs.sort()
+        for name in sorted(names):
+            full_path = os.path.join(root, name)
+            relative = os.path.relpath(full_path, path).replace(os.sep, '/')
+            if relative == MANIFEST:
+                continue
+            digest.update(relative.encode('utf-8') + b'\0')
+            with open(full_path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(block)
+    return digest.hexdigest()
+
+
+def write_bundle(model, tokenizer, metrics, params=None, version=None, bundle_dir=BUNDLE_DIR):
+    """Save a model and tokenizer as a new bundle and return its path."""
+    version = version or new_version()
+    final_path = os.path.join(bundle_dir, version)
+    if os.path.exists(final_path):
+        raise FileExistsError(f"Bundle {version} already exists in {bundle_dir}")
+    tmp_path = os.path.join(bundle_dir, f'.{version}.tmp')
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    model.save_pretrained(os.path.join(tmp_path, 'model'))
+    tokenizer.save_pretrained(os.path.join(tmp_path, 'tokenizer'))
+    manifest = {
+        'version': version,
+        'created_at': datetime.utcnow().isoformat() + 'Z',
+        'metrics': metrics,
+        'params': params or {},
+        'checksum': directory_checksum(tmp_path),
+    }
+    with open(os.path.join(tmp_path, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, final_path)
+    return final_path
+
+
+def read_manifest(path):
+    with open(os.path.join(path, MANIFEST), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def verify_bundle(path):
+    """True when the bundle's files still match the checksum in its manifest."""
+    try:
+        return read_manifest(path)['checksum'] == directory_checksum(path)
+    except (OSError, ValueError, KeyError):
+        return False
+
+
+def list_bundles(bundle_dir=BUNDLE_DIR):
+    """Manifests of all complete bundles, oldest first, each with its 'path' added."""
+    if not os.path.isdir(bundle_dir):
+        return []
+    bundles = []
+    for name in sorted(os.listdir(bundle_dir)):
+        path = os.path.join(bundle_dir, name)
+        if name.startswith('.') or not os.path.isfile(os.path.join(path, MANIFEST)):
+            continue
+        try:
+            manifest = read_manifest(path)
+        except (OSError, ValueError):
+            continue
+        manifest['path'] = path
+        bundles.append(manifest)
+    return bundles
+
+
+def latest_bundle(bundle_dir=BUNDLE_DIR):
+    bundles = list_bundles(bundle_dir)
+    return bundles[-1] if bundles else None
+
+
+def find_bundle(version, bundle_dir=BUNDLE_DIR):
+    """Manifest (with 'path') of a bundle version, or None."""
+    path = os.path.join(bundle_dir, version)
+    if version.startswith('.') or os.path.basename(os.path.normpath(path)) != version or \
+            not os.path.isfile(os.path.join(path, MANIFEST)):
+        return None
+    manifest = read_manifest(path)
+    manifest['path'] = path
+    return manifest
+
+
+def promote(version, from_dir, bundle_dir=BUNDLE_DIR):
+    """Move a verified bundle (e.g. a fine-tuning candidate) into bundle_dir, where the app picks it up."""
+    manifest = find_bundle(version, from_dir)
+    if manifest is None:
+        raise ValueError(f"Unknown model bundle '{version}' in {from_dir}")
+    if not verify_bundle(manifest['path']):
+        raise ValueError(f"Bundle {version} does not match its manifest checksum")
+    target = os.path.join(bundle_dir, version)
+    if os.path.exists(target):
+        raise FileExistsError(f"Bundle {version} already exists in {bundle_dir}")
+    os.makedirs(bundle_dir, exist_ok=True)
+    # Rename into place so the watcher never sees a half-copied bundle
+    os.replace(manifest['path'], target)
+    return target
+
+
+def read_active(bundle_dir=BUNDLE_DIR):
+    try:
+        with open(os.path.join(bundle_dir, ACTIVE), encoding='utf-8') as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def set_active(version, bundle_dir=BUNDLE_DIR):
+    """Pin the served version for every worker (None goes back to the newest bundle)."""
+    path = os.path.join(bundle_dir, ACTIVE)
+    if version is None:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    if find_bundle(version, bundle_dir) is None:
+        raise ValueError(f"Unknown model bundle '{version}'")
+    tmp_path = f'{path}.tmp-{os.getpid()}'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(version + '\n')
+    os.replace(tmp_path, path)
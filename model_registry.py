@@ -0,0 +1,322 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+import model_bundles
+from config import (BERT_MODEL_DIR, BERT_TOKENIZER_DIR, OPTIMIZED_MODEL_DIR, INFERENCE_BACKEND, MODEL_VERSION,
+                    MODEL_WATCH_INTERVAL)
+from prediction_cache import model_fingerprint
+
+logger = logging.getLogger(__name__)
+
+
+# Single place where model artifacts are loaded. The live model (tokenizer,
+# inference backend and version) is loaded at most once per process, lazily on
+# first use or ahead of time with preload(), and is shared by the Flask app and
+# the predict_bert.py CLI.
+#
+# reload() loads another version next to the live one, warms it up with sample
+# inputs and then replaces the live reference in a single assignment. Callers
+# take the reference once per batch (get_model()), so batches already running
+# finish on the old model and no request is dropped; the old model is freed
+# once the last of them returns.
+
+WARMUP_TEXTS = [
+    "Breaking: scientists confirm water found on the moon",
+    "The governor said the new budget cuts taxes for every family in the state while increasing school funding",
+    "Senator claims unemployment fell to its lowest level in fifty years after the stimulus bill passed last spring, "
+    "a figure economists dispute",
+]
+
+
+class ModelSource:
+    """Where a model version lives on disk. Resolving a source does not load anything."""
+
+    def __init__(self, version, model_dir, tokenizer_dir, optimized_dir, manifest=None):
+        self.version = version
+        self.model_dir = model_dir
+        self.tokenizer_dir = tokenizer_dir
+        self.optimized_dir = optimized_dir
+        self.manifest = manifest
+
+    @classmethod
+    def local(cls):
+        return cls('local', BERT_MODEL_DIR, BERT_TOKENIZER_DIR, OPTIMIZED_MODEL_DIR)
+
+    @classmethod
+    def bundle(cls, manifest):
+        path = manifest['path']
+        return cls(manifest['version'], os.path.join(path, 'model'), os.path.join(path, 'tokenizer'),
+                   os.path.join(path, model_bundles.OPTIMIZED), manifest)
+
+    def fingerprint(self):
+        """Prediction cache fingerprint: backend plus the files this version's predictions depend on."""
+        from inference_backends import backend_artifacts
+        return INFERENCE_BACKEND + '-' + model_fingerprint(self.model_dir, self.tokenizer_dir,
+                                                           *backend_artifacts(INFERENCE_BACKEND, self.optimized_dir))
+
+
+class LoadedModel:
+    def __init__(self, source, tokenizer, backend):
+        from encoding import Encoder
+        self.source = source
+        self.version = source.version
+        self.fingerprint = source.fingerprint()
+        self.tokenizer = tokenizer
+        self.encoder = Encoder(tokenizer)
+        self.backend = backend
+        self.loaded_at = time.time()
+
+
+def resolve(version=None):
+    """The source for a version spec: "latest", "local" or a bundle version (default: MODEL_VERSION).
+
+    Raises ValueError for a bundle version that does not exist.
+    """
+    version = version or MODEL_VERSION
+    if version == 'local':
+        return ModelSource.local()
+    if version == 'latest':
+        active = model_bundles.read_active()
+        manifest = (model_bundles.find_bundle(active) if active else None) or model_bundles.latest_bundle()
+        return ModelSource.bundle(manifest) if manifest else ModelSource.local()
+    manifest = model_bundles.find_bundle(version)
+    if manifest is None:
+        raise ValueError(f"Unknown model version '{version}'")
+    return ModelSource.bundle(manifest)
+
+
+def warm_up(model):
+    """Run sample batches through a freshly loaded model so the first real requests do not pay for it."""
+    import torch
+    for texts in ([WARMUP_TEXTS[0]], WARMUP_TEXTS):
+        with model.encoder.batch(texts) as inputs:
+            logits = model.backend.logits(inputs)
+        if not torch.isfinite(logits).all():
+            raise ValueError(f"Model {model.version} produced non-finite logits during warm-up")
+
+
+_current = None
+_lock = threading.Lock()
+_watch_lock = threading.Lock()
+_listeners = []
+_load_stats = {}
+_failed = {}
+_swaps = deque(maxlen=20)
+_reloading = None
+_watcher = None
+_watcher_pid = None
+
+
+def rss_bytes():
+    """Current resident set size of this process."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        # Not Linux: fall back to the peak RSS, which is the best available figure
+        import resource
+        import sys
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return usage if sys.platform == 'darwin' else usage * 1024
+
+
+def _load(source, warm=True):
+    from inference_backends import load_backend
+    from transformers import DistilBertTokenizerFast
+
+    if source.manifest is not None and not model_bundles.verify_bundle(source.manifest['path']):
+        raise ValueError(f"Bundle {source.version} does not match its manifest checksum")
+    _load_stats[source.version] = {'status': 'loading'}
+    rss_before = rss_bytes()
+    started = time.perf_counter()
+    try:
+        model = LoadedModel(source, DistilBertTokenizerFast.from_pretrained(source.tokenizer_dir),
+                            load_backend(INFERENCE_BACKEND, source.model_dir, source.optimized_dir))
+        loaded = time.perf_counter()
+        if warm:
+            warm_up(model)
+    except Exception as e:
+        _load_stats[source.version] = {'status': 'error', 'error': str(e)}
+        raise
+    _load_stats[source.version] = {
+        'status': 'loaded',
+        'load_seconds': round(loaded - started, 3),
+        'warmup_seconds': round(time.perf_counter() - loaded, 3),
+        'rss_delta_mb': round((rss_bytes() - rss_before) / 2 ** 20, 1),
+        'loaded_at': model.loaded_at,
+    }
+    logger.info("Loaded model %s in %ss (+%s MB RSS)", source.version, _load_stats[source.version]['load_seconds'],
+                _load_stats[source.version]['rss_delta_mb'])
+    return model
+
+
+def _swap(model):
+    global _current
+    previous = _current
+    _current = model
+    _failed.pop(model.version, None)
+    _swaps.append({'from': previous.version if previous else None, 'to': model.version, 'at': time.time()})
+    for listener in _listeners:
+        try:
+            listener(model, previous)
+        except Exception as e:
+            logger.error("Model swap listener failed: %s", e)
+
+
+def on_swap(listener):
+    """Call listener(new_model, previous_model) whenever the live model changes (including the first load)."""
+    _listeners.append(listener)
+    return listener
+
+
+def get_model():
+    """The live model, loading the configured version on first use."""
+    model = _current
+    if model is not None:
+        return model
+    with _lock:
+        if _current is None:
+            # Nothing is being served yet, so skip the warm-up and let the first requests through sooner
+            _swap(_load(resolve(), warm=False))
+        return _current
+
+
+def get_backend():
+    """The configured inference backend (see INFERENCE_BACKEND in config.py) of the live model."""
+    return get_model().backend
+
+
+def get_tokenizer():
+    return get_model().tokenizer
+
+
+def current_model():
+    """The live model, or None before it has been loaded (unlike get_model, never loads it)."""
+    return _current
+
+
+def current_version():
+    """Version of the live model, or None before it has been loaded."""
+    return _current.version if _current is not None else None
+
+
+def reload(version=None, background=True):
+    """Load a version (default: what MODEL_VERSION resolves to now), warm it up and make it live.
+
+    Returns the live version, or with background=True the thread doing the work.
+    Raises ValueError for an unknown version.
+    """
+    source = resolve(version)
+    if not background:
+        return _reload(source)
+
+    def run():
+        try:
+            _reload(source)
+        except Exception as e:
+            logger.error("Reloading model %s failed: %s", source.version, e)
+
+    thread = threading.Thread(target=run, name='truthlens-model-reload', daemon=True)
+    thread.start()
+    return thread
+
+
+def _reload(source):
+    global _reloading
+    with _lock:
+        if _current is not None and _current.version == source.version and \
+                _current.fingerprint == source.fingerprint():
+            return _current.version
+        _reloading = source.version
+        try:
+            model = _load(source)
+        except Exception as e:
+            _failed[source.version] = str(e)
+            raise
+        finally:
+            _reloading = None
+        _swap(model)
+        logger.info("Now serving model %s", model.version)
+        return model.version
+
+
+def check_for_update():
+    """Reload when MODEL_VERSION now resolves to a different version than the live one."""
+    if _current is None or _reloading is not None:
+        return None  # the first use loads whatever is current then
+    source = resolve()
+    if source.version == _current.version or source.version in _failed:
+        return None
+    return _reload(source)
+
+
+def ensure_watching(interval=MODEL_WATCH_INTERVAL):
+    """Start this process's watch thread for new bundles / a changed ACTIVE version (no-op when interval is 0)."""
+    global _watcher, _watcher_pid
+    if interval <= 0:
+        return
+    pid = os.getpid()
+    if _watcher is not None and _watcher_pid == pid and _watcher.is_alive():
+        return
+    with _watch_lock:
+        if _watcher is not None and _watcher_pid == pid and _watcher.is_alive():
+            return
+        _watcher_pid = pid
+        _watcher = threading.Thread(target=_watch, args=(interval,), name='truthlens-model-watch', daemon=True)
+        _watcher.start()
+
+
+def _watch(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            check_for_update()
+        except Exception as e:
+            logger.error("Model watch error: %s", e)
+
+
+def preload(background=False):
+    """Load the model now, or in a daemon thread when background=True."""
+    def load_all():
+        try:
+            get_model()
+        except Exception as e:
+            logger.error("Failed to load model: %s", e)
+
+    if not background:
+        load_all()
+        return None
+    thread = threading.Thread(target=load_all, name='truthlens-model-preload', daemon=True)
+    thread.start()
+    return thread
+
+
+def is_loaded():
+    return _current is not None
+
+
+def encoding_stats():
+    """Token id cache and buffer pool figures of the live model (None until one is loaded)."""
+    model = _current
+    return model.encoder.stats() if model else None
+
+
+def stats():
+    model = _current
+    return {
+        'inference_backend': INFERENCE_BACKEND,
+        'configured_version': MODEL_VERSION,
+        'process_rss_mb': round(rss_bytes() / 2 ** 20, 1),
+        'version': model.version if model else None,
+        'fingerprint': model.fingerprint if model else None,
+        'metrics': (model.source.manifest or {}).get('metrics') if model else None,
+        'reloading': _reloading,
+        'failed': dict(_failed),
+        'watching': bool(_watcher and _watcher_pid == os.getpid() and _watcher.is_alive()),
+        'loads': {version: dict(entry) for version, entry in _load_stats.items()},
+        'swaps': list(_swaps),
+        'encoding': encoding_stats(),
+    }
@@ -0,0 +1,359 @@
+import asyncio
+import functools
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import storage
+from config import (DATABASE, NEWS_API_KEY, NEWS_API_URL, NEWS_API_COUNTRY, NEWS_POLL_INTERVAL,
+                    NEWS_FETCH_TIMEOUT, NEWS_CLASSIFY_FULL_TEXT, BATCH_API_CHUNK_SIZE)
+from prediction_cache import normalize_headline
+
+logger = logging.getLogger(__name__)
+
+
+# Background ingestion for /live-news. Each source is polled on a schedule over
+# one pooled HTTP session with conditional requests (ETag / Last-Modified), new
+# articles are deduplicated by URL and title hash, classified in batches and
+# stored in news_articles, which is what /live-news renders.
+#
+# A source is any object with a `name` and a
+# `fetch(session, etag=None, last_modified=None)` method returning a FetchResult.
+# Under asgi.py the poller is an asyncio task instead of a thread, and sources
+# that also have `async afetch(client, etag=None, last_modified=None)` are
+# fetched over a shared httpx.AsyncClient without holding a thread.
+
+class FetchResult:
+    def __init__(self, articles=None, etag=None, last_modified=None, not_modified=False):
+        self.articles = articles or []
+        self.etag = etag
+        self.last_modified = last_modified
+        self.not_modified = not_modified
+
+
+class NewsAPISource:
+    """NewsAPI top headlines, or any server answering with the same JSON shape."""
+
+    def __init__(self, url=NEWS_API_URL, api_key=NEWS_API_KEY, country=NEWS_API_COUNTRY, page_size=100,
+                 name='newsapi', timeout=NEWS_FETCH_TIMEOUT):
+        self.url = url
+        self.api_key = api_key
+        self.country = country
+        self.page_size = page_size
+        self.name = name
+        self.timeout = timeout
+
+    def _request(self, etag, last_modified):
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        params = {'language': 'en', 'country': self.country, 'pageSize': self.page_size, 'sortBy': 'publishedAt'}
+        if self.api_key:
+            headers['X-Api-Key'] = self.api_key
+        return params, headers
+
+    def fetch(self, session, etag=None, last_modified=None):
+        params, headers = self._request(etag, last_modified)
+        response = session.get(self.url, params=params, headers=headers, timeout=self.timeout)
+        return self._result(response, etag, last_modified)
+
+    async def afetch(self, client, etag=None, last_modified=None):
+        """fetch() over an httpx.AsyncClient, for the poller running on an event loop (asgi.py)."""
+        params, headers = self._request(etag, last_modified)
+        response = await client.get(self.url, params=params, headers=headers, timeout=self.timeout)
+        return self._result(response, etag, last_modified)
+
+    def _result(self, response, etag, last_modified):
+        # requests and httpx responses alike
+        if response.status_code == 304:
+            return FetchResult(etag=etag, last_modified=last_modified, not_modified=True)
+        data = response.json()
+        if response.status_code != 200:
+            raise RuntimeError(data.get('message', f'HTTP {response.status_code}'))
+        return FetchResult([self.parse_article(article) for article in data.get('articles', [])],
+                           etag=response.headers.get('ETag'),
+                           last_modified=response.headers.get('Last-Modified'))
+
+    @staticmethod
+    def parse_article(article):
+        return {
+            'title': (article.get('title') or '').strip(),
+            'description': (article.get('description') or '').strip() or None,
+            # NewsAPI cuts the text short and appends "[+1234 chars]"
+            'content': re.sub(r'\s*\[\+\d+ chars\]$', '', (article.get('content') or '').strip()) or None,
+            'url': article.get('url'),
+            'image_url': article.get('urlToImage'),
+            'published_at': article.get('publishedAt'),
+            'source_name': (article.get('source') or {}).get('name') or 'Unknown Source',
+        }
+
+
+def default_sources():
+    """Sources enabled by config.py; NewsAPI needs TRUTHLENS_NEWS_API_KEY."""
+    return [NewsAPISource()] if NEWS_API_KEY else []
+
+
+def make_session(pool_size=10, retries=2):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                          max_retries=Retry(total=retries, backoff_factor=0.5,
+                                            status_forcelist=(502, 503, 504), allowed_methods=['GET']))
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['User-Agent'] = 'TruthLens/1.0'
+    return session
+
+
+def article_text(article):
+    """What gets classified: the title, or with NEWS_CLASSIFY_FULL_TEXT everything the source returned."""
+    if not NEWS_CLASSIFY_FULL_TEXT:
+        return article['title']
+    return '\n'.join(part for part in (article['title'], article.get('description'), article.get('content')) if part)
+
+
+def _hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def article_keys(article):
+    """(url_hash, title_hash); articles without a URL are keyed on their title alone."""
+    title_hash = _hash(normalize_headline(article['title']))
+    url = (article.get('url') or '').strip()
+    return (_hash(url) if url else title_hash), title_hash
+
+
+class NewsIngestor:
+    def __init__(self, classify, sources=None, interval=NEWS_POLL_INTERVAL, batch_size=BATCH_API_CHUNK_SIZE,
+                 db_path=DATABASE):
+        """classify takes a list of texts and returns one (label, confidence, model_version) per text."""
+        self.classify = classify
+        self.sources = default_sources() if sources is None else list(sources)
+        self.interval = interval
+        self.batch_size = max(1, int(batch_size))
+        self.db_path = db_path
+
+        self._lock = threading.Lock()
+        self._session = None
+        self._session_pid = None
+        self._worker = None
+        self._worker_pid = None
+        self._task_pid = None
+
+        # Metrics
+        self._runs = 0
+        self._fetched = 0
+        self._not_modified = 0
+        self._duplicates = 0
+        self._stored = 0
+        self._errors = 0
+        self._last_run = None
+
+    @property
+    def session(self):
+        # A pooled session per process: its sockets must not be shared with forked workers
+        if self._session is None or self._session_pid != os.getpid():
+            self._session = make_session(pool_size=max(1, len(self.sources)))
+            self._session_pid = os.getpid()
+        return self._session
+
+    def ensure_started(self):
+        """Start the polling thread in this process (no-op without sources or with arun() running)."""
+        pid = os.getpid()
+        if not self.sources or self._task_pid == pid:
+            return
+        if self._worker is not None and self._worker_pid == pid and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker_pid == pid and self._worker.is_alive():
+                return
+            self._worker_pid = pid
+            self._worker = threading.Thread(target=self._run, name='truthlens-news-ingest', daemon=True)
+            self._worker.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                self._errors += 1
+                logger.error("News ingestion error: %s", e)
+            time.sleep(min(self.interval, 60))
+
+    def _claim(self, conn, source, force):
+        """Take the polling lease for a source; only one process polls it per interval."""
+        now = time.time()
+        conn.execute('INSERT OR IGNORE INTO news_sources (name) VALUES (?)', (source.name,))
+        claimed = conn.execute('''UPDATE news_sources SET last_polled_at = ?
+                                  WHERE name = ? AND (? OR last_polled_at <= ?)''',
+                               (now, source.name, force, now - self.interval)).rowcount
+        row = conn.execute('SELECT etag, last_modified FROM news_sources WHERE name = ?', (source.name,)).fetchone()
+        conn.commit()
+        return row if claimed else None
+
+    def _claim_due(self, conn, force):
+        due = []
+        for source in self.sources:
+            validators = self._claim(conn, source, force)
+            if validators is not None:
+                due.append((source, validators))
+        return due
+
+    def run_once(self, force=False):
+        """Poll every due source in parallel and store new articles. Returns the number stored."""
+        conn = storage.connect(self.db_path)
+        try:
+            due = self._claim_due(conn, force)
+            if not due:
+                return 0
+            with ThreadPoolExecutor(max_workers=len(due)) as pool:
+                futures = [(source, pool.submit(source.fetch, self.session, validators['etag'],
+                                                validators['last_modified']))
+                           for source, validators in due]
+            return self._store_fetched(conn, [(source, future.exception() or future.result())
+                                              for source, future in futures])
+        finally:
+            self._runs += 1
+            self._last_run = time.time()
+            conn.close()
+
+    async def arun_once(self, client, force=False):
+        """run_once() on an event loop: sources are fetched concurrently over client (an
+        httpx.AsyncClient); database work and classification run in the default executor."""
+        loop = asyncio.get_running_loop()
+        conn = await loop.run_in_executor(None, functools.partial(storage.connect, self.db_path,
+                                                                  check_same_thread=False))
+        try:
+            due = await loop.run_in_executor(None, self._claim_due, conn, force)
+            if not due:
+                return 0
+            outcomes = await asyncio.gather(*(self._afetch(client, source, validators) for source, validators in due),
+                                            return_exceptions=True)
+            return await loop.run_in_executor(None, self._store_fetched, conn,
+                                              [(source, outcome) for (source, _), outcome in zip(due, outcomes)])
+        finally:
+            self._runs += 1
+            self._last_run = time.time()
+            conn.close()
+
+    async def _afetch(self, client, source, validators):
+        if hasattr(source, 'afetch'):
+            return await source.afetch(client, validators['etag'], validators['last_modified'])
+        # Sources without an asyncio fetch still run in a thread
+        return await asyncio.get_running_loop().run_in_executor(None, source.fetch, self.session,
+                                                                validators['etag'], validators['last_modified'])
+
+    async def arun(self, client):
+        """The polling loop as an asyncio task; ensure_started() then leaves this process alone."""
+        self._task_pid = os.getpid()
+        try:
+            while True:
+                try:
+                    await self.arun_once(client)
+                except Exception as e:
+                    self._errors += 1
+                    logger.error("News ingestion error: %s", e)
+                await asyncio.sleep(min(self.interval, 60))
+        finally:
+            self._task_pid = None
+
+    def _store_fetched(self, conn, fetched):
+        """Record each source's outcome, a FetchResult or the exception its fetch raised, and store new articles."""
+        stored = 0
+        for source, result in fetched:
+            if isinstance(result, BaseException):
+                self._errors += 1
+                logger.warning("Fetching %s failed: %s", source.name, result)
+                conn.execute('UPDATE news_sources SET last_status = ?, last_error = ? WHERE name = ?',
+                             ('error', str(result), source.name))
+                conn.commit()
+                continue
+            if result.not_modified:
+                self._not_modified += 1
+                status = 'not modified'
+            else:
+                new = self.store(conn, source, result.articles)
+                stored += new
+                status = f'{len(result.articles)} fetched, {new} new'
+            conn.execute('''UPDATE news_sources SET etag = ?, last_modified = ?, last_status = ?, last_error = NULL
+                            WHERE name = ?''', (result.etag, result.last_modified, status, source.name))
+            conn.commit()
+            logger.info("News source %s: %s", source.name, status)
+        return stored
+
+    def store(self, conn, source, articles):
+        """Classify articles not seen before, in batches, and insert them."""
+        articles = [a for a in articles if len(a['title']) > 5 and a['title'] != '[Removed]']
+        self._fetched += len(articles)
+
+        new, seen = [], set()
+        for article in articles:
+            keys = article_keys(article)
+            if keys[0] in seen or keys[1] in seen:
+                continue
+            seen.update(keys)
+            new.append((keys, article))
+        if new:
+            # Drop articles already stored before spending model time on them
+            known = set()
+            for start in range(0, len(new), 400):
+                chunk = [key for keys, _ in new[start:start + 400] for key in keys]
+                placeholders = ','.join('?' * len(chunk))
+                known.update(row[0] for row in conn.execute(
+                    f'''SELECT url_hash FROM news_articles WHERE url_hash IN ({placeholders})
+                        UNION SELECT title_hash FROM news_articles WHERE title_hash IN ({placeholders})''',
+                    chunk + chunk))
+            new = [(keys, article) for keys, article in new if keys[0] not in known and keys[1] not in known]
+        self._duplicates += len(articles) - len(new)
+
+        stored = 0
+        fetched_at = (datetime.utcnow() + timedelta(hours=5, minutes=30)).isoformat()
+        for start in range(0, len(new), self.batch_size):
+            batch = new[start:start + self.batch_size]
+            verdicts = self.classify([article_text(article) for _, article in batch])
+            cursor = conn.executemany(
+                '''INSERT OR IGNORE INTO news_articles
+                   (url_hash, title_hash, source, source_name, title, description, url, image_url, published_at,
+                    fetched_at, prediction, confidence, model_version)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                [(keys[0], keys[1], source.name, article['source_name'], article['title'], article['description'],
+                  article['url'], article['image_url'], article['published_at'], fetched_at, label, confidence,
+                  model_version)
+                 for (keys, article), (label, confidence, model_version) in zip(batch, verdicts)])
+            conn.commit()
+            stored += cursor.rowcount
+        self._stored += stored
+        return stored
+
+    def stats(self):
+        return {
+            'sources': [source.name for source in self.sources],
+            'interval_seconds': self.interval,
+            'running': self._task_pid == os.getpid() or bool(self._worker and self._worker_pid == os.getpid()
+                                                             and self._worker.is_alive()),
+            'runs': self._runs,
+            'fetched': self._fetched,
+            'not_modified': self._not_modified,
+            'duplicates': self._duplicates,
+            'stored': self._stored,
+            'errors': self._errors,
+            'last_run': self._last_run,
+        }
+
+
+LATEST_ARTICLES_QUERY = '''SELECT title, description, url, image_url, published_at, source_name, prediction, confidence
+                           FROM news_articles ORDER BY published_at DESC, id DESC LIMIT ?'''
+
+
+def latest_articles(conn, limit):
+    return conn.execute(LATEST_ARTICLES_QUERY, (limit,)).fetchall()
@@ -1,20 +1,72 @@
-from transformers import DistilBertTokenizerFast, DistilBertForSequenceClassification
+import time
+from contextlib import nullcontext
+
 import torch
+import metrics
+import model_registry
+
+# Tokenizer and inference backend are loaded once, on first use, by the shared model registry
+
+LABELS = {0: "FAKE", 1: "REAL"}
+
+# FUNCTION to predict a list of news texts in one forward pass
+# (with_version=True adds the version of the model that produced each result)
+def predict_batch(texts, max_length=512, with_version=False):
+    # One reference for the whole batch, even if a new model version is swapped in meanwhile
+    model = model_registry.get_model()
+    started = time.perf_counter()
+    if max_length == model.encoder.max_length:
+        # Cached token ids in pooled buffers, returned to the pool after the forward pass
+        encoded = model.encoder.batch(texts)
+    else:
+        encoded = nullcontext(model.tokenizer(list(texts), return_tensors="pt", padding="longest", truncation=True,
+                                              max_length=max_length))
+    with encoded as inputs:
+        tokenized = time.perf_counter()
+        logits = model.backend.logits(inputs)
+        batch_size = len(inputs['input_ids'])
+    forwarded = time.perf_counter()
+    probs = torch.nn.functional.softmax(logits, dim=1)
+    confidences, predictions = probs.max(dim=1)
+    metrics.PREDICT_PHASE.observe(tokenized - started, phase='tokenize')
+    metrics.PREDICT_PHASE.observe(forwarded - tokenized, phase='forward')
+    metrics.PREDICT_PHASE.observe(time.perf_counter() - forwarded, phase='softmax')
+    metrics.MODEL_BATCH_SIZE.observe(batch_size)
+    if with_version:
+        return [(LABELS[prediction], confidence * 100, model.version)
+                for prediction, confidence in zip(predictions.tolist(), confidences.tolist())]
+    return [(LABELS[prediction], confidence * 100)
+            for prediction, confidence in zip(predictions.tolist(), confidences.tolist())]
+
+# FUNCTION to build model inputs from already-tokenized id lists, padded to the longest one
+def pad_encoded(id_lists, pad_token_id):
+    width = max(len(ids) for ids in id_lists)
+    inputs = {'input_ids': torch.full((len(id_lists), width), pad_token_id, dtype=torch.long),
+              'attention_mask': torch.zeros((len(id_lists), width), dtype=torch.long)}
+    for row, ids in enumerate(id_lists):
+        inputs['input_ids'][row, :len(ids)] = torch.tensor(ids)
+        inputs['attention_mask'][row, :len(ids)] = 1
+    return inputs
+
+def predict_versioned(texts):
+    """predict_batch returning (label, confidence, model_version) per text."""
+    return predict_batch(texts, with_version=True)
 
-# Load model/tokenizer
-model = DistilBertForSequenceClassification.from_pretrained("./bert_model")
-tokenizer = DistilBertTokenizerFast.from_pretrained("./bert_tokenizer")
-model.eval()
+# FUNCTION to predict any iterable of texts, batch_size texts per forward pass
+def predict_news_batch(texts, batch_size=32):
+    batch = []
+    for text in texts:
+        batch.append(text)
+        if len(batch) == batch_size:
+            yield from predict_batch(batch)
+            batch = []
+    if batch:
+        yield from predict_batch(batch)
 
 # FUNCTION to predict news
 def predict_news(text):
-    inputs = tokenizer(text, return_tensors="pt", padding=True, truncation=True, max_length=512)
-    with torch.no_grad():
-        outputs = model(**inputs)
-    probs = torch.nn.functional.softmax(outputs.logits, dim=1)
-    confidence = float(probs.max()) * 100
-    prediction = torch.argmax(probs, dim=1).item()
-    label = "REAL ✅" if prediction == 1 else "FAKE ❌"
+    label, confidence = predict_batch([text])[0]
+    label = "REAL ✅" if label == "REAL" else "FAKE ❌"
     return label, round(confidence, 2)
 
 # 🧪 Test
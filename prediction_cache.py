@@ -0,0 +1,170 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_headline(text):
+    """Headlines differing only in case or whitespace share a cache entry."""
+    return ' '.join(str(text).lower().split())
+
+
+def model_fingerprint(*paths):
+    """Hash file names, sizes and modification times of the model artifacts.
+
+    Retraining rewrites the files under bert_model/, which changes the fingerprint and
+    with it every cache key, so stale predictions are never served. Paths may be
+    directories or single files; missing paths are skipped.
+    """
+    digest = hashlib.sha256()
+    for path in paths:
+        if os.path.isfile(path):
+            files = [path]
+        else:
+            files = []
+            for root, dirs, names in os.walk(path, followlinks=True):
+                dirs.sort()
+                files.extend(os.path.join(root, name) for name in sorted(names))
+        for full_path in files:
+            stat = os.stat(full_path)
+            digest.update(f'{full_path}:{stat.st_size}:{stat.st_mtime_ns};'.encode())
+    return digest.hexdigest()[:16]
+
+
+# Two-tier prediction cache: an in-process LRU with TTL, optionally backed by
+# an SQLite table so cached verdicts survive restarts. Values are
+# (prediction, confidence, model_version) tuples.
+class PredictionCache:
+    def __init__(self, fingerprint, max_size=10000, ttl=86400, db_path=None, db_ttl=7 * 86400):
+        self.fingerprint = fingerprint
+        self.max_size = max_size
+        self.ttl = ttl
+        self.db_path = db_path
+        self.db_ttl = db_ttl
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+        self.hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        if self.db_path:
+            self._init_db()
+
+    def _db(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=5)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _init_db(self):
+        conn = self._db()
+        conn.execute('''CREATE TABLE IF NOT EXISTS prediction_cache
+                        (key TEXT PRIMARY KEY,
+                         fingerprint TEXT NOT NULL,
+                         prediction TEXT NOT NULL,
+                         confidence REAL NOT NULL,
+                         created_at REAL NOT NULL,
+                         model_version TEXT)''')
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(prediction_cache)')]
+        if 'model_version' not in columns:
+            # Entries from before versioned models cannot say which model produced them
+            conn.execute('DELETE FROM prediction_cache')
+            conn.execute('ALTER TABLE prediction_cache ADD COLUMN model_version TEXT')
+        # Entries written by any other model version can never be hit again
+        conn.execute('DELETE FROM prediction_cache WHERE fingerprint != ? OR created_at < ?',
+                     (self.fingerprint, time.time() - self.db_ttl))
+        conn.commit()
+
+    def key(self, text):
+        return hashlib.sha256(f'{self.fingerprint}:{normalize_headline(text)}'.encode()).hexdigest()
+
+    def get(self, text):
+        """Return the cached (prediction, confidence, model_version) for a headline, or None."""
+        key = self.key(text)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+
+        if self.db_path:
+            try:
+                row = self._db().execute('''SELECT prediction, confidence, model_version, created_at
+                                            FROM prediction_cache WHERE key = ?''', (key,)).fetchone()
+            except sqlite3.Error as e:
+                logger.warning("Prediction cache read error: %s", e)
+                row = None
+            if row and row[3] + self.db_ttl > now:
+                value = (row[0], row[1], row[2])
+                self._remember(key, value, now)
+                with self._lock:
+                    self.persistent_hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, text, value):
+        key = self.key(text)
+        now = time.time()
+        self._remember(key, value, now)
+        if self.db_path:
+            try:
+                conn = self._db()
+                conn.execute('''INSERT OR REPLACE INTO prediction_cache
+                                (key, fingerprint, prediction, confidence, created_at, model_version)
+                                VALUES (?, ?, ?, ?, ?, ?)''', (key, self.fingerprint, value[0], value[1], now, value[2]))
+                conn.commit()
+            except sqlite3.Error as e:
+                logger.warning("Prediction cache write error: %s", e)
+
+    def _remember(self, key, value, now):
+        with self._lock:
+            self._entries[key] = (value, now + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, fingerprint):
+        """Switch to a new model fingerprint, dropping everything cached for the old one."""
+        with self._lock:
+            self.fingerprint = fingerprint
+            self._entries.clear()
+        if self.db_path:
+            self._init_db()
+
+    def stats(self):
+        lookups = self.hits + self.persistent_hits + self.misses
+        return {
+            'fingerprint': self.fingerprint,
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'ttl_seconds': self.ttl,
+            'persistent': bool(self.db_path),
+            'hits': self.hits,
+            'persistent_hits': self.persistent_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'hit_rate': round((self.hits + self.persistent_hits) / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import re
+import string
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from config import DATASET_CACHE_DIR
+
+
+# LIAR loading, cleaning and tokenization for train_bert_liar.py.
+#
+# Cleaning runs as whole-column Arrow kernels instead of a Python regex loop per
+# row, and tokenized splits are saved as Arrow files under DATASET_CACHE_DIR,
+# keyed on the data file, the tokenizer and the settings used. Later runs
+# memory-map the cached split instead of tokenizing again.
+
+LIAR_COLUMNS = [
+    "id", "label", "statement", "subject", "speaker", "job", "state", "party",
+    "barely_true", "false", "half_true", "mostly_true", "pants_on_fire", "venue"
+]
+
+# 🧾 Label mapping: 6-class → binary
+LABEL_MAP = {
+    "false": 0,
+    "pants-fire": 0,
+    "barely-true": 0,
+    "half-true": 1,
+    "mostly-true": 1,
+    "true": 1
+}
+
+# The cleaning steps of preprocess(), in order. RE2 (used by Arrow) has ASCII-only
+# \w, \d and \s, so the Unicode classes Python's re uses are spelled out.
+_WORD = r'[\pL\pN_]'
+CLEANING_STEPS = [
+    (r'\[.*?\]', ''),                                  # remove [brackets]
+    (r'https?://\S+|www\.\S+', ''),                    # remove links
+    (r'<.*?>+', ''),                                   # remove HTML tags
+    ('[%s]' % re.escape(string.punctuation), ''),      # remove punctuation
+    (r'\n', ' '),                                      # remove newline
+    (rf'{_WORD}*\p{{Nd}}{_WORD}*', ''),                # remove words with numbers
+]
+
+# Bump when the cleaning or tokenization changes, to invalidate cached splits
+CACHE_VERSION = 1
+
+
+def load_liar_split(path):
+    df = pd.read_csv(path, sep='\t', header=None, names=LIAR_COLUMNS)
+    return df[["statement", "label"]]
+
+
+# 🧹 Preprocess the statement text (single string; see preprocess_texts for columns)
+def preprocess(text):
+    text = str(text).lower()  # lowercase
+    text = re.sub(r'\[.*?\]', '', text)  # remove [brackets]
+    text = re.sub(r'https?://\S+|www\.\S+', '', text)  # remove links
+    text = re.sub(r'<.*?>+', '', text)  # remove HTML tags
+    text = re.sub(r'[%s]' % re.escape(string.punctuation), '', text)  # remove punctuation
+    text = re.sub(r'\n', ' ', text)  # remove newline
+    text = re.sub(r'\w*\d\w*', '', text)  # remove words with numbers
+    text = re.sub(r'\s+', ' ', text).strip()  # remove extra spaces
+    return text
+
+
+def preprocess_texts(texts):
+    """preprocess() over a whole column at once; returns a list of strings."""
+    array = pc.utf8_lower(pa.array([str(text) for text in texts], type=pa.string()))
+    for pattern, replacement in CLEANING_STEPS:
+        array = pc.replace_substring_regex(array, pattern=pattern, replacement=replacement)
+    # Python's \s also covers \v, \x1c-\x1f and Unicode spaces
+    array = pc.replace_substring_regex(array, pattern=r'[\s\x0b\x1c-\x1f\x85\p{Z}]+', replacement=' ')
+    return pc.utf8_trim_whitespace(array).to_pylist()
+
+
+# 🧼 Clean + map + preprocess
+def clean_and_map(df):
+    df = df[df["label"].isin(LABEL_MAP.keys())].copy()
+    df["label"] = df["label"].map(LABEL_MAP)
+    df = df.rename(columns={"statement": "text"})
+    df["text"] = preprocess_texts(df["text"])
+    return df
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def tokenizer_fingerprint(tokenizer):
+    """Hash of the tokenizer's vocabulary, normalizer and special-token setup."""
+    config = json.loads(tokenizer.backend_tokenizer.to_str())
+    # Truncation/padding are per-call state that the last tokenizer call leaves behind
+    config.pop('truncation', None)
+    config.pop('padding', None)
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def split_cache_key(path, tokenizer, max_length):
+    payload = json.dumps({
+        'version': CACHE_VERSION,
+        'data': _file_digest(path),
+        'tokenizer': tokenizer_fingerprint(tokenizer),
+        'max_length': max_length,
+        'labels': LABEL_MAP,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def tokenized_split(path, tokenizer, max_length=512, cache_dir=DATASET_CACHE_DIR):
+    """Cleaned, tokenized LIAR split as a datasets.Dataset with input_ids, attention_mask, labels and length.
+
+    Examples are not padded; pad per batch with DataCollatorWithPadding. The
+    split is loaded memory-mapped from cache_dir when it was built before.
+    """
+    from datasets import Dataset, load_from_disk
+
+    name = os.path.splitext(os.path.basename(path))[0]
+    cache_path = os.path.join(cache_dir, f'{name}-{split_cache_key(path, tokenizer, max_length)}')
+    if os.path.isdir(cache_path):
+        print(f"✅ Loaded tokenized {name} split from {cache_path}")
+        return load_from_disk(cache_path)
+
+    df = clean_and_map(load_liar_split(path))
+    encodings = tokenizer(df["text"].tolist(), truncation=True, max_length=max_length)
+    dataset = Dataset.from_dict({
+        "input_ids": encodings["input_ids"],
+        "attention_mask": encodings["attention_mask"],
+        "labels": df["label"].tolist(),
+        "length": [len(ids) for ids in encodings["input_ids"]],
+    })
+    os.makedirs(cache_dir, exist_ok=True)
+    # Write next to the final path and rename, so an interrupted run never leaves a partial cache entry
+    tmp_path = f'{cache_path}.tmp-{os.getpid()}'
+    dataset.save_to_disk(tmp_path)
+    os.replace(tmp_path, cache_path)
+    print(f"📦 Cached tokenized {name} split ({len(dataset)} examples) to {cache_path}")
+    # Reload so the returned dataset is memory-mapped like a cache hit
+    return load_from_disk(cache_path)
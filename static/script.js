@@ -7,6 +7,8 @@ document.addEventListener('DOMContentLoaded', function() {
     initializePredictionForm();
     initializeFlashMessages();
     initializeSearchFunctionality();
+    initializeHistoryInfiniteScroll();
+    initializeLiveEvents();
 });
 
 // Initialize prediction form
@@ -200,19 +202,298 @@ function createFlashContainer() {
 function initializeSearchFunctionality() {
     const searchInput = document.querySelector('input[name="search"]');
     if (searchInput) {
-        // Add real-time search functionality
+        // Live search against the full-text index as the user types
         let searchTimeout;
         
         searchInput.addEventListener('input', function() {
             clearTimeout(searchTimeout);
             searchTimeout = setTimeout(() => {
-                // You can implement live search here if needed
-                // For now, we'll just use the form submission
+                runLiveSearch(searchInput.value);
             }, 300);
         });
     }
 }
 
+// Replace the history grid with the first page of results for a query
+let liveSearchSequence = 0;
+
+async function runLiveSearch(query) {
+    const grid = document.getElementById('predictionsGrid');
+    if (!grid) return;
+
+    // Ignore responses that arrive after a newer keystroke has been sent
+    const sequence = ++liveSearchSequence;
+    try {
+        const params = new URLSearchParams({ search: query });
+        const response = await fetch(`/api/history?${params}`);
+        const data = await response.json();
+        if (sequence !== liveSearchSequence) return;
+        if (!response.ok) {
+            throw new Error(data.error || 'Search failed');
+        }
+
+        grid.dataset.search = query;
+        renderHistoryPage(data, false);
+
+        const emptyMessage = document.querySelector('#historyEmpty p');
+        if (emptyMessage) {
+            emptyMessage.textContent = query.trim() ? `No results for "${query.trim()}"` : "You haven't made any predictions yet";
+        }
+        const url = new URL(window.location);
+        if (query.trim()) {
+            url.searchParams.set('search', query);
+        } else {
+            url.searchParams.delete('search');
+        }
+        url.searchParams.delete('cursor');
+        window.history.replaceState(null, '', url);
+    } catch (error) {
+        console.error('Search error:', error);
+    }
+}
+
+// Render a page from /api/history into the grid (appending for infinite scroll)
+function renderHistoryPage(data, append) {
+    const grid = document.getElementById('predictionsGrid');
+    const loadMore = document.getElementById('historyLoadMore');
+    const empty = document.getElementById('historyEmpty');
+
+    if (!append) {
+        grid.innerHTML = '';
+    }
+    data.predictions.forEach(prediction => grid.appendChild(createPredictionCard(prediction)));
+    grid.dataset.nextCursor = data.next_cursor || '';
+
+    const hasResults = grid.children.length > 0;
+    grid.style.display = hasResults ? '' : 'none';
+    if (empty) {
+        empty.style.display = hasResults ? 'none' : '';
+    }
+    if (loadMore) {
+        loadMore.style.display = data.next_cursor ? '' : 'none';
+    }
+}
+
+// Build a history card (same markup as templates/history.html)
+function createPredictionCard(prediction) {
+    const isReal = prediction.prediction === 'REAL';
+    const card = document.createElement('div');
+    card.className = 'prediction-card';
+    card.innerHTML = `
+        <div class="prediction-header">
+            <div class="prediction-result ${prediction.prediction.toLowerCase()}">
+                <i class="fas fa-${isReal ? 'check-circle' : 'times-circle'}"></i>
+                <span></span>
+            </div>
+            <div class="prediction-confidence">${Number(prediction.confidence).toFixed(1)}%</div>
+        </div>
+        <div class="prediction-content">
+            <p class="prediction-headline"></p>
+            <div class="prediction-meta">
+                <span class="prediction-time">
+                    <i class="fas fa-clock"></i>
+                    <span></span>
+                </span>
+            </div>
+        </div>
+    `;
+    // User-supplied text is only ever assigned through textContent; search
+    // snippets arrive HTML-escaped from the server with <mark> highlights
+    card.querySelector('.prediction-result span').textContent = prediction.prediction;
+    if (prediction.snippet_html) {
+        card.querySelector('.prediction-headline').innerHTML = prediction.snippet_html;
+    } else {
+        card.querySelector('.prediction-headline').textContent = prediction.headline;
+    }
+    card.querySelector('.prediction-time span').textContent = prediction.timestamp.slice(0, 19).replace('T', ' ');
+    return card;
+}
+
+// Infinite scroll on the history page, following the cursor from /api/history
+function initializeHistoryInfiniteScroll() {
+    const grid = document.getElementById('predictionsGrid');
+    const loadMore = document.getElementById('historyLoadMore');
+    if (!grid || !loadMore || !('IntersectionObserver' in window)) return;
+
+    let loading = false;
+
+    async function loadNextPage() {
+        const cursor = grid.dataset.nextCursor;
+        if (loading || !cursor) return;
+        loading = true;
+
+        try {
+            const params = new URLSearchParams({ cursor: cursor, search: grid.dataset.search || '' });
+            const response = await fetch(`/api/history?${params}`);
+            const data = await response.json();
+            if (!response.ok) {
+                throw new Error(data.error || 'Failed to load history');
+            }
+            renderHistoryPage(data, true);
+        } catch (error) {
+            console.error('History error:', error);
+            showFlashMessage('Failed to load more history.', 'error');
+        } finally {
+            loading = false;
+        }
+    }
+
+    const observer = new IntersectionObserver(entries => {
+        if (entries.some(entry => entry.isIntersecting)) {
+            loadNextPage();
+        }
+    }, { rootMargin: '200px' });
+    observer.observe(loadMore);
+
+    loadMore.querySelector('a').addEventListener('click', e => {
+        e.preventDefault();
+        loadNextPage();
+    });
+}
+
+// Live updates: classified news on the live news page, the user's own new
+// predictions on the home page
+function initializeLiveEvents() {
+    const articlesGrid = document.getElementById('articlesGrid');
+    const livePredictions = document.getElementById('livePredictionsGrid');
+    const handlers = {};
+
+    if (articlesGrid) {
+        handlers.news = article => {
+            articlesGrid.prepend(createArticleCard(article));
+            articlesGrid.style.display = '';
+            const empty = document.getElementById('articlesEmpty');
+            if (empty) {
+                empty.style.display = 'none';
+            }
+        };
+    }
+    if (livePredictions) {
+        handlers.prediction = prediction => {
+            livePredictions.prepend(createPredictionCard(prediction));
+            while (livePredictions.children.length > 10) {
+                livePredictions.lastElementChild.remove();
+            }
+            document.getElementById('livePredictions').style.display = '';
+        };
+    }
+    if (Object.keys(handlers).length) {
+        subscribeToEvents(handlers);
+    }
+}
+
+// Server-sent events from /events, falling back to long-polling /events/poll
+// when EventSource is unavailable or the server refuses the stream
+function subscribeToEvents(handlers) {
+    if (!('EventSource' in window)) {
+        pollEvents(handlers);
+        return;
+    }
+
+    let lastEventId;
+    const source = new EventSource('/events');
+    Object.keys(handlers).forEach(type => {
+        source.addEventListener(type, e => {
+            lastEventId = e.lastEventId;
+            handlers[type](JSON.parse(e.data));
+        });
+    });
+    source.onerror = () => {
+        // The browser reconnects by itself unless the stream was rejected
+        if (source.readyState === EventSource.CLOSED) {
+            pollEvents(handlers, lastEventId);
+        }
+    };
+}
+
+async function pollEvents(handlers, since) {
+    let lastId = since;
+    while (true) {
+        try {
+            const query = lastId === undefined ? '' : `?since=${encodeURIComponent(lastId)}`;
+            const response = await fetch(`/events/poll${query}`);
+            const data = await response.json();
+            if (!response.ok) {
+                throw new Error(data.error || 'Failed to load live updates');
+            }
+            data.events.forEach(event => {
+                if (handlers[event.type]) {
+                    handlers[event.type](event.data);
+                }
+            });
+            lastId = data.last_id;
+        } catch (error) {
+            console.error('Live updates error:', error);
+            await new Promise(resolve => setTimeout(resolve, 5000));
+        }
+    }
+}
+
+// Build a live news card (same markup as templates/live_news.html)
+function createArticleCard(article) {
+    const isReal = article.prediction === 'REAL';
+    const card = document.createElement('div');
+    card.className = 'article-card';
+    card.innerHTML = `
+        <div class="article-content">
+            <h3 class="article-title"></h3>
+            <span class="article-verdict ${isReal ? 'real' : 'fake'}">
+                <i class="fas fa-${isReal ? 'check-circle' : 'times-circle'}"></i>
+                <span></span>
+            </span>
+            <p class="article-description"></p>
+            <div class="article-meta">
+                <span class="article-source">
+                    <i class="fas fa-newspaper"></i>
+                    <span></span>
+                </span>
+                <span class="article-time">
+                    <i class="fas fa-clock"></i>
+                    <span></span>
+                </span>
+            </div>
+            <div class="article-actions">
+                <button class="analyze-btn">
+                    <i class="fas fa-search"></i>
+                    Analyze
+                </button>
+                <a target="_blank" class="read-btn">
+                    <i class="fas fa-external-link-alt"></i>
+                    Read Full
+                </a>
+            </div>
+        </div>
+    `;
+    if (article.image_url && /^https?:\/\//i.test(article.image_url)) {
+        const image = document.createElement('div');
+        image.className = 'article-image';
+        const img = document.createElement('img');
+        img.src = article.image_url;
+        img.alt = 'Article image';
+        img.loading = 'lazy';
+        img.onerror = () => { img.style.display = 'none'; };
+        image.appendChild(img);
+        card.prepend(image);
+    }
+    card.querySelector('.article-title').textContent = article.title;
+    card.querySelector('.article-verdict span').textContent =
+        `${article.prediction} · ${Number(article.confidence).toFixed(1)}%`;
+    card.querySelector('.article-description').textContent = article.description || 'No description available.';
+    card.querySelector('.article-source span').textContent = article.source_name;
+    card.querySelector('.article-time span').textContent = article.published_at
+        ? article.published_at.slice(0, 19).replace('T', ' ')
+        : 'Unknown time';
+
+    const button = card.querySelector('.analyze-btn');
+    button.setAttribute('data-headline', article.title);
+    if (typeof analyzeHeadline === 'function') {
+        button.addEventListener('click', () => analyzeHeadline(button));
+    }
+    const link = card.querySelector('.read-btn');
+    link.href = article.url && /^https?:\/\//i.test(article.url) ? article.url : '#';
+    return card;
+}
+
 // Utility functions
 function debounce(func, wait) {
     let timeout;
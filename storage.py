@@ -0,0 +1,377 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import metrics
+from config import (DB_DIR, DATABASE, AUTH_DB, TRUTH_DB, FEEDBACK_DB,
+                    SQLITE_CACHE_SIZE_KB, SQLITE_MMAP_SIZE, SQLITE_BUSY_TIMEOUT_MS)
+
+logger = logging.getLogger(__name__)
+
+
+# Single SQLite store for users, predictions and feedback.
+#
+# The database runs in WAL mode, so readers never block the writer and commits
+# only append to the log (with synchronous=NORMAL they do not fsync). Each
+# thread keeps one long-lived connection: sqlite3 caches prepared statements
+# per connection, so the fixed SQL strings used by the app are compiled once
+# per thread instead of on every request.
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS users
+       (id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL)''',
+    '''CREATE TABLE IF NOT EXISTS predictions
+       (id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        headline TEXT NOT NULL,
+        prediction TEXT NOT NULL,
+        confidence REAL NOT NULL,
+        timestamp TEXT NOT NULL,
+        model_version TEXT)''',
+    '''CREATE TABLE IF NOT EXISTS feedback
+       (id INTEGER PRIMARY KEY AUTOINCREMENT,
+        prediction_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        feedback TEXT NOT NULL,
+        timestamp TEXT NOT NULL)''',
+    # History pages and dashboard/export queries filter on user and order by time;
+    # id breaks ties so (timestamp, id) can serve as a unique keyset cursor
+    'CREATE INDEX IF NOT EXISTS idx_predictions_user_time ON predictions (user_id, timestamp, id)',
+    'CREATE INDEX IF NOT EXISTS idx_feedback_user_time ON feedback (user_id, timestamp)',
+    'CREATE INDEX IF NOT EXISTS idx_feedback_prediction_user ON feedback (prediction_id, user_id)',
+    # Offline jobs read feedback in (timestamp, id) order from a watermark
+    'CREATE INDEX IF NOT EXISTS idx_feedback_time ON feedback (timestamp, id)',
+    # Progress of incremental offline jobs: the (timestamp, id) of the last row processed
+    '''CREATE TABLE IF NOT EXISTS job_watermarks
+       (name TEXT PRIMARY KEY,
+        last_timestamp TEXT NOT NULL,
+        last_id INTEGER NOT NULL,
+        updated_at TEXT NOT NULL)''',
+]
+
+# Full-text index over predictions.headline. It is an external-content FTS5 table
+# (the text is stored once, in predictions) read through a view that adds an
+# "owner" token per row, so a user's search intersects their own postings in the
+# index instead of filtering every match across all users. Triggers keep it in sync.
+SEARCH_SCHEMA = [
+    '''CREATE VIEW IF NOT EXISTS predictions_search_source AS
+       SELECT id, headline, 'u' || user_id AS owner FROM predictions''',
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS predictions_fts USING fts5
+       (headline, owner, content='predictions_search_source', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3')''',
+    '''CREATE TRIGGER IF NOT EXISTS predictions_fts_insert AFTER INSERT ON predictions BEGIN
+           INSERT INTO predictions_fts (rowid, headline, owner) VALUES (new.id, new.headline, 'u' || new.user_id);
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS predictions_fts_delete AFTER DELETE ON predictions BEGIN
+           INSERT INTO predictions_fts (predictions_fts, rowid, headline, owner)
+           VALUES ('delete', old.id, old.headline, 'u' || old.user_id);
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS predictions_fts_update AFTER UPDATE OF headline, user_id ON predictions BEGIN
+           INSERT INTO predictions_fts (predictions_fts, rowid, headline, owner)
+           VALUES ('delete', old.id, old.headline, 'u' || old.user_id);
+           INSERT INTO predictions_fts (rowid, headline, owner) VALUES (new.id, new.headline, 'u' || new.user_id);
+       END''',
+]
+
+# Per-user counters read by the dashboard, maintained incrementally by triggers on
+# every prediction/feedback write so the dashboard never aggregates over history
+STATS_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS user_stats
+       (user_id INTEGER PRIMARY KEY,
+        total_predictions INTEGER NOT NULL DEFAULT 0,
+        real_predictions INTEGER NOT NULL DEFAULT 0,
+        fake_predictions INTEGER NOT NULL DEFAULT 0,
+        accurate_feedback INTEGER NOT NULL DEFAULT 0,
+        wrong_feedback INTEGER NOT NULL DEFAULT 0)''',
+    '''CREATE TRIGGER IF NOT EXISTS user_stats_prediction_insert AFTER INSERT ON predictions BEGIN
+           INSERT INTO user_stats (user_id, total_predictions, real_predictions, fake_predictions)
+           VALUES (new.user_id, 1, new.prediction = 'REAL', new.prediction = 'FAKE')
+           ON CONFLICT (user_id) DO UPDATE SET
+               total_predictions = total_predictions + 1,
+               real_predictions = real_predictions + excluded.real_predictions,
+               fake_predictions = fake_predictions + excluded.fake_predictions;
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS user_stats_prediction_delete AFTER DELETE ON predictions BEGIN
+           UPDATE user_stats SET
+               total_predictions = total_predictions - 1,
+               real_predictions = real_predictions - (old.prediction = 'REAL'),
+               fake_predictions = fake_predictions - (old.prediction = 'FAKE')
+           WHERE user_id = old.user_id;
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS user_stats_feedback_insert AFTER INSERT ON feedback BEGIN
+           INSERT INTO user_stats (user_id, accurate_feedback, wrong_feedback)
+           VALUES (new.user_id, new.feedback = 'accurate', new.feedback = 'wrong')
+           ON CONFLICT (user_id) DO UPDATE SET
+               accurate_feedback = accurate_feedback + excluded.accurate_feedback,
+               wrong_feedback = wrong_feedback + excluded.wrong_feedback;
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS user_stats_feedback_update AFTER UPDATE OF feedback ON feedback BEGIN
+           UPDATE user_stats SET
+               accurate_feedback = accurate_feedback - (old.feedback = 'accurate') + (new.feedback = 'accurate'),
+               wrong_feedback = wrong_feedback - (old.feedback = 'wrong') + (new.feedback = 'wrong')
+           WHERE user_id = new.user_id;
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS user_stats_feedback_delete AFTER DELETE ON feedback BEGIN
+           UPDATE user_stats SET
+               accurate_feedback = accurate_feedback - (old.feedback = 'accurate'),
+               wrong_feedback = wrong_feedback - (old.feedback = 'wrong')
+           WHERE user_id = old.user_id;
+       END''',
+]
+
+# Live news: articles fetched by news_ingest.py with the model's verdict attached.
+# An article is stored once; a second copy with the same URL or the same
+# (normalized) title is ignored. news_sources holds each source's conditional
+# request validators and the polling lease shared by all worker processes.
+NEWS_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS news_articles
+       (id INTEGER PRIMARY KEY AUTOINCREMENT,
+        url_hash TEXT NOT NULL,
+        title_hash TEXT NOT NULL,
+        source TEXT NOT NULL,
+        source_name TEXT,
+        title TEXT NOT NULL,
+        description TEXT,
+        url TEXT,
+        image_url TEXT,
+        published_at TEXT,
+        fetched_at TEXT NOT NULL,
+        prediction TEXT NOT NULL,
+        confidence REAL NOT NULL,
+        model_version TEXT)''',
+    'CREATE UNIQUE INDEX IF NOT EXISTS idx_news_articles_url ON news_articles (url_hash)',
+    'CREATE UNIQUE INDEX IF NOT EXISTS idx_news_articles_title ON news_articles (title_hash)',
+    'CREATE INDEX IF NOT EXISTS idx_news_articles_published ON news_articles (published_at, id)',
+    '''CREATE TABLE IF NOT EXISTS news_sources
+       (name TEXT PRIMARY KEY,
+        etag TEXT,
+        last_modified TEXT,
+        last_polled_at REAL NOT NULL DEFAULT 0,
+        last_status TEXT,
+        last_error TEXT)''',
+]
+
+# Append-only log of new predictions and news articles, tailed by broadcast.py.
+# Ids are assigned inside the inserting transaction and SQLite has one writer at
+# a time, so every process sees events in the same (commit) order and an event
+# id is a resume point that is valid in any worker.
+EVENTS_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS event_log
+       (id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        ref_id INTEGER NOT NULL,
+        user_id INTEGER)''',
+    '''CREATE TRIGGER IF NOT EXISTS event_log_prediction AFTER INSERT ON predictions BEGIN
+           INSERT INTO event_log (kind, ref_id, user_id) VALUES ('prediction', new.id, new.user_id);
+       END''',
+    '''CREATE TRIGGER IF NOT EXISTS event_log_news AFTER INSERT ON news_articles BEGIN
+           INSERT INTO event_log (kind, ref_id) VALUES ('news', new.id);
+       END''',
+]
+
+# Columns added to existing tables after their first release: (table, column, type).
+# model_version is the version of the model (model_registry) that produced a
+# verdict; it is NULL for rows written before versioned models.
+ADDED_COLUMNS = [
+    ('predictions', 'model_version', 'TEXT'),
+    ('news_articles', 'model_version', 'TEXT'),
+]
+
+# Markers wrapped around matched terms by snippet(); replaced with <mark> after HTML-escaping
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+
+# (legacy database file, table, columns) imported by migrate_legacy()
+LEGACY_TABLES = [
+    (AUTH_DB, 'users', 'id, username, password_hash'),
+    (TRUTH_DB, 'predictions', 'id, user_id, headline, prediction, confidence, timestamp'),
+    (FEEDBACK_DB, 'feedback', 'id, prediction_id, user_id, feedback, timestamp'),
+]
+
+_local = threading.local()
+
+
+def pragmas():
+    """Statements every connection to the store runs first (the aiosqlite ones in asgi.py too)."""
+    return [
+        'PRAGMA journal_mode = WAL',
+        'PRAGMA synchronous = NORMAL',
+        f'PRAGMA cache_size = -{int(SQLITE_CACHE_SIZE_KB)}',
+        f'PRAGMA mmap_size = {int(SQLITE_MMAP_SIZE)}',
+        'PRAGMA temp_store = MEMORY',
+        f'PRAGMA busy_timeout = {int(SQLITE_BUSY_TIMEOUT_MS)}',
+    ]
+
+
+def connect(path=DATABASE, check_same_thread=True):
+    """Open a new connection with the store's pragmas applied."""
+    conn = sqlite3.connect(path, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000, cached_statements=256,
+                           check_same_thread=check_same_thread)
+    conn.row_factory = sqlite3.Row
+    for pragma in pragmas():
+        conn.execute(pragma)
+    return conn
+
+
+def get_db():
+    """Return this thread's pooled connection. Callers must not close it."""
+    started = time.perf_counter()
+    conn = getattr(_local, 'conn', None)
+    # Connections must not be shared with a forked child (gunicorn preload)
+    if conn is None or _local.pid != os.getpid():
+        conn = connect()
+        _local.conn = conn
+        _local.pid = os.getpid()
+    metrics.DB_CONNECTION_WAIT.observe(time.perf_counter() - started, kind='pool')
+    return conn
+
+
+def release_db():
+    """End-of-request hook: never leave a transaction open on a pooled connection."""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.pid == os.getpid() and conn.in_transaction:
+        conn.rollback()
+
+
+def close_db():
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.pid == os.getpid():
+        conn.close()
+    _local.conn = None
+
+
+def migrate_legacy(conn=None):
+    """Import auth.db, truthlens.db and feedback.db into the store, keeping row ids.
+
+    Rows already present (same id) are skipped, so running it twice is harmless.
+    Returns {table: rows imported}.
+    """
+    conn = conn or get_db()
+    imported = {}
+    for path, table, columns in LEGACY_TABLES:
+        if not os.path.exists(path) or os.path.abspath(path) == os.path.abspath(DATABASE):
+            continue
+        conn.execute('ATTACH DATABASE ? AS legacy', (path,))
+        try:
+            exists = conn.execute("SELECT 1 FROM legacy.sqlite_master WHERE type = 'table' AND name = ?",
+                                  (table,)).fetchone()
+            if exists:
+                # rowcount, unlike total_changes, leaves out rows written by the search/stats/event triggers
+                cursor = conn.execute(f'INSERT OR IGNORE INTO main.{table} ({columns}) SELECT {columns} FROM legacy.{table}')
+                conn.commit()
+                imported[table] = cursor.rowcount
+        finally:
+            conn.execute('DETACH DATABASE legacy')
+    return imported
+
+
+def fts_query(user_query, user_id):
+    """Turn free text from the search box into a safe FTS5 MATCH expression.
+
+    "Quoted text" becomes a phrase, every other word a term, and the last word is
+    treated as a prefix while the user is still typing. Returns None when there is
+    nothing searchable in the input.
+    """
+    terms = []
+    for phrase, word in re.findall(r'"([^"]*)"|(\S+)', user_query):
+        tokens = re.findall(r'\w+', phrase or word)
+        if tokens:
+            terms.append(('"' + ' '.join(tokens) + '"', bool(word)))
+    if not terms:
+        return None
+    if terms[-1][1] and not user_query.endswith((' ', '"')):
+        terms[-1] = (terms[-1][0] + '*', True)
+    return f'owner : "u{int(user_id)}" AND headline : ({" ".join(term for term, _ in terms)})'
+
+
+def rebuild_search_index(conn=None):
+    """Re-index every prediction headline (after bulk imports or for existing data)."""
+    conn = conn or get_db()
+    conn.execute("INSERT INTO predictions_fts (predictions_fts) VALUES ('rebuild')")
+    conn.commit()
+    return conn.execute('SELECT COUNT(*) FROM predictions').fetchone()[0]
+
+
+def rebuild_user_stats(conn=None):
+    """Recompute user_stats from scratch (for data written before the triggers existed)."""
+    conn = conn or get_db()
+    conn.execute('DELETE FROM user_stats')
+    conn.execute('''INSERT INTO user_stats (user_id, total_predictions, real_predictions, fake_predictions)
+                    SELECT user_id, COUNT(*), SUM(prediction = 'REAL'), SUM(prediction = 'FAKE')
+                    FROM predictions GROUP BY user_id''')
+    conn.execute('''INSERT INTO user_stats (user_id, accurate_feedback, wrong_feedback)
+                    SELECT user_id, SUM(feedback = 'accurate'), SUM(feedback = 'wrong')
+                    FROM feedback WHERE true GROUP BY user_id
+                    ON CONFLICT (user_id) DO UPDATE SET
+                        accurate_feedback = excluded.accurate_feedback,
+                        wrong_feedback = excluded.wrong_feedback''')
+    conn.commit()
+    return conn.execute('SELECT COUNT(*) FROM user_stats').fetchone()[0]
+
+
+def get_watermark(conn, name):
+    """(last_timestamp, last_id) a job has processed up to; ('', 0) before its first run."""
+    row = conn.execute('SELECT last_timestamp, last_id FROM job_watermarks WHERE name = ?', (name,)).fetchone()
+    return (row['last_timestamp'], row['last_id']) if row else ('', 0)
+
+
+def set_watermark(conn, name, last_timestamp, last_id):
+    conn.execute('''INSERT INTO job_watermarks (name, last_timestamp, last_id, updated_at)
+                    VALUES (?, ?, ?, datetime('now'))
+                    ON CONFLICT (name) DO UPDATE SET last_timestamp = excluded.last_timestamp,
+                        last_id = excluded.last_id, updated_at = excluded.updated_at''',
+                 (name, last_timestamp, last_id))
+    conn.commit()
+
+
+def add_missing_columns(conn=None):
+    """ALTER TABLE in the ADDED_COLUMNS an older database does not have yet. Returns the columns added."""
+    conn = conn or get_db()
+    added = []
+    for table, column, column_type in ADDED_COLUMNS:
+        columns = [row['name'] for row in conn.execute(f'PRAGMA table_info({table})')]
+        if column not in columns:
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {column_type}')
+            added.append(f'{table}.{column}')
+    conn.commit()
+    return added
+
+
+def create_schema(conn):
+    """Create every table, index and trigger (idempotent)."""
+    for statement in SCHEMA + SEARCH_SCHEMA + STATS_SCHEMA + NEWS_SCHEMA + EVENTS_SCHEMA:
+        conn.execute(statement)
+    conn.commit()
+    return add_missing_columns(conn)
+
+
+def init_db():
+    """Create the schema; on first run, import the legacy per-table databases."""
+    try:
+        logger.info("Initializing database")
+        os.makedirs(DB_DIR, exist_ok=True)
+        conn = get_db()
+        is_new = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'users'").fetchone() is None
+        has_search_index = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'predictions_fts'").fetchone()
+        has_user_stats = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'user_stats'").fetchone()
+        added = create_schema(conn)
+        if added:
+            logger.info("Added columns: %s", ', '.join(added))
+        if not is_new and not has_search_index:
+            logger.info("Search index built for %d predictions", rebuild_search_index(conn))
+        if not is_new and not has_user_stats:
+            logger.info("Statistics computed for %d users", rebuild_user_stats(conn))
+        if is_new:
+            imported = migrate_legacy(conn)
+            if imported:
+                logger.info("Imported legacy databases: %s", imported)
+        logger.info("%s initialized", DATABASE)
+        return True
+    except Exception as e:
+        logger.error("Database initialization error: %s", e)
+        return False
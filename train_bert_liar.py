@@ -1,114 +1,209 @@
-import pandas as pd
-import torch
-import re
-import string
-from sklearn.metrics import classification_report, accuracy_score
-from transformers import DistilBertTokenizerFast, DistilBertForSequenceClassification, Trainer, TrainingArguments
-from datasets import Dataset
+import argparse
+import dataclasses
 import os
 
-# 🚀 Load LIAR dataset
-def load_liar_split(path):
-    df = pd.read_csv(path, sep='\t', header=None, names=[
-        "id", "label", "statement", "subject", "speaker", "job", "state", "party",
-        "barely_true", "false", "half_true", "mostly_true", "pants_on_fire", "venue"
-    ])
-    return df[["statement", "label"]]
-
-# 🧹 Preprocess the statement text
-def preprocess(text):
-    text = str(text).lower()  # lowercase
-    text = re.sub(r'\[.*?\]', '', text)  # remove [brackets]
-    text = re.sub(r'https?://\S+|www\.\S+', '', text)  # remove links
-    text = re.sub(r'<.*?>+', '', text)  # remove HTML tags
-    text = re.sub(r'[%s]' % re.escape(string.punctuation), '', text)  # remove punctuation
-    text = re.sub(r'\n', ' ', text)  # remove newline
-    text = re.sub(r'\w*\d\w*', '', text)  # remove words with numbers
-    text = re.sub(r'\s+', ' ', text).strip()  # remove extra spaces
-    return text
-
-# 🧾 Label mapping: 6-class → binary
-label_map = {
-    "false": 0,
-    "pants-fire": 0,
-    "barely-true": 0,
-    "half-true": 1,
-    "mostly-true": 1,
-    "true": 1
-}
-
-# 📂 Load splits
-train_df = load_liar_split("liar_dataset/train.tsv")
-val_df = load_liar_split("liar_dataset/valid.tsv")
-test_df = load_liar_split("liar_dataset/test.tsv")
-
-# 🧼 Clean + map + preprocess
-def clean_and_map(df):
-    df = df[df["label"].isin(label_map.keys())]
-    df["label"] = df["label"].map(label_map)
-    df = df.rename(columns={"statement": "text"})
-    df["text"] = df["text"].apply(preprocess)
-    return df
-
-train_df = clean_and_map(train_df)
-val_df = clean_and_map(val_df)
-
-# 🧠 Tokenization
-tokenizer = DistilBertTokenizerFast.from_pretrained("distilbert-base-uncased")
-
-train_enc = tokenizer(train_df["text"].tolist(), truncation=True, padding=True)
-val_enc = tokenizer(val_df["text"].tolist(), truncation=True, padding=True)
-
-train_dataset = Dataset.from_dict({
-    "input_ids": train_enc["input_ids"],
-    "attention_mask": train_enc["attention_mask"],
-    "labels": train_df["label"].tolist()
-})
-
-val_dataset = Dataset.from_dict({
-    "input_ids": val_enc["input_ids"],
-    "attention_mask": val_enc["attention_mask"],
-    "labels": val_df["label"].tolist()
-})
-
-# 🧠 Load Model
-model = DistilBertForSequenceClassification.from_pretrained("distilbert-base-uncased", num_labels=2)
-
-# ⚙️ Training arguments
-training_args = TrainingArguments(
-    output_dir="./bert_model",
-    num_train_epochs=3,
-    per_device_train_batch_size=16,
-    per_device_eval_batch_size=64,
-    warmup_steps=500,
-    weight_decay=0.01,
-    logging_dir="./logs",
-    logging_steps=10,
-    eval_strategy="epoch",
-    save_strategy="epoch"
-)
-
-# 🛠️ Trainer Setup
-trainer = Trainer(
-    model=model,
-    args=training_args,
-    train_dataset=train_dataset,
-    eval_dataset=val_dataset,
-    tokenizer=tokenizer,
-)
-
-# 🚀 Train
-trainer.train()
-
-# ✅ Evaluate
-preds_output = trainer.predict(val_dataset)
-preds = torch.argmax(torch.tensor(preds_output.predictions), axis=1)
-acc = accuracy_score(val_df["label"].tolist(), preds)
-print("✅ BERT Accuracy:", acc)
-print(classification_report(val_df["label"].tolist(), preds))
-
-# 💾 Save Model + Tokenizer
-model.save_pretrained("./bert_model")
-tokenizer.save_pretrained("./bert_tokenizer")
-print("📦 Saved to: bert_model/ and bert_tokenizer/")
-
+import numpy as np
+import torch
+from sklearn.metrics import classification_report, accuracy_score
+from transformers import (DistilBertTokenizerFast, DistilBertForSequenceClassification, Trainer, TrainingArguments,
+                          DataCollatorWithPadding, EarlyStoppingCallback, set_seed)
+from transformers.trainer_utils import get_last_checkpoint
+
+import model_bundles
+from config import BERT_MODEL_DIR, BERT_TOKENIZER_DIR, BUNDLE_DIR, CHECKPOINT_DIR
+from preprocessing import tokenized_split
+
+
+# 🧠 Fine-tune DistilBERT on LIAR (binary labels) and publish a versioned bundle.
+#
+#   python train_bert_liar.py                          # defaults: 3 epochs, batch 16
+#   python train_bert_liar.py --grad-accum 4 --workers 2 --bf16 auto
+#   python train_bert_liar.py --resume                 # continue from the last checkpoint
+#   python train_bert_liar.py --max-steps 20 --bundle-only   # quick smoke run
+#
+# Runs on CPU when no GPU is present; bf16 autocast is used on CPUs with
+# AVX512-BF16 or AMX. Checkpoints are written every epoch to --output-dir, the
+# best one (by validation accuracy) is restored at the end and early stopping
+# ends training once accuracy stops improving. The final model is written to
+# bert_model/ + bert_tokenizer/ and as a bundle under BUNDLE_DIR.
+
+def cpu_supports_bf16():
+    """True on x86 CPUs with native bf16 (AVX512-BF16 or AMX); other CPUs would emulate it slowly."""
+    try:
+        with open('/proc/cpuinfo') as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return 'avx512_bf16' in flags or 'amx_bf16' in flags
+
+
+def use_bf16(mode):
+    if mode == 'off':
+        return False
+    if torch.cuda.is_available():
+        supported = torch.cuda.is_bf16_supported()
+    else:
+        supported = cpu_supports_bf16()
+    if mode == 'on' and not supported:
+        print("⚠️ bf16 requested but not natively supported here; it will be emulated")
+        return True
+    return supported
+
+
+def compute_metrics(eval_pred):
+    logits, labels = eval_pred
+    return {'accuracy': accuracy_score(labels, np.argmax(logits, axis=-1))}
+
+
+def training_arguments(args):
+    on_gpu = torch.cuda.is_available()
+    kwargs = dict(
+        output_dir=args.output_dir,
+        num_train_epochs=args.epochs,
+        max_steps=args.max_steps or -1,
+        per_device_train_batch_size=args.batch_size,
+        per_device_eval_batch_size=args.eval_batch_size,
+        gradient_accumulation_steps=args.grad_accum,
+        learning_rate=args.lr,
+        warmup_steps=args.warmup_steps,
+        weight_decay=args.weight_decay,
+        logging_dir="./logs",
+        logging_steps=args.logging_steps,
+        save_strategy="epoch",
+        save_total_limit=2,
+        load_best_model_at_end=True,
+        metric_for_best_model="accuracy",
+        bf16=use_bf16(args.bf16),
+        use_cpu=not on_gpu,
+        dataloader_num_workers=args.workers,
+        dataloader_persistent_workers=args.workers > 0,
+        # Pinned memory only helps host-to-GPU copies
+        dataloader_pin_memory=on_gpu,
+        seed=args.seed,
+        report_to="none",
+        # Batch statements of similar length together so little compute goes to padding
+        group_by_length=True,
+        length_column_name="length",
+    )
+    # Renamed from evaluation_strategy in newer transformers releases
+    fields = {field.name for field in dataclasses.fields(TrainingArguments)}
+    strategy = 'eval_strategy' if 'eval_strategy' in fields else 'evaluation_strategy'
+    kwargs[strategy] = "epoch"
+    if args.max_steps:
+        # A step-limited run may not reach an epoch boundary: evaluate and save at the end instead
+        kwargs.update({strategy: "steps", 'save_strategy': "steps",
+                       'eval_steps': args.max_steps, 'save_steps': args.max_steps})
+    return TrainingArguments(**kwargs)
+
+
+def resume_checkpoint(resume, output_dir):
+    """--resume: the newest checkpoint in output_dir; --resume PATH: that checkpoint."""
+    if not resume:
+        return None
+    if resume != 'auto':
+        return resume
+    checkpoint = get_last_checkpoint(output_dir) if os.path.isdir(output_dir) else None
+    if checkpoint is None:
+        print(f"⚠️ No checkpoint found in {output_dir}; starting from scratch")
+    return checkpoint
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Fine-tune DistilBERT on the LIAR dataset")
+    parser.add_argument('--train', default=os.path.join('liar_dataset', 'train.tsv'))
+    parser.add_argument('--valid', default=os.path.join('liar_dataset', 'valid.tsv'))
+    parser.add_argument('--model-name', default="distilbert-base-uncased",
+                        help="pretrained model (hub name or local directory) to fine-tune")
+    parser.add_argument('--tokenizer-name', default=None, help="tokenizer to use (default: --model-name)")
+    parser.add_argument('--epochs', type=float, default=3)
+    parser.add_argument('--max-steps', type=int, default=0, help="stop after this many optimizer steps")
+    parser.add_argument('--batch-size', type=int, default=16, help="per-device training batch size")
+    parser.add_argument('--eval-batch-size', type=int, default=64)
+    parser.add_argument('--grad-accum', type=int, default=1,
+                        help="accumulate gradients over N batches (effective batch = batch size x N)")
+    parser.add_argument('--lr', type=float, default=5e-5)
+    parser.add_argument('--warmup-steps', type=int, default=500)
+    parser.add_argument('--weight-decay', type=float, default=0.01)
+    parser.add_argument('--max-length', type=int, default=512)
+    parser.add_argument('--workers', type=int, default=0, help="dataloader worker processes")
+    parser.add_argument('--bf16', choices=['auto', 'on', 'off'], default='auto')
+    parser.add_argument('--early-stopping-patience', type=int, default=2,
+                        help="evaluations without improvement before stopping (0 disables)")
+    parser.add_argument('--output-dir', default=CHECKPOINT_DIR, help="checkpoint directory")
+    parser.add_argument('--resume', nargs='?', const='auto', default=None,
+                        help="resume from the last checkpoint in --output-dir, or from the given checkpoint")
+    parser.add_argument('--bundle-dir', default=BUNDLE_DIR)
+    parser.add_argument('--bundle-only', action='store_true',
+                        help="write only the bundle, leaving bert_model/ and bert_tokenizer/ untouched")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--logging-steps', type=int, default=10)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    set_seed(args.seed)
+    if args.workers > 0:
+        # Dataloader workers are forked after the fast tokenizer has used its thread pool
+        os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+    # 🧠 Tokenizer
+    tokenizer = DistilBertTokenizerFast.from_pretrained(args.tokenizer_name or args.model_name)
+
+    # 📂 Load splits: cleaned and tokenized once, then memory-mapped from the cache.
+    # Examples are left unpadded; each batch is padded to its own longest statement.
+    train_dataset = tokenized_split(args.train, tokenizer, args.max_length)
+    # Sorting by length keeps evaluation batches tightly padded too
+    val_dataset = tokenized_split(args.valid, tokenizer, args.max_length).sort("length")
+
+    # 🧠 Load Model
+    model = DistilBertForSequenceClassification.from_pretrained(args.model_name, num_labels=2)
+
+    # ⚙️ Training arguments
+    training_args = training_arguments(args)
+    print(f"⚙️ Training on {'GPU' if torch.cuda.is_available() else 'CPU'}, bf16={training_args.bf16}, "
+          f"effective batch size {args.batch_size * args.grad_accum}, {args.workers} dataloader workers")
+
+    # 🛠️ Trainer Setup
+    callbacks = []
+    if args.early_stopping_patience > 0:
+        callbacks.append(EarlyStoppingCallback(early_stopping_patience=args.early_stopping_patience))
+    trainer = Trainer(
+        model=model,
+        args=training_args,
+        train_dataset=train_dataset,
+        eval_dataset=val_dataset,
+        tokenizer=tokenizer,
+        data_collator=DataCollatorWithPadding(tokenizer),
+        compute_metrics=compute_metrics,
+        callbacks=callbacks,
+    )
+
+    # 🚀 Train
+    trainer.train(resume_from_checkpoint=resume_checkpoint(args.resume, args.output_dir))
+
+    # ✅ Evaluate (the best checkpoint has been restored)
+    preds_output = trainer.predict(val_dataset)
+    preds = np.argmax(preds_output.predictions, axis=-1)
+    acc = accuracy_score(preds_output.label_ids, preds)
+    print("✅ BERT Accuracy:", acc)
+    print(classification_report(preds_output.label_ids, preds))
+
+    # 💾 Save Model + Tokenizer
+    model = trainer.model
+    if not args.bundle_only:
+        model.save_pretrained(BERT_MODEL_DIR)
+        tokenizer.save_pretrained(BERT_TOKENIZER_DIR)
+        print(f"📦 Saved to: {BERT_MODEL_DIR}/ and {BERT_TOKENIZER_DIR}/")
+
+    metrics = {'accuracy': acc, 'eval_loss': preds_output.metrics.get('test_loss'),
+               'global_step': trainer.state.global_step, 'epoch': trainer.state.epoch,
+               'best_checkpoint': trainer.state.best_model_checkpoint}
+    params = {key: value for key, value in vars(args).items() if key not in ('bundle_only', 'bundle_dir')}
+    params['bf16'] = training_args.bf16
+    path = model_bundles.write_bundle(model, tokenizer, metrics, params, bundle_dir=args.bundle_dir)
+    print(f"📦 Wrote model bundle {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+import argparse
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+import joblib
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+
+import model_registry
+from cascade import LinearScorer
+from config import MODEL_FILE, VECTORIZER_FILE, CASCADE_FILE, CASCADE_TARGET_AGREEMENT
+from logs import configure_logging
+from predict_bert import LABELS, predict_batch
+from preprocessing import LABEL_MAP, load_liar_split, preprocess_texts
+
+
+# ⚡ Distil the served DistilBERT into the cascade's TF-IDF student.
+#
+#   python train_cascade.py                           # label, train, calibrate, write the cascade files
+#   python train_cascade.py --target-agreement 0.99   # escalate more, stay closer to DistilBERT
+#
+# The student learns DistilBERT's answers rather than the LIAR labels: the
+# training statements are labelled by the model being served (the version
+# TRUTHLENS_MODEL_VERSION and TRUTHLENS_INFERENCE_BACKEND select, as in the
+# app), each weighted by its confidence. On the validation statements the
+# student's answers are sorted by its confidence and the threshold is set as low
+# as possible while the cascade (student above the threshold, DistilBERT below)
+# still agrees with DistilBERT on --target-agreement of them. Both models are
+# then timed one headline at a time to estimate the latency the cascade saves.
+
+LABEL_IDS = {label: label_id for label_id, label in LABELS.items()}
+NEVER = 1.01  # threshold above any probability: the student answers nothing
+
+
+def teacher_labels(texts, batch_size):
+    """DistilBERT's (label ids, confidences in [0, 1]) for texts, in length-sorted batches."""
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    labels, confidences = np.zeros(len(texts), dtype=int), np.zeros(len(texts))
+    for start in range(0, len(order), batch_size):
+        batch = order[start:start + batch_size]
+        for i, (label, confidence) in zip(batch, predict_batch([texts[i] for i in batch])):
+            labels[i], confidences[i] = LABEL_IDS[label], confidence / 100
+    return labels, confidences
+
+
+def calibrate(confidences, agrees, target):
+    """The lowest student confidence threshold at which the cascade agrees with DistilBERT
+    on at least `target` of the examples (agrees: whether the student's answer matches)."""
+    order = np.argsort(-confidences, kind='stable')
+    sorted_confidences = confidences[order]
+    disagreements = np.cumsum(~agrees[order])
+    allowed = int((1 - target) * len(confidences) + 1e-9)
+    threshold = NEVER
+    for answered in range(1, len(order) + 1):
+        # Only cut between distinct confidences: everything at the threshold is answered
+        if answered < len(order) and sorted_confidences[answered] == sorted_confidences[answered - 1]:
+            continue
+        if disagreements[answered - 1] > allowed:
+            break
+        threshold = float(sorted_confidences[answered - 1])
+    return threshold
+
+
+def per_item_ms(fn, texts):
+    """Median milliseconds for fn on one text at a time, after one warm-up call."""
+    fn([texts[0]])
+    durations = []
+    for text in texts:
+        started = time.perf_counter()
+        fn([text])
+        durations.append(time.perf_counter() - started)
+    return float(np.median(durations) * 1000)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Distil the served model into the prediction cascade's student")
+    parser.add_argument('--train', default=os.path.join('liar_dataset', 'train.tsv'),
+                        help="statements the student learns DistilBERT's answers on")
+    parser.add_argument('--valid', default=os.path.join('liar_dataset', 'valid.tsv'),
+                        help="statements the threshold is calibrated on")
+    parser.add_argument('--limit', type=int, default=0, help="use only the first N training statements")
+    parser.add_argument('--target-agreement', type=float, default=CASCADE_TARGET_AGREEMENT,
+                        help="share of validation statements the cascade must answer as DistilBERT does")
+    parser.add_argument('--max-features', type=int, default=50000)
+    parser.add_argument('--min-df', type=int, default=2)
+    parser.add_argument('--c', type=float, default=4.0, help="inverse regularization strength")
+    parser.add_argument('--batch-size', type=int, default=64, help="statements per DistilBERT forward pass")
+    parser.add_argument('--latency-samples', type=int, default=200,
+                        help="validation statements timed one at a time per model")
+    parser.add_argument('--model-file', default=MODEL_FILE)
+    parser.add_argument('--vectorizer-file', default=VECTORIZER_FILE)
+    parser.add_argument('--cascade-file', default=CASCADE_FILE)
+    return parser.parse_args(argv)
+
+
+def write_atomic(path, write):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = path + '.tmp'
+    write(tmp)
+    os.replace(tmp, path)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_logging()
+    if not 0 < args.target_agreement <= 1:
+        print("❌ --target-agreement must be in (0, 1]")
+        return None
+
+    teacher = model_registry.get_model()
+    train = load_liar_split(args.train)['statement'].astype(str).tolist()
+    if args.limit:
+        train = train[:args.limit]
+    valid_df = load_liar_split(args.valid)
+    valid = valid_df['statement'].astype(str).tolist()
+
+    # 🏷️ DistilBERT's answers are the student's targets
+    print(f"📥 Labelling {len(train)} training and {len(valid)} validation statements with {teacher.version}")
+    train_labels, train_confidences = teacher_labels(train, args.batch_size)
+    valid_labels, _ = teacher_labels(valid, args.batch_size)
+    if len(set(train_labels.tolist())) < 2:
+        print(f"❌ {teacher.version} gives every training statement the same label; nothing to distil")
+        return None
+
+    print(f"⚙️ Training TF-IDF + logistic regression student on {len(train)} statements")
+    vectorizer = TfidfVectorizer(ngram_range=(1, 2), sublinear_tf=True, min_df=args.min_df,
+                                 max_features=args.max_features)
+    student = LogisticRegression(C=args.c, max_iter=1000)
+    student.fit(vectorizer.fit_transform(preprocess_texts(train)), train_labels, sample_weight=train_confidences)
+
+    # 🎯 Calibrate the threshold on validation
+    probs = student.predict_proba(vectorizer.transform(preprocess_texts(valid)))
+    scorer = LinearScorer(vectorizer, student)
+    mismatch = max(abs(scorer.probability(text) - row[1]) for text, row in zip(valid, probs))
+    if mismatch > 1e-6:
+        print(f"⚠️ The cascade's scorer differs from the student by up to {mismatch:.2g} in probability")
+    student_labels = student.classes_[probs.argmax(axis=1)]
+    student_confidences = probs.max(axis=1)
+    agrees = student_labels == valid_labels
+    threshold = calibrate(student_confidences, agrees, args.target_agreement)
+    answered = student_confidences >= threshold
+    cascade_labels = np.where(answered, student_labels, valid_labels)
+    gold = valid_df['label'].map(LABEL_MAP)
+    known = gold.notna().to_numpy()
+    gold = gold.to_numpy()[known].astype(int)
+    validation = {
+        'statements': len(valid),
+        'escalation_rate': round(float(1 - answered.mean()), 4),
+        'agreement': round(float((cascade_labels == valid_labels).mean()), 4),
+        'student_only_agreement': round(float(agrees.mean()), 4),
+        'accuracy': round(float((cascade_labels[known] == gold).mean()), 4),
+        'full_model_accuracy': round(float((valid_labels[known] == gold).mean()), 4),
+    }
+    if threshold == NEVER:
+        print(f"⚠️ The student cannot reach {args.target_agreement:.1%} agreement on any share of validation; "
+              f"every headline will be escalated")
+
+    # ⏱️ One headline at a time, as /predict sees them
+    sample = valid[:args.latency_samples]
+    full_ms = per_item_ms(predict_batch, sample)
+    student_ms = per_item_ms(lambda texts: scorer.predict(texts[0]), sample)
+    cascade_ms = student_ms + validation['escalation_rate'] * full_ms
+    latency = {'full_ms_per_item': round(full_ms, 3), 'student_ms_per_item': round(student_ms, 3),
+               'cascade_ms_per_item': round(cascade_ms, 3),
+               'saved_fraction': round(1 - cascade_ms / full_ms, 4) if full_ms else 0.0}
+
+    meta = {
+        'version': f"{teacher.version}+tfidf",
+        'teacher_version': teacher.version,
+        'teacher_fingerprint': teacher.fingerprint,
+        'threshold': threshold,
+        'target_agreement': args.target_agreement,
+        # Longer text (articles) always goes to DistilBERT
+        'max_chars': max(len(text) for text in train + valid),
+        'validation': validation,
+        'latency': latency,
+        'params': {'train': args.train, 'valid': args.valid, 'train_statements': len(train),
+                   'max_features': args.max_features, 'min_df': args.min_df, 'c': args.c},
+        'trained_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+    }
+    # The app reloads when the cascade file changes, so it is written last
+    write_atomic(args.vectorizer_file, lambda path: joblib.dump(vectorizer, path))
+    write_atomic(args.model_file, lambda path: joblib.dump(student, path))
+
+    def write_meta(path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2)
+    write_atomic(args.cascade_file, write_meta)
+
+    print(f"✅ Threshold {threshold:.4f}: {validation['escalation_rate']:.1%} of validation escalated, "
+          f"{validation['agreement']:.2%} agreement with {teacher.version} "
+          f"(student alone {validation['student_only_agreement']:.2%})")
+    print(f"✅ LIAR validation accuracy: {validation['full_model_accuracy']:.4f} (DistilBERT) → "
+          f"{validation['accuracy']:.4f} (cascade)")
+    print(f"⏱️ Per headline: {full_ms:.2f} ms (DistilBERT), {student_ms:.3f} ms (student), "
+          f"{cascade_ms:.2f} ms (cascade) → {latency['saved_fraction']:.1%} saved")
+    print(f"📦 Wrote {args.model_file}, {args.vectorizer_file} and {args.cascade_file}")
+    return meta
+
+
+if __name__ == '__main__':
+    main()
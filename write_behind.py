@@ -0,0 +1,305 @@
+import atexit
+import glob
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+import metrics
+import storage
+from config import (DATABASE, WRITE_BEHIND_MAX_BATCH, WRITE_BEHIND_FLUSH_INTERVAL_MS, WRITE_BEHIND_QUEUE_SIZE,
+                    WRITE_BEHIND_ID_BLOCK, WRITE_BEHIND_JOURNAL_DIR, WRITE_BEHIND_FSYNC)
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to checking whether the journal's owner is still running
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+# Write-behind persistence for predictions.
+#
+# /predict gets its prediction id straight away from a block of ids reserved in
+# sqlite_sequence, appends the row to a per-process journal and queues it. A
+# background thread drains the queue and inserts up to max_batch rows per
+# commit. Rows carry explicit ids, so replaying a journal after a crash is an
+# idempotent INSERT OR IGNORE.
+
+INSERT_SQL = '''INSERT OR IGNORE INTO predictions (id, user_id, headline, prediction, confidence, timestamp,
+                                                  model_version)
+                VALUES (?, ?, ?, ?, ?, ?, ?)'''
+ROW_LENGTH = 7
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+class PredictionWriter:
+    def __init__(self, db_path=DATABASE, max_batch=WRITE_BEHIND_MAX_BATCH,
+                 flush_interval_ms=WRITE_BEHIND_FLUSH_INTERVAL_MS, max_queue_size=WRITE_BEHIND_QUEUE_SIZE,
+                 id_block=WRITE_BEHIND_ID_BLOCK, journal_dir=WRITE_BEHIND_JOURNAL_DIR, fsync=WRITE_BEHIND_FSYNC):
+        self.db_path = db_path
+        self.max_batch = max(1, int(max_batch))
+        self.flush_interval = max(0.0, flush_interval_ms / 1000.0)
+        self.max_queue_size = max_queue_size
+        self.id_block = max(1, int(id_block))
+        self.journal_dir = journal_dir
+        self.fsync = fsync
+
+        self._lock = threading.Lock()
+        self._journal_lock = threading.Lock()
+        self._written = threading.Condition()
+        self._pid = None
+        self._queue = None
+        self._worker = None
+        self._journal = None
+        self._id_conn = None
+        self._next_id = 0
+        self._last_id = -1
+        self._pending = set()
+
+        # Metrics
+        self._submitted = 0
+        self._rejected = 0
+        self._rows_written = 0
+        self._commits = 0
+        self._errors = 0
+        self._replayed = 0
+        self._max_queue_depth = 0
+        self._commit_total = 0.0
+
+    def _ensure_started(self):
+        # Threads, connections and reserved ids must not be inherited by a forked
+        # gunicorn worker, so every process sets up its own on first use.
+        pid = os.getpid()
+        if self._pid == pid and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._pid == pid and self._worker.is_alive():
+                return
+            if self._pid != pid:
+                self._queue = queue.Queue(maxsize=self.max_queue_size)
+                self._pending = set()
+                self._id_conn = None
+                self._next_id, self._last_id = 0, -1
+                self._open_journal(pid)
+                atexit.register(self.close)
+            self._pid = pid
+            self._worker = threading.Thread(target=self._run, name='truthlens-db-writer', daemon=True)
+            self._worker.start()
+
+    def _open_journal(self, pid):
+        os.makedirs(self.journal_dir, exist_ok=True)
+        self._journal = open(os.path.join(self.journal_dir, f'predictions-{pid}.jsonl'), 'a', encoding='utf-8')
+        if fcntl:
+            # Held for the life of the process so replay_journals() can tell live journals from orphans
+            fcntl.flock(self._journal.fileno(), fcntl.LOCK_EX)
+
+    def _reserve_id(self):
+        with self._lock:
+            if self._next_id > self._last_id:
+                if self._id_conn is None:
+                    # Shared by every request thread, one at a time under self._lock
+                    self._id_conn = storage.connect(self.db_path, check_same_thread=False)
+                conn = self._id_conn
+                # Bumping sqlite_sequence keeps AUTOINCREMENT inserts (and other processes) clear of the block
+                waiting = time.perf_counter()
+                conn.execute('BEGIN IMMEDIATE')
+                metrics.DB_CONNECTION_WAIT.observe(time.perf_counter() - waiting, kind='write_lock')
+                try:
+                    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'predictions'").fetchone()
+                    max_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM predictions').fetchone()[0]
+                    start = max(row['seq'] if row else 0, max_id)
+                    if row:
+                        conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'predictions'",
+                                     (start + self.id_block,))
+                    else:
+                        conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('predictions', ?)",
+                                     (start + self.id_block,))
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                self._next_id, self._last_id = start + 1, start + self.id_block
+            prediction_id = self._next_id
+            self._next_id += 1
+            return prediction_id
+
+    def submit(self, user_id, headline, prediction, confidence, timestamp, model_version=None):
+        """Journal and queue a prediction row and return its id. Raises queue.Full when overloaded."""
+        self._ensure_started()
+        if self._queue.full():
+            self._rejected += 1
+            raise queue.Full
+        row = (self._reserve_id(), user_id, headline, prediction, confidence, timestamp, model_version)
+        with self._journal_lock:
+            # Pending before queued: the writer may commit the row (and discard its id) straight away. The
+            # journal line goes in while the lock keeps the writer from truncating past it.
+            self._pending.add(row[0])
+            try:
+                self._queue.put_nowait(row)
+            except queue.Full:
+                self._pending.discard(row[0])
+                self._rejected += 1
+                raise
+            self._journal.write(json.dumps(row) + '\n')
+            self._journal.flush()
+            if self.fsync:
+                os.fsync(self._journal.fileno())
+        self._submitted += 1
+        depth = self._queue.qsize()
+        if depth > self._max_queue_depth:
+            self._max_queue_depth = depth
+        return row[0]
+
+    def is_pending(self, prediction_id):
+        return self._pid == os.getpid() and prediction_id in self._pending
+
+    def wait_for(self, prediction_id, conn=None, timeout=5.0):
+        """Block until a just-issued prediction id has been committed. Returns False on timeout.
+
+        Rows queued by this process are waited on directly; with conn, ids issued
+        by another worker process are polled for until that worker's writer commits them.
+        """
+        deadline = time.monotonic() + timeout
+        with self._written:
+            while self.is_pending(prediction_id):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._written.wait(remaining)
+        if conn is None:
+            return True
+        while conn.execute('SELECT 1 FROM predictions WHERE id = ?', (prediction_id,)).fetchone() is None:
+            issued = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'predictions'").fetchone()
+            if issued is None or prediction_id > issued['seq'] or time.monotonic() >= deadline:
+                return False
+            time.sleep(max(self.flush_interval, 0.01))
+        return True
+
+    def flush(self, timeout=10.0):
+        """Wait until everything queued so far has been committed."""
+        deadline = time.monotonic() + timeout
+        with self._written:
+            while self._pid == os.getpid() and self._pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._written.wait(remaining)
+        return True
+
+    def close(self, timeout=10.0):
+        """Exit hook: drain the queue and drop this process's journal once it is fully committed."""
+        if self._pid != os.getpid():
+            return
+        if self.flush(timeout):
+            with self._journal_lock:
+                if not self._pending and not self._journal.closed:
+                    self._journal.close()
+                    os.remove(self._journal.name)
+
+    def _collect_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        conn = storage.connect(self.db_path)
+        while True:
+            batch = self._collect_batch()
+            while True:
+                started = time.perf_counter()
+                try:
+                    conn.execute('BEGIN IMMEDIATE')
+                    metrics.DB_CONNECTION_WAIT.observe(time.perf_counter() - started, kind='write_lock')
+                    conn.executemany(INSERT_SQL, batch)
+                    conn.commit()
+                    break
+                except Exception as e:
+                    # Keep the rows (they are still journaled) and retry once the database is writable again
+                    conn.rollback()
+                    self._errors += 1
+                    logger.error("Write-behind commit failed, retrying: %s", e)
+                    time.sleep(max(self.flush_interval, 0.5))
+
+            self._commits += 1
+            self._rows_written += len(batch)
+            self._commit_total += time.perf_counter() - started
+            with self._written:
+                self._pending.difference_update(row[0] for row in batch)
+                self._written.notify_all()
+            with self._journal_lock:
+                # Everything journaled so far is committed: start the journal over
+                if not self._pending:
+                    self._journal.truncate(0)
+
+    def replay_journals(self):
+        """Insert rows left in the journals of processes that exited before their queue drained."""
+        paths = glob.glob(os.path.join(self.journal_dir, 'predictions-*.jsonl'))
+        if not paths:
+            return 0
+        conn = storage.connect(self.db_path)
+        replayed = 0
+        try:
+            for path in paths:
+                pid = int(os.path.basename(path)[len('predictions-'):-len('.jsonl')])
+                if pid == os.getpid() and self._pid == pid:
+                    continue
+                with open(path, 'a+', encoding='utf-8') as journal:
+                    if fcntl:
+                        try:
+                            fcntl.flock(journal.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        except OSError:
+                            continue  # a running worker still owns this journal
+                    elif _pid_alive(pid):
+                        continue
+                    journal.seek(0)
+                    rows = []
+                    for line in journal:
+                        try:
+                            row = tuple(json.loads(line))
+                            # Journals written before model_version was recorded have shorter rows
+                            rows.append(row + (None,) * (ROW_LENGTH - len(row)))
+                        except ValueError:
+                            pass  # a torn final line from the crash
+                    replayed += conn.executemany(INSERT_SQL, rows).rowcount
+                    conn.commit()
+                os.remove(path)
+        finally:
+            conn.close()
+        self._replayed += replayed
+        return replayed
+
+    def stats(self):
+        return {
+            'queue_depth': self._queue.qsize() if self._queue else 0,
+            'max_queue_depth': self._max_queue_depth,
+            'pending': len(self._pending),
+            'submitted': self._submitted,
+            'rejected': self._rejected,
+            'rows_written': self._rows_written,
+            'commits': self._commits,
+            'errors': self._errors,
+            'replayed': self._replayed,
+            'avg_rows_per_commit': round(self._rows_written / self._commits, 2) if self._commits else 0.0,
+            'avg_commit_ms': round(self._commit_total / self._commits * 1000, 2) if self._commits else 0.0,
+            'max_batch': self.max_batch,
+            'flush_interval_ms': self.flush_interval * 1000,
+            'fsync': self.fsync,
+        }